@@ -0,0 +1,356 @@
+"""
+File: archives.py
+Desc: Streaming readers for crawl archives (WARC, tar, gzip/zstd files) as extraction input
+
+Pages are read out of the archives one record at a time and handed to the
+extractors as strings, so they never touch the disk one by one:
+
+    for record in extract_archives(["crawl-00.warc.gz", "crawl-01.tar.zst"], workers=8):
+        print(record.source, record.error or record.result.listing_price)
+
+    for page in iter_archive("crawl-00.warc.gz"):   # ArchivePage(source, url, html, encoding)
+        ...
+
+Supported inputs, told apart by their suffix:
+    - WARC files (.warc, .warc.gz, .warc.zst): `response` records of HTML
+      pages, and `resource` records;
+    - tar archives (.tar, .tar.gz, .tgz, .tar.bz2, .tar.xz, .tar.zst): every
+      .html/.htm member;
+    - single pages (.html, .html.gz, .html.zst).
+
+Uncompressed files are memory-mapped, compressed ones decompressed in 1 MiB
+chunks. The text encoding of a page comes from its byte order mark, its HTTP
+Content-Type header, its <meta> charset, in that order, then UTF-8 if the
+bytes are valid UTF-8 and windows-1258 (Vietnamese) otherwise.
+
+zstd needs the zstandard package (`pip install zstandard`).
+"""
+
+import codecs
+import gzip
+import io
+import mmap
+import os
+import pathlib
+import re
+import tarfile
+import unicodedata
+import zlib
+from contextlib import contextmanager
+from typing import BinaryIO, Dict, Iterable, Iterator, NamedTuple, Optional, Tuple, Union
+
+from lovesoup.batch import ExtractionRecord, HtmlString, extract_records
+
+try:
+    import zstandard
+except ImportError:  # only needed for .zst input
+    zstandard = None
+
+CHUNK_SIZE = 1 << 20
+
+# Fallback for pages that are not valid UTF-8 and don't say what they are:
+# windows-1258, the legacy Vietnamese code page
+LEGACY_ENCODING = "cp1258"
+
+# How far into a page <meta charset> is looked for
+META_SCAN_BYTES = 4096
+
+HTML_SUFFIXES = (".html", ".htm")
+
+_BOMS = (
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+)
+_META_CHARSET = re.compile(rb"""<meta[^>]+charset\s*=\s*["']?\s*([\w.:-]+)""", re.IGNORECASE)
+
+PathLike = Union[str, os.PathLike]
+
+
+class ArchivePage(NamedTuple):
+    """
+    One page read out of an archive
+    """
+
+    source: str
+    url: Optional[str]
+    html: str
+    encoding: str
+
+
+def _known_encoding(name: Optional[str]) -> Optional[str]:
+    if not name:
+        return None
+    try:
+        return codecs.lookup(name.strip("\"' ").lower()).name
+    except LookupError:
+        return None
+
+
+def charset_from_content_type(content_type: Optional[str]) -> Optional[str]:
+    """
+    ("text/html; charset=UTF-8") -> "utf-8"; None when missing or unknown
+    """
+    for param in (content_type or "").split(";")[1:]:
+        name, _, value = param.strip().partition("=")
+        if name.lower() == "charset":
+            return _known_encoding(value)
+    return None
+
+
+def detect_charset(body: bytes, content_type: Optional[str] = None) -> str:
+    """
+    Text encoding of an HTML page: byte order mark, then the Content-Type
+    header, then <meta charset> or <meta http-equiv>, then UTF-8 if the
+    bytes decode as UTF-8, then LEGACY_ENCODING
+    """
+    for bom, encoding in _BOMS:
+        if body.startswith(bom):
+            return encoding
+    encoding = charset_from_content_type(content_type)
+    if encoding is None:
+        match = _META_CHARSET.search(body, 0, META_SCAN_BYTES)
+        encoding = _known_encoding(match.group(1).decode("ascii")) if match else None
+    if encoding is not None:
+        return encoding
+    try:
+        body.decode("utf-8")
+    except UnicodeDecodeError:
+        return LEGACY_ENCODING
+    return "utf-8"
+
+
+def decode_html(body: bytes, content_type: Optional[str] = None) -> Tuple[str, str]:
+    """
+    Returns the page text and the encoding it was decoded with
+    """
+    encoding = detect_charset(body, content_type)
+    text = body.decode(encoding, errors="replace")
+    if encoding == "cp1258":
+        # Tone marks are separate combining characters in windows-1258
+        text = unicodedata.normalize("NFC", text)
+    return text, encoding
+
+
+def _compression(path: pathlib.Path) -> Optional[str]:
+    if path.suffix in (".gz", ".tgz"):
+        return "gzip"
+    if path.suffix in (".zst", ".zstd"):
+        return "zstd"
+    return None
+
+
+def _require_zstandard():
+    if zstandard is None:
+        raise ImportError("zstd input needs the zstandard package")
+
+
+@contextmanager
+def open_binary(path: PathLike) -> Iterator[BinaryIO]:
+    """
+    Readable binary stream over a file, decompressed on the fly for .gz and
+    .zst files, memory-mapped otherwise
+    """
+    path = pathlib.Path(path)
+    compression = _compression(path)
+    with open(path, "rb") as raw:
+        if compression == "gzip":
+            with gzip.GzipFile(fileobj=raw) as stream:
+                yield io.BufferedReader(stream, CHUNK_SIZE)
+        elif compression == "zstd":
+            _require_zstandard()
+            reader = zstandard.ZstdDecompressor().stream_reader(raw, read_size=CHUNK_SIZE)
+            with reader:
+                yield io.BufferedReader(reader, CHUNK_SIZE)
+        elif os.fstat(raw.fileno()).st_size == 0:
+            # Empty files can't be mapped
+            yield io.BytesIO()
+        else:
+            with mmap.mmap(raw.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                yield mapped
+
+
+def _read_headers(stream: BinaryIO) -> Dict[str, str]:
+    """
+    RFC 822 style headers up to the blank line, names lowercased
+    """
+    headers: Dict[str, str] = {}
+    while True:
+        line = stream.readline()
+        if line in (b"\r\n", b"\n", b""):
+            return headers
+        name, _, value = line.decode("utf-8", errors="replace").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+
+def _dechunk(body: bytes) -> bytes:
+    chunks = []
+    position = 0
+    while position < len(body):
+        end = body.find(b"\n", position)
+        if end < 0:
+            break
+        size = int(body[position:end].split(b";")[0].strip() or b"0", 16)
+        if size == 0:
+            break
+        chunks.append(body[end + 1 : end + 1 + size])
+        position = end + 1 + size + 2
+    return b"".join(chunks)
+
+
+def _decompress(body: bytes, encoding: str) -> bytes:
+    if encoding in ("gzip", "x-gzip"):
+        return zlib.decompress(body, 16 + zlib.MAX_WBITS)
+    if encoding == "deflate":
+        return zlib.decompress(body)
+    return body
+
+
+def _http_payload(block: bytes) -> Tuple[int, Dict[str, str], bytes]:
+    """
+    Status, headers and decoded body of an HTTP response as stored in a WARC record
+    """
+    stream = io.BytesIO(block)
+    status_line = stream.readline().split()
+    status = int(status_line[1]) if len(status_line) > 1 and status_line[1].isdigit() else 0
+    headers = _read_headers(stream)
+    body = stream.read()
+    if headers.get("transfer-encoding", "").lower() == "chunked":
+        body = _dechunk(body)
+    try:
+        body = _decompress(body, headers.get("content-encoding", "").lower())
+    except zlib.error:
+        # Some crawlers store the body decoded but keep the header
+        pass
+    return status, headers, body
+
+
+def _is_html_type(content_type: str) -> bool:
+    media_type = content_type.split(";")[0].strip().lower()
+    return media_type in ("", "text/html", "application/xhtml+xml")
+
+
+def iter_warc(path: PathLike, html_only: bool = True) -> Iterator[ArchivePage]:
+    """
+    Pages of a WARC file: successful `response` records and `resource` records
+    """
+    with open_binary(path) as stream:
+        while True:
+            line = stream.readline()
+            if not line:
+                return
+            if not line.startswith(b"WARC/"):
+                # Blank lines between records
+                continue
+            headers = _read_headers(stream)
+            block = stream.read(int(headers.get("content-length", 0)))
+            record_type = headers.get("warc-type")
+            url = headers.get("warc-target-uri", "").strip("<>") or None
+
+            if record_type == "response" and block.startswith(b"HTTP/"):
+                status, http_headers, body = _http_payload(block)
+                if not 200 <= status < 300:
+                    continue
+                content_type = http_headers.get("content-type", "")
+            elif record_type == "resource":
+                body = block
+                content_type = headers.get("content-type", "")
+            else:
+                continue
+            if html_only and not _is_html_type(content_type):
+                continue
+            html, encoding = decode_html(body, content_type)
+            source = url or f"{path}#{headers.get('warc-record-id', '')}"
+            yield ArchivePage(source, url, html, encoding)
+
+
+@contextmanager
+def _open_tar(path: pathlib.Path) -> Iterator[tarfile.TarFile]:
+    if path.suffix in (".bz2", ".xz"):
+        with tarfile.open(path, mode="r|*") as archive:
+            yield archive
+    else:
+        # gzip and zstd are dealt with by open_binary, the tar itself is read as a stream
+        with open_binary(path) as stream, tarfile.open(fileobj=stream, mode="r|") as archive:
+            yield archive
+
+
+def iter_tar(path: PathLike, suffixes: Tuple[str, ...] = HTML_SUFFIXES) -> Iterator[ArchivePage]:
+    """
+    Pages of a tar archive: the members whose name ends with one of `suffixes`,
+    read in archive order without extracting anything
+    """
+    path = pathlib.Path(path)
+    with _open_tar(path) as archive:
+        for member in archive:
+            if not member.isfile() or not member.name.lower().endswith(suffixes):
+                continue
+            html, encoding = decode_html(archive.extractfile(member).read())
+            yield ArchivePage(f"{path}:{member.name}", None, html, encoding)
+
+
+def read_page(path: PathLike) -> ArchivePage:
+    """
+    A single page file, possibly gzip or zstd compressed
+    """
+    with open_binary(path) as stream:
+        body = stream.read()
+    html, encoding = decode_html(bytes(body))
+    return ArchivePage(os.fspath(path), None, html, encoding)
+
+
+def archive_kind(path: PathLike) -> str:
+    """
+    "warc", "tar" or "page", from the file suffixes
+    """
+    suffixes = [s.lower() for s in pathlib.Path(path).suffixes]
+    if suffixes[-1:] == [".tgz"]:
+        return "tar"
+    if suffixes[-1:] in ([".gz"], [".zst"], [".zstd"], [".bz2"], [".xz"]):
+        suffixes = suffixes[:-1]
+    if suffixes[-1:] == [".warc"]:
+        return "warc"
+    if suffixes[-1:] == [".tar"]:
+        return "tar"
+    return "page"
+
+
+def iter_archive(path: PathLike) -> Iterator[ArchivePage]:
+    """
+    Pages of any supported input, see the module docstring
+    """
+    kind = archive_kind(path)
+    if kind == "warc":
+        yield from iter_warc(path)
+    elif kind == "tar":
+        yield from iter_tar(path)
+    else:
+        yield read_page(path)
+
+
+def archive_items(paths: Iterable[PathLike], site=None) -> Iterator[Tuple]:
+    """
+    (site, html, source) items for `extract_records` out of archives. Pages
+    are sent to the cook of `site` when given, otherwise to the site of
+    their URL or the one detected from the page.
+    """
+    for path in paths:
+        for page in iter_archive(path):
+            # As it is, even with text before its first tag (a stray BOM, a
+            # comment line) that would get it taken for a file path
+            html = HtmlString(page.html)
+            yield (site if site is not None else page.url), html, page.source
+
+
+def extract_archives(
+    paths: Iterable[PathLike],
+    site=None,
+    workers: Optional[int] = None,
+    chunksize: int = 8,
+    ordered: bool = True,
+) -> Iterator[ExtractionRecord]:
+    """
+    Extract every page of the given archives, see `extract_records`. Records
+    are labelled with the page URL (WARC) or archive:member (tar).
+    """
+    return extract_records(archive_items(paths, site), workers, chunksize, ordered)
@@ -0,0 +1,391 @@
+"""
+File: batch.py
+Desc: Batch extraction over many pages, fanned out to a process pool
+"""
+
+import codecs
+import os
+import weakref
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from functools import lru_cache
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from lovesoup import cooks
+from lovesoup.cooks import get_cook
+from lovesoup.dispatch import UnknownSiteError, detect_site
+from lovesoup.general_extractor import DataExtractor, Page, page_text
+from lovesoup.instrumentation import Instrumentation
+from lovesoup.property_models import PropertyNormalized
+
+# Cooks living in the current process (a pool worker or the caller for inline
+# runs), by class, template name and constructor options
+_WORKER_COOKS: Dict[Tuple[type, str, Tuple], DataExtractor] = {}
+
+
+class _MetricsToken(NamedTuple):
+    """
+    Stands for the Instrumentation of a cook in tasks: a worker process
+    counts into its own, which is sent back and merged into the original
+    """
+
+    pid: int
+    id: int
+
+
+# The caller's Instrumentation objects, and the ones standing in for them in a worker
+_SENT_METRICS: "weakref.WeakValueDictionary[_MetricsToken, Instrumentation]" = (
+    weakref.WeakValueDictionary()
+)
+_WORKER_METRICS: Dict[_MetricsToken, Instrumentation] = {}
+
+
+class Counters(NamedTuple):
+    """
+    What a worker counted for one of the caller's Instrumentation objects
+    """
+
+    token: _MetricsToken
+    metrics: Instrumentation
+
+
+class ExtractionError(Exception):
+    """
+    A page that failed inside a batch run. The original exception is reduced
+    to its type and message so it always survives the trip back from a worker.
+    """
+
+    def __init__(self, site: str, source: str, error_type: str, message: str):
+        super().__init__(f"{site}: {source}: {error_type}: {message}")
+        self.site = site
+        self.source = source
+        self.error_type = error_type
+        self.message = message
+
+    def __reduce__(self):
+        return (
+            self.__class__,
+            (self.site, self.source, self.error_type, self.message),
+        )
+
+
+class HtmlString(str):
+    """
+    A page given as a string, whatever it starts with: plain strings are only
+    taken for HTML when they start with a tag
+    """
+
+    __slots__ = ()
+
+
+def is_html(source) -> bool:
+    """
+    Tell HTML strings apart from file paths
+    """
+    return isinstance(source, HtmlString) or (
+        isinstance(source, str) and source.lstrip()[:1] == "<"
+    )
+
+
+def describe_source(source) -> str:
+    if is_html(source):
+        return f"<html string, {len(source)} chars>"
+    return os.fspath(source)
+
+
+@lru_cache(maxsize=None)
+def _default_options(cook_cls: type) -> Dict:
+    return cook_cls().options()
+
+
+def cook_options(cook: DataExtractor) -> Tuple:
+    """
+    The constructor options of a cook that differ from its class defaults,
+    as a hashable and picklable tuple to send along with its tasks
+    """
+    defaults = _default_options(type(cook))
+    options = []
+    for name, value in sorted(cook.options().items()):
+        if value is defaults.get(name) or value == defaults.get(name):
+            continue
+        if name == "instrumentation":
+            token = _MetricsToken(os.getpid(), id(value))
+            _SENT_METRICS[token] = value
+            value = token
+        options.append((name, value))
+    return tuple(options)
+
+
+def _metrics_for(token: _MetricsToken) -> Instrumentation:
+    if token.pid == os.getpid():
+        # Inline run: the caller's own
+        return _SENT_METRICS[token]
+    return _WORKER_METRICS.setdefault(token, Instrumentation())
+
+
+def cook_for(cook_cls: type, template_name: str, options: Tuple = ()) -> DataExtractor:
+    """
+    The cook of this process for a task, built on first use
+    """
+    key = (cook_cls, template_name, options)
+    cook = _WORKER_COOKS.get(key)
+    if cook is None:
+        kwargs = dict(options)
+        if "instrumentation" in kwargs:
+            kwargs["instrumentation"] = _metrics_for(kwargs["instrumentation"])
+        cook = cook_cls(template_name, **kwargs)
+        _WORKER_COOKS[key] = cook
+    return cook
+
+
+def drain_metrics() -> List[Counters]:
+    """
+    What the worker's Instrumentation objects counted since the last call
+    """
+    drained = []
+    for token, metrics in _WORKER_METRICS.items():
+        if metrics.pages or metrics.stage_calls:
+            drained.append(Counters(token, Instrumentation().merge(metrics)))
+            metrics.clear()
+    return drained
+
+
+def merge_metrics(counters: Counters) -> None:
+    """
+    Add counters sent back by a worker to the caller's Instrumentation
+    """
+    metrics = _SENT_METRICS.get(counters.token)
+    if metrics is not None:
+        metrics.merge(counters.metrics)
+
+
+def init_worker() -> None:
+    """
+    Pool initializer: build every site's cook once per worker process
+    """
+    for cook_cls in cooks.ALL_COOKS:
+        cook = cook_cls()
+        _WORKER_COOKS[(cook_cls, cook.template, ())] = cook
+
+
+class ExtractionRecord(NamedTuple):
+    """
+    Outcome of one page: either `result` or `error` is set
+    """
+
+    source: str
+    site: Optional[str]
+    result: Optional[PropertyNormalized]
+    error: Optional[ExtractionError]
+
+
+def read_page(source) -> Page:
+    """
+    The page of a task: an HTML string as it is, a file as UTF-8 bytes
+    """
+    if is_html(source):
+        return source
+    with open(source, "rb") as file:
+        page = file.read()
+    if page.startswith(codecs.BOM_UTF8):
+        page = page[len(codecs.BOM_UTF8) :]
+    return page
+
+
+def resolve_cook(
+    cook_cls: Optional[type], template_name: Optional[str], options: Tuple, page: Optional[Page]
+) -> Tuple[str, DataExtractor]:
+    """
+    Template name and cook of a task, the site told from the page when the
+    task doesn't give it (the page is only needed then)
+    """
+    if cook_cls is None:
+        template_name = detect_site(page_text(page))
+        if template_name is None:
+            raise UnknownSiteError("Can't tell which site this page comes from")
+        cook_cls = get_cook(template_name)
+    return template_name, cook_for(cook_cls, template_name, options)
+
+
+def extract_html(
+    cook_cls: Optional[type], template_name: Optional[str], options: Tuple, html: Page
+):
+    """
+    Returns the template name actually used and the result
+    """
+    template_name, cook = resolve_cook(cook_cls, template_name, options, html)
+    return template_name, cook.run_html(html)
+
+
+def extract_one(cook_cls: Optional[type], template_name: Optional[str], options: Tuple, source):
+    """
+    Returns the template name actually used and the result
+    """
+    if is_html(source):
+        return extract_html(cook_cls, template_name, options, source)
+    if cook_cls is not None:
+        cook = cook_for(cook_cls, template_name, options)
+        return template_name, cook.run(os.fspath(source))
+    return extract_html(None, None, (), read_page(source))
+
+
+def extract_chunk(chunk: List[Tuple], extract=extract_one) -> List[ExtractionRecord]:
+    """
+    Worker entry point. Returns one record per task, in order.
+    """
+    records = []
+    for cook_cls, template_name, options, source, label in chunk:
+        label = label or describe_source(source)
+        try:
+            site, result = extract(cook_cls, template_name, options, source)
+            records.append(ExtractionRecord(label, site, result, None))
+        except Exception as e:
+            site = template_name or "auto"
+            error = ExtractionError(site, label, type(e).__name__, str(e))
+            records.append(ExtractionRecord(label, template_name, None, error))
+    return records
+
+
+def _extract_counted_chunk(chunk: List[Tuple]) -> List:
+    """
+    Same as `extract_chunk`, followed by what the worker's Instrumentation
+    objects counted, see `merge_metrics`
+    """
+    return [*extract_chunk(chunk), *drain_metrics()]
+
+
+def resolve_tasks(items: Iterable[Tuple]) -> Iterator[Tuple]:
+    """
+    Turn (site, source) pairs into (cook class, template name, options,
+    source, label) tasks. The options are those of a cook given as the site,
+    see `cook_options`. The label names the page in records: its URL when
+    the site was given as one, its path otherwise (filled in by the worker).
+    """
+    resolved = {None: (None, None, ())}
+    for site, source, *given_label in items:
+        label = None if is_html(source) else os.fspath(source)
+        if isinstance(site, DataExtractor):
+            if site not in resolved:
+                resolved[site] = (type(site), site.template, cook_options(site))
+            yield (*resolved[site], source, label)
+            continue
+        if site not in resolved:
+            if "://" in str(site):
+                # A page URL: its domain tells the site, or the page will
+                detected = detect_site(url=site)
+                cook_cls = get_cook(detected) if detected else None
+            else:
+                cook_cls = get_cook(site)
+            resolved[site] = (cook_cls, cook_cls().template, ()) if cook_cls else (None, None, ())
+        if site is not None and "://" in str(site):
+            label = site
+        if given_label:
+            label = given_label[0]
+        yield (*resolved[site], source, label)
+
+
+def chunked(iterable: Iterable, size: int) -> Iterator[List]:
+    """
+    Lists of `size` items, the last one shorter
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def iter_records(
+    tasks: Iterable[Tuple],
+    workers: int,
+    chunksize: int,
+    ordered: bool,
+    extract_chunk=extract_chunk,
+) -> Iterator:
+    """
+    Run `extract_chunk` (a module-level function, for the pool) over chunks of tasks
+    """
+    chunks = chunked(tasks, chunksize)
+
+    if workers <= 1:
+        for chunk in chunks:
+            yield from extract_chunk(chunk)
+        return
+
+    # Never keep more than a couple of chunks per worker in flight, so that
+    # arbitrarily long inputs stream through with constant memory
+    max_pending = workers * 2
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as pool:
+        pending = deque(
+            pool.submit(extract_chunk, c) for c in islice(chunks, max_pending)
+        )
+        while pending:
+            if ordered:
+                done = [pending.popleft()]
+            else:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                done = [f for f in pending if f in finished]
+                for future in done:
+                    pending.remove(future)
+            for future in done:
+                for chunk in islice(chunks, 1):
+                    pending.append(pool.submit(extract_chunk, chunk))
+                yield from future.result()
+
+
+def extract_records(
+    items: Iterable[Tuple],
+    workers: Optional[int] = None,
+    chunksize: int = 8,
+    ordered: bool = True,
+) -> Iterator[ExtractionRecord]:
+    """
+    Like `extract_many`, but yields an ExtractionRecord per page, carrying
+    its source and site next to the result or the error. Never raises for
+    a failed page.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    for record in iter_records(
+        resolve_tasks(items), workers, chunksize, ordered, _extract_counted_chunk
+    ):
+        if isinstance(record, Counters):
+            merge_metrics(record)
+        else:
+            yield record
+
+
+def extract_many(
+    items: Iterable[Tuple],
+    workers: Optional[int] = None,
+    chunksize: int = 8,
+    ordered: bool = True,
+    return_exceptions: bool = False,
+) -> Iterator:
+    """
+    Extract many pages from possibly different sites.
+
+    Args:
+        items: (site, source) pairs. `site` is anything `get_cook` accepts, a
+            DataExtractor instance, the page URL, or None to detect the site
+            from the page. `source` is a file path or an HTML string. A third
+            item, when given, is the label of the page in records.
+        workers: number of worker processes, defaults to the CPU count.
+            With 1 worker everything runs in the calling process.
+        chunksize: number of pages sent to a worker at once.
+        ordered: yield results in input order, otherwise as soon as they are ready.
+        return_exceptions: yield an ExtractionError in place of a failed page
+            instead of raising it.
+
+    Returns:
+        An iterator of PropertyNormalized objects.
+    """
+    for record in extract_records(items, workers, chunksize, ordered):
+        if record.error is not None:
+            if not return_exceptions:
+                raise record.error
+            yield record.error
+        else:
+            yield record.result
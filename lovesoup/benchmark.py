@@ -0,0 +1,424 @@
+"""
+File: benchmark.py
+Desc: Throughput and latency benchmark of every cook over the test_data fixtures
+
+Usage:
+    python -m lovesoup.benchmark --scale 50 --output bench.json
+    python -m lovesoup.benchmark --scale 50 --compare bench.json
+    python -m lovesoup.benchmark --scale 1000 --write-corpus /tmp/corpus
+    python -m lovesoup.benchmark --scale 200 --post-process
+    python -m lovesoup.benchmark --scale 20 --handoff --sites batdongsan nhatot
+"""
+
+import argparse
+import json
+import multiprocessing
+import pathlib
+import pickle
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from lovesoup.cooks import get_cook
+
+DEFAULT_DATA_DIR = pathlib.Path(__file__).resolve().parent.parent / "tests" / "test_data"
+
+# Metrics where a bigger number is a regression
+LOWER_IS_BETTER = ("p50_ms", "p99_ms", "alloc_peak_kb_per_page")
+
+
+def iter_fixtures(
+    data_dir: pathlib.Path = DEFAULT_DATA_DIR, sites: Optional[Iterable[str]] = None
+) -> Dict[str, List[pathlib.Path]]:
+    """
+    HTML fixtures grouped by site folder: test_data/{site identifier}/*.html
+    """
+    fixtures = {}
+    for site_dir in sorted(pathlib.Path(data_dir).iterdir()):
+        if not site_dir.is_dir() or (sites and site_dir.name not in sites):
+            continue
+        pages = sorted(site_dir.glob("*.html"))
+        if pages:
+            fixtures[site_dir.name] = pages
+    return fixtures
+
+
+def synthetic_pages(pages: List[pathlib.Path], scale: int) -> Iterator[Tuple[str, str]]:
+    """
+    Yield (name, html) for `scale` copies of every fixture. Each copy gets a
+    distinct trailing comment so that no two pages have the same content.
+    Pages are produced lazily, so the corpus can be much larger than memory.
+    """
+    contents = [(p.stem, p.read_text(encoding="utf-8")) for p in pages]
+    for i in range(scale):
+        for stem, html in contents:
+            yield f"{stem}-{i}", f"{html}\n<!-- lovesoup synthetic copy {i} -->"
+
+
+def write_corpus(
+    out_dir: pathlib.Path, scale: int, data_dir: pathlib.Path = DEFAULT_DATA_DIR
+) -> int:
+    """
+    Write a synthetic corpus to out_dir/{site}/*.html, returns the number of pages
+    """
+    count = 0
+    for site, pages in iter_fixtures(data_dir).items():
+        site_dir = pathlib.Path(out_dir) / site
+        site_dir.mkdir(parents=True, exist_ok=True)
+        for name, html in synthetic_pages(pages, scale):
+            (site_dir / f"{name}.html").write_text(html, encoding="utf-8")
+            count += 1
+    return count
+
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, round(q * (len(sorted_values) - 1)))
+    return sorted_values[index]
+
+
+def peak_rss_mb() -> float:
+    """
+    Peak resident memory of the process so far. On Linux this is the peak
+    since the process started its program: ru_maxrss carries over the peak
+    of the parent a spawned process was forked from.
+    """
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def bench_site(
+    site: str,
+    pages: List[pathlib.Path],
+    scale: int,
+    alloc_samples: int = 5,
+    **extractor_kwargs,
+) -> Dict:
+    """
+    Time `run_html` over the synthetic corpus of one site
+    """
+    extractor = get_cook(site)(**extractor_kwargs)
+    latencies = []
+    bytes_in = 0
+
+    # Warm up once so template compilation is not part of the numbers
+    extractor.run_html(pages[0].read_text(encoding="utf-8"))
+
+    started = time.perf_counter()
+    for _, html in synthetic_pages(pages, scale):
+        t0 = time.perf_counter()
+        extractor.run_html(html)
+        latencies.append(time.perf_counter() - t0)
+        bytes_in += len(html)
+    elapsed = time.perf_counter() - started
+
+    # Allocations are measured on a few pages only, tracemalloc slows everything down
+    alloc_peaks = []
+    for _, html in synthetic_pages(pages[:alloc_samples], 1):
+        tracemalloc.start()
+        extractor.run_html(html)
+        alloc_peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+    latencies.sort()
+    return {
+        "cook": type(extractor).__name__,
+        "pages": len(latencies),
+        "bytes_in": bytes_in,
+        "seconds": round(elapsed, 4),
+        "pages_per_sec": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(_percentile(latencies, 0.50) * 1000, 3),
+        "p99_ms": round(_percentile(latencies, 0.99) * 1000, 3),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 3),
+        "alloc_peak_kb_per_page": round(statistics.fmean(alloc_peaks) / 1024, 1),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+def bench_post_process(
+    site: str, pages: List[pathlib.Path], repeat: int, rounds: int = 5
+) -> Dict:
+    """
+    Per-page time of `post_process` alone, default vs trusted mode, best of
+    `rounds`. The template output of every fixture is computed once up front.
+    """
+    default, trusted = get_cook(site)(), get_cook(site)(trusted=True)
+    primary_results = [default.extract(page.read_text(encoding="utf-8")) for page in pages]
+    best = {default: float("inf"), trusted: float("inf")}
+
+    for _ in range(rounds):
+        # Alternate the modes so that noise hits both alike
+        for extractor in best:
+            # post_process may consume its input (Nhatot), give it a fresh copy every time
+            inputs = [dict(r) for r in primary_results for _ in range(repeat)]
+            started = time.perf_counter()
+            for primary_result in inputs:
+                extractor.post_process(primary_result)
+            per_page = (time.perf_counter() - started) / len(inputs)
+            best[extractor] = min(best[extractor], per_page)
+
+    default_us, trusted_us = best[default] * 1e6, best[trusted] * 1e6
+    return {
+        "default_us": round(default_us, 2),
+        "trusted_us": round(trusted_us, 2),
+        "saved_us": round(default_us - trusted_us, 2),
+        "saved_pct": round((1 - trusted_us / default_us) * 100, 1),
+    }
+
+
+def bench_handoff(site: str, pages: List[pathlib.Path], repeat: int, rounds: int = 5) -> Dict:
+    """
+    Per-page cost of getting a page from its file to a worker and its result
+    back, next to the cost of extracting it from text and from UTF-8 bytes,
+    best of `rounds`. Measured in
+    one process, leaving out the pipe writes themselves:
+        - pickle: the file read as text, the page str and the PropertyNormalized
+          result pickled both ways, as `extract_records` does for HTML strings;
+        - shared: the file read into an arena slot and copied out as bytes, the
+          task and the JSON result pickled, the result decoded, as
+          `extract_shared` does;
+        - copy: only the copy of the page out of its arena slot.
+    """
+    from lovesoup.batch import ExtractionRecord
+    from lovesoup.property_models import PropertyNormalized
+    from lovesoup.shm import PageArena, to_json
+
+    cook = get_cook(site)()
+    cook_cls = type(cook)
+    texts = [page.read_text(encoding="utf-8") for page in pages]
+    raw = [text.encode("utf-8") for text in texts]
+    results = [cook.run_html(text) for text in texts]
+    best = dict.fromkeys(("parse", "parse_bytes", "pickle", "shared", "copy"), float("inf"))
+
+    def parse():
+        for text in texts:
+            cook.run_html(text)
+
+    def parse_bytes():
+        # What the workers of extract_shared run
+        for data in raw:
+            cook.run_html(data)
+
+    def pickled():
+        for page, text, result in zip(pages, texts, results):
+            with open(page, "r", encoding="utf-8") as file:
+                text = file.read()
+            pickle.loads(pickle.dumps((cook_cls, site, text, str(page))))
+            pickle.loads(pickle.dumps([ExtractionRecord(str(page), site, result, None)]))
+
+    arena = PageArena(1, max(page.stat().st_size for page in pages))
+
+    def shared():
+        for page, result in zip(pages, results):
+            length = arena.read_file(0, page)
+            pickle.loads(pickle.dumps((cook_cls, site, (0, length), str(page))))
+            bytes(arena.view[:length])
+            sent = pickle.loads(pickle.dumps([(str(page), site, to_json(result), None)]))
+            PropertyNormalized.model_validate_json(sent[0][2])
+
+    def copied():
+        for data in raw:
+            bytes(arena.view[: len(data)])
+
+    with arena:
+        for _ in range(rounds):
+            for name, run in (
+                ("parse", parse),
+                ("parse_bytes", parse_bytes),
+                ("pickle", pickled),
+                ("shared", shared),
+                ("copy", copied),
+            ):
+                started = time.perf_counter()
+                for _ in range(repeat):
+                    run()
+                per_page = (time.perf_counter() - started) / (repeat * len(pages))
+                best[name] = min(best[name], per_page)
+
+    parse_us, pickle_us, shared_us = (best[name] * 1e6 for name in ("parse", "pickle", "shared"))
+    return {
+        "parse_us": round(parse_us, 1),
+        "parse_bytes_us": round(best["parse_bytes"] * 1e6, 1),
+        "pickle_us": round(pickle_us, 1),
+        "shared_us": round(shared_us, 1),
+        "copy_us": round(best["copy"] * 1e6, 1),
+        "pickle_pct_of_parse": round(pickle_us / parse_us * 100, 2),
+        "shared_pct_of_parse": round(shared_us / parse_us * 100, 2),
+        "copy_pct_of_parse": round(best["copy"] / best["parse"] * 100, 2),
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=pathlib.Path(__file__).parent,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _bench_site_alone(site: str, pages: List[pathlib.Path], scale: int, **extractor_kwargs) -> Dict:
+    """
+    `bench_site` in a fresh interpreter, so that its peak_rss_mb is that cook's
+    own and not the peak of every site run before it
+    """
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+        return pool.submit(bench_site, site, pages, scale, **extractor_kwargs).result()
+
+
+def run_benchmark(
+    scale: int = 10,
+    data_dir: pathlib.Path = DEFAULT_DATA_DIR,
+    sites: Optional[Iterable[str]] = None,
+    **extractor_kwargs,
+) -> Dict:
+    results = {
+        site: _bench_site_alone(site, pages, scale, **extractor_kwargs)
+        for site, pages in iter_fixtures(data_dir, sites).items()
+    }
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "scale": scale,
+            "extractor": {k: repr(v) for k, v in extractor_kwargs.items()},
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        },
+        "sites": results,
+    }
+
+
+def compare(baseline: Dict, current: Dict, tolerance: float = 0.10) -> List[str]:
+    """
+    Regressions of `current` against `baseline` beyond `tolerance` (a ratio)
+    """
+    regressions = []
+    for site, new in current["sites"].items():
+        old = baseline["sites"].get(site)
+        if not old:
+            continue
+        if new["pages_per_sec"] < old["pages_per_sec"] * (1 - tolerance):
+            regressions.append(
+                f"{site}: pages_per_sec {old['pages_per_sec']} -> {new['pages_per_sec']}"
+            )
+        for metric in LOWER_IS_BETTER:
+            if new[metric] > old[metric] * (1 + tolerance):
+                regressions.append(f"{site}: {metric} {old[metric]} -> {new[metric]}")
+    return regressions
+
+
+def format_table(report: Dict, columns: Optional[Tuple[str, ...]] = None) -> str:
+    if columns is None:
+        columns = ("pages", "pages_per_sec", "p50_ms", "p99_ms", "alloc_peak_kb_per_page", "peak_rss_mb")
+    lines = ["site".ljust(12) + "".join(c.rjust(24) for c in columns)]
+    for site, result in report["sites"].items():
+        lines.append(site.ljust(12) + "".join(str(result[c]).rjust(24) for c in columns))
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[2])
+    parser.add_argument("--data-dir", type=pathlib.Path, default=DEFAULT_DATA_DIR)
+    parser.add_argument("--scale", type=int, default=10, help="copies of every fixture")
+    parser.add_argument("--sites", nargs="*", help="site folders to run, default all")
+    parser.add_argument("--output", type=pathlib.Path, help="write results as JSON")
+    parser.add_argument("--compare", type=pathlib.Path, help="baseline JSON to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.10)
+    parser.add_argument("--write-corpus", type=pathlib.Path, help="only write a synthetic corpus")
+    parser.add_argument("--trusted", action="store_true", help="run the cooks in trusted mode")
+    parser.add_argument(
+        "--region-hints", action="store_true", help="parse only the region hint of the pages"
+    )
+    parser.add_argument(
+        "--post-process",
+        action="store_true",
+        help="only compare post_process in default and trusted mode",
+    )
+    parser.add_argument(
+        "--handoff",
+        action="store_true",
+        help="only compare the cost of passing pages to workers, pickled or through shared memory",
+    )
+    args = parser.parse_args(argv)
+
+    if args.write_corpus:
+        count = write_corpus(args.write_corpus, args.scale, args.data_dir)
+        print(f"Wrote {count} pages to {args.write_corpus}")
+        return 0
+
+    if args.post_process:
+        fixtures = iter_fixtures(args.data_dir, args.sites)
+        report = {
+            "sites": {
+                site: bench_post_process(site, pages, args.scale)
+                for site, pages in fixtures.items()
+            }
+        }
+        print(format_table(report, ("default_us", "trusted_us", "saved_us", "saved_pct")))
+        if args.output:
+            args.output.write_text(json.dumps(report, indent=2))
+        return 0
+
+    if args.handoff:
+        fixtures = iter_fixtures(args.data_dir, args.sites)
+        report = {
+            "sites": {
+                site: bench_handoff(site, pages, args.scale) for site, pages in fixtures.items()
+            }
+        }
+        columns = (
+            "parse_us",
+            "parse_bytes_us",
+            "pickle_us",
+            "shared_us",
+            "copy_us",
+            "pickle_pct_of_parse",
+            "shared_pct_of_parse",
+            "copy_pct_of_parse",
+        )
+        print(format_table(report, columns))
+        if args.output:
+            args.output.write_text(json.dumps(report, indent=2))
+        return 0
+
+    extractor_kwargs = {}
+    if args.trusted:
+        extractor_kwargs["trusted"] = True
+    if args.region_hints:
+        extractor_kwargs["region_hints"] = True
+    report = run_benchmark(args.scale, args.data_dir, args.sites, **extractor_kwargs)
+    print(format_table(report))
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2))
+
+    if args.compare:
+        regressions = compare(json.loads(args.compare.read_text()), report, args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
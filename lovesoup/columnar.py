@@ -0,0 +1,258 @@
+"""
+File: columnar.py
+Desc: Columnar export of normalized listings, with numeric price and area columns
+
+Prices and areas stay raw strings in PropertyNormalized ("3,5 tỷ",
+"45 triệu/m²", "15.000.000 đ/tháng", "80 m²"). This module turns batches of
+results into columns: the raw strings are kept, and parsed next to them into
+VND (`*_vnd`), the unit the price is given per (`*_per`: "m2", "month",
+"year" or "") and m² (`area_m2`). Strings repeat a lot across listings, so
+each distinct string is parsed once and the values are spread back with
+NumPy indexing.
+
+    columns = to_columns(results)          # dict of NumPy arrays
+    table = to_arrow(results)              # pyarrow.Table
+    write_parquet(results, "listings.parquet")
+
+NumPy is needed for all of it, pyarrow for the Arrow/Parquet output
+(`pip install numpy pyarrow`).
+"""
+
+import re
+import unicodedata
+from itertools import islice
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+
+from lovesoup.property_models import PropertyNormalized
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # only needed for Arrow/Parquet output
+    pyarrow = None
+
+# Unit words -> multiplier to VND
+PRICE_UNITS = {
+    "tỷ": 1e9,
+    "ty": 1e9,
+    "triệu": 1e6,
+    "trieu": 1e6,
+    "tr": 1e6,
+    "nghìn": 1e3,
+    "nghin": 1e3,
+    "ngàn": 1e3,
+    "ngan": 1e3,
+    "k": 1e3,
+    "đồng": 1.0,
+    "dong": 1.0,
+    "vnđ": 1.0,
+    "vnd": 1.0,
+    "đ": 1.0,
+}
+
+# A bare "m" is a length ("mặt tiền 5m"), not an area
+AREA_UNITS = {"m²": 1.0, "m2": 1.0, "m 2": 1.0, "ha": 1e4, "km²": 1e6, "km2": 1e6}
+
+_UNIT_PATTERN = "|".join(sorted(map(re.escape, PRICE_UNITS), key=len, reverse=True))
+_AMOUNT = re.compile(rf"(\d[\d.,]*)\s*({_UNIT_PATTERN})?(?![a-zà-ỹ])")
+_PER = (
+    ("m2", re.compile(r"/\s*(?:m²|m2|m 2)")),
+    ("month", re.compile(r"/\s*(?:tháng|thang)")),
+    ("year", re.compile(r"/\s*(?:năm|nam)")),
+)
+_AREA_PATTERN = "|".join(sorted(map(re.escape, AREA_UNITS), key=len, reverse=True))
+_AREA = re.compile(rf"(\d[\d.,]*)\s*({_AREA_PATTERN})(?![a-zà-ỹ])")
+
+
+def parse_number(text: str, thousands_hint: bool = False) -> float:
+    """
+    Parse numbers written the Vietnamese way ("6,3", "15.000.000") or the
+    English way ("2.33", "1,200,000").
+
+    thousands_hint: a single separator followed by exactly 3 digits is read
+        as a thousands separator ("15.000 đ"), otherwise as a decimal point.
+    """
+    dots, commas = text.count("."), text.count(",")
+    if dots and commas:
+        # The last separator is the decimal point
+        decimal = "." if text.rfind(".") > text.rfind(",") else ","
+        thousands = "," if decimal == "." else "."
+        return float(text.replace(thousands, "").replace(decimal, "."))
+    separator = "." if dots else "," if commas else None
+    if separator is None:
+        return float(text)
+    if text.count(separator) > 1:
+        return float(text.replace(separator, ""))
+    integer, fraction = text.split(separator)
+    if not fraction:
+        return float(integer)
+    if thousands_hint and len(fraction) == 3:
+        return float(integer + fraction)
+    return float(f"{integer}.{fraction}")
+
+
+def _normalize(text: str) -> str:
+    return unicodedata.normalize("NFC", text).replace("\xa0", " ").lower()
+
+
+def parse_price(text: Optional[str]) -> Tuple[float, str]:
+    """
+    ("1 tỷ 90 triệu") -> (1.09e9, ""), ("~74,12 triệu/m²") -> (7.412e7, "m2").
+    A single separator followed by 3 digits groups thousands in amounts in
+    đồng only ("15.000 đ"): with tỷ or triệu it is a decimal mark
+    ("3,125 tỷ" -> 3.125e9). Unparseable prices ("Thỏa thuận") give NaN.
+    """
+    if not text:
+        return float("nan"), ""
+    text = _normalize(text)
+    per = next((name for name, pattern in _PER if pattern.search(text)), "")
+    amount = text.split("/", 1)[0]
+
+    total = 0.0
+    found = False
+    for number, unit in _AMOUNT.findall(amount):
+        multiplier = PRICE_UNITS.get(unit, 1.0)
+        if found and not unit:
+            # "1 tỷ 2": a trailing bare number is not another amount
+            break
+        try:
+            total += parse_number(number, thousands_hint=multiplier == 1.0) * multiplier
+        except ValueError:
+            continue
+        found = True
+    return (total if found else float("nan")), per
+
+
+def parse_area(text: Optional[str]) -> float:
+    """
+    ("85 m²") -> 85.0, ("18 m 2 (3,6x5)") -> 18.0, ("1,5 ha") -> 15000.0
+    """
+    if not text:
+        return float("nan")
+    match = _AREA.search(_normalize(text))
+    if match is None:
+        return float("nan")
+    number, unit = match.groups()
+    try:
+        return parse_number(number, thousands_hint=True) * AREA_UNITS[unit]
+    except ValueError:
+        return float("nan")
+
+
+def _map_unique(values: np.ndarray, parse: Callable, dtypes: Tuple) -> Tuple[np.ndarray, ...]:
+    """
+    Apply `parse` once per distinct value and spread the results back
+    """
+    uniques, inverse = np.unique(values, return_inverse=True)
+    parsed = [parse(value) for value in uniques]
+    if len(dtypes) == 1:
+        return (np.array(parsed, dtype=dtypes[0])[inverse],)
+    return tuple(
+        np.array([p[i] for p in parsed], dtype=dtype)[inverse]
+        for i, dtype in enumerate(dtypes)
+    )
+
+
+Listing = Union[PropertyNormalized, Dict]
+
+
+def _as_dict(listing: Listing) -> Dict:
+    if isinstance(listing, PropertyNormalized):
+        return listing.model_dump()
+    # JSONL records from lovesoup.sinks wrap the result
+    if "result" in listing and "source" in listing:
+        return listing["result"] or {}
+    return listing
+
+
+def to_columns(listings: Iterable[Listing]) -> Dict[str, np.ndarray]:
+    """
+    Struct-of-arrays view of a batch of results (PropertyNormalized objects,
+    their model_dump() dicts or JSONL records)
+    """
+    rows = [_as_dict(listing) for listing in listings]
+
+    def column(getter) -> np.ndarray:
+        return np.array([getter(row) or "" for row in rows], dtype=object)
+
+    def sub(field, key):
+        return lambda row: (row.get(field) or {}).get(key)
+
+    columns = {
+        "full_address": column(sub("address", "full_address")),
+        "street": column(sub("address", "street")),
+        "ward": column(sub("address", "ward")),
+        "district": column(sub("address", "district")),
+        "province": column(sub("address", "province")),
+        "land_type": column(lambda row: row.get("land_type")),
+        "listing_price": column(lambda row: row.get("listing_price")),
+        "unit_price": column(lambda row: row.get("unit_price")),
+        "area": column(sub("area", "area")),
+        "frontage": column(sub("area", "frontage")),
+        "construction": column(lambda row: row.get("construction")),
+        "publish_date": column(lambda row: row.get("publish_date")),
+    }
+    # Filled one by one, NumPy would turn equal-length lists into a 2D array
+    columns["images"] = np.empty(len(rows), dtype=object)
+    for i, row in enumerate(rows):
+        columns["images"][i] = row.get("images") or []
+    columns["image_count"] = np.array([len(i) for i in columns["images"]], dtype=np.int32)
+    columns["listing_price_vnd"], columns["listing_price_per"] = _map_unique(
+        columns["listing_price"], parse_price, (np.float64, object)
+    )
+    columns["unit_price_vnd"], columns["unit_price_per"] = _map_unique(
+        columns["unit_price"], parse_price, (np.float64, object)
+    )
+    (columns["area_m2"],) = _map_unique(columns["area"], parse_area, (np.float64,))
+    return columns
+
+
+def _require_pyarrow():
+    if pyarrow is None:
+        raise ImportError("Arrow/Parquet output needs the pyarrow package")
+
+
+def to_arrow(listings: Iterable[Listing]) -> "pyarrow.Table":
+    _require_pyarrow()
+    columns = to_columns(listings)
+    arrays = {}
+    for name, values in columns.items():
+        if name == "images":
+            arrays[name] = pyarrow.array(list(values), type=pyarrow.list_(pyarrow.string()))
+        elif values.dtype == object:
+            arrays[name] = pyarrow.array(list(values), type=pyarrow.string())
+        else:
+            arrays[name] = pyarrow.array(values)
+    return pyarrow.table(arrays)
+
+
+def _batches(iterable: Iterable, size: int) -> Iterable[List]:
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def write_parquet(listings: Iterable[Listing], path, batch_size: int = 50_000) -> int:
+    """
+    Write results to a Parquet file, `batch_size` rows at a time so any number
+    of listings can be exported with bounded memory. Returns the row count.
+    """
+    _require_pyarrow()
+    writer = None
+    rows = 0
+    try:
+        for batch in _batches(listings, batch_size):
+            table = to_arrow(batch)
+            if writer is None:
+                writer = pyarrow.parquet.ParquetWriter(str(path), table.schema)
+            writer.write_table(table)
+            rows += table.num_rows
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
@@ -0,0 +1,258 @@
+"""
+File: compact.py
+Desc: Compact in-memory container for large sets of PropertyNormalized results
+
+A PropertyNormalized is four pydantic models plus a list of image URLs, so
+millions of them take tens of GB. A CompactBatch keeps the same data as
+columns of small integers and packed UTF-8 text instead:
+
+    - repeated values (province, district, land type, prices, dates...) are
+      interned once in a string pool, rows only hold their index;
+    - free text (full address, house number, alley, construction) is packed
+      into one buffer with end offsets;
+    - image URLs are split into a directory prefix, interned (CDN host and
+      path repeat across listings), and a file name, packed.
+
+Rows are only turned back into PropertyNormalized when they are read:
+
+    batch = CompactBatch.from_results(results)
+    batch[42]                                # PropertyNormalized
+    batch.column("address.district")         # without building any model
+"""
+
+from array import array
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from lovesoup.property_models import Address, Location, Measurement, PropertyNormalized
+
+SUBMODELS = {"address": Address, "location": Location, "area": Measurement}
+
+# Values repeated across listings, stored as indexes in the string pool
+POOLED_FIELDS = (
+    "address.street",
+    "address.ward",
+    "address.district",
+    "address.province",
+    "location.position",
+    "location.alley_position",
+    "location.distance_to_main_road",
+    "location.secondary_alley",
+    "area.area",
+    "area.frontage",
+    "land_type",
+    "listing_price",
+    "unit_price",
+    "publish_date",
+)
+
+# Values mostly unique to a listing, packed as UTF-8
+TEXT_FIELDS = (
+    "address.full_address",
+    "address.house_no",
+    "address.alley",
+    "construction",
+)
+
+# Bits of the per-row flags: which optional parts are not None
+_PRESENT = {"address": 1, "location": 2, "area": 4, "images": 8}
+
+
+class StringPool:
+    """
+    Every distinct string stored once; index 0 stands for None
+    """
+
+    __slots__ = ("strings", "_index")
+
+    def __init__(self):
+        self.strings: List[Optional[str]] = [None]
+        self._index: Dict[str, int] = {}
+
+    def intern(self, value: Optional[str]) -> int:
+        if value is None:
+            return 0
+        index = self._index.get(value)
+        if index is None:
+            index = len(self.strings)
+            self.strings.append(value)
+            self._index[value] = index
+        return index
+
+    def __getitem__(self, index: int) -> Optional[str]:
+        return self.strings[index]
+
+    def __len__(self) -> int:
+        return len(self.strings) - 1
+
+
+class TextColumn:
+    """
+    Strings packed into one UTF-8 buffer, with the end offset of each one
+    """
+
+    __slots__ = ("data", "ends", "nulls")
+
+    def __init__(self):
+        self.data = bytearray()
+        self.ends = array("Q")
+        self.nulls = bytearray()
+
+    def append(self, value: Optional[str]) -> None:
+        if value is not None:
+            self.data += value.encode("utf-8")
+        self.ends.append(len(self.data))
+        self.nulls.append(value is None)
+
+    def __getitem__(self, index: int) -> Optional[str]:
+        if self.nulls[index]:
+            return None
+        start = self.ends[index - 1] if index else 0
+        return self.data[start : self.ends[index]].decode("utf-8")
+
+    def __len__(self) -> int:
+        return len(self.ends)
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.data) + self.ends.itemsize * len(self.ends) + len(self.nulls)
+
+
+def _split_field(field: str) -> Tuple[Optional[str], str]:
+    parent, _, name = field.rpartition(".")
+    return parent or None, name
+
+
+def split_url(url: str) -> Tuple[str, str]:
+    """
+    ("https://cdn.host/images/2024/10/a.jpg") -> ("https://cdn.host/images/2024/10/", "a.jpg")
+    """
+    cut = url.rfind("/") + 1
+    return url[:cut], url[cut:]
+
+
+class CompactBatch:
+    """
+    Struct-of-arrays store of PropertyNormalized results. Append results,
+    read them back with indexing or iteration; the public model is unchanged.
+    """
+
+    def __init__(self):
+        self.pool = StringPool()
+        self.prefixes = StringPool()
+        self.flags = bytearray()
+        self.pooled: Dict[str, array] = {field: array("I") for field in POOLED_FIELDS}
+        self.text: Dict[str, TextColumn] = {field: TextColumn() for field in TEXT_FIELDS}
+        # images of row i are [image_ends[i - 1], image_ends[i])
+        self.image_ends = array("Q")
+        self.image_prefixes = array("I")
+        self.image_names = TextColumn()
+
+    @classmethod
+    def from_results(cls, results: Iterable[PropertyNormalized]) -> "CompactBatch":
+        batch = cls()
+        batch.extend(results)
+        return batch
+
+    def __len__(self) -> int:
+        return len(self.flags)
+
+    def append(self, result: PropertyNormalized) -> None:
+        flags = 0
+        for part, bit in _PRESENT.items():
+            if getattr(result, part) is not None:
+                flags |= bit
+        self.flags.append(flags)
+
+        for field, column in self.pooled.items():
+            column.append(self.pool.intern(self._get(result, field)))
+        for field, column in self.text.items():
+            column.append(self._get(result, field))
+
+        for url in result.images or ():
+            prefix, name = split_url(url)
+            self.image_prefixes.append(self.prefixes.intern(prefix))
+            self.image_names.append(name)
+        self.image_ends.append(len(self.image_prefixes))
+
+    def extend(self, results: Iterable[PropertyNormalized]) -> None:
+        for result in results:
+            self.append(result)
+
+    @staticmethod
+    def _get(result: PropertyNormalized, field: str) -> Optional[str]:
+        parent, name = _split_field(field)
+        if parent is not None:
+            result = getattr(result, parent)
+            if result is None:
+                return None
+        return getattr(result, name)
+
+    def _index(self, index: int) -> int:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("CompactBatch index out of range")
+        return index
+
+    def value(self, index: int, field: str) -> Optional[str]:
+        """
+        One field of one row, e.g. value(3, "address.district")
+        """
+        index = self._index(index)
+        if field in self.pooled:
+            return self.pool[self.pooled[field][index]]
+        if field in self.text:
+            return self.text[field][index]
+        if field == "images":
+            return self.images(index)
+        raise KeyError(f"Unknown field {field!r}")
+
+    def images(self, index: int) -> Optional[List[str]]:
+        index = self._index(index)
+        if not self.flags[index] & _PRESENT["images"]:
+            return None
+        start = self.image_ends[index - 1] if index else 0
+        return [
+            self.prefixes[self.image_prefixes[i]] + self.image_names[i]
+            for i in range(start, self.image_ends[index])
+        ]
+
+    def column(self, field: str) -> List[Optional[str]]:
+        """
+        All values of a field, without building any model
+        """
+        if field in self.pooled:
+            strings = self.pool.strings
+            return [strings[i] for i in self.pooled[field]]
+        return [self.value(i, field) for i in range(len(self))]
+
+    def __getitem__(self, index: Union[int, slice]):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        index = self._index(index)
+        flags = self.flags[index]
+        values: Dict[str, Dict[str, Optional[str]]] = {part: {} for part in SUBMODELS}
+        top = {}
+        for field in POOLED_FIELDS + TEXT_FIELDS:
+            parent, name = _split_field(field)
+            (values[parent] if parent else top)[name] = self.value(index, field)
+        for part, model in SUBMODELS.items():
+            top[part] = model(**values[part]) if flags & _PRESENT[part] else None
+        top["images"] = self.images(index)
+        return PropertyNormalized(**top)
+
+    def __iter__(self) -> Iterator[PropertyNormalized]:
+        for index in range(len(self)):
+            yield self[index]
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Size of the columns, not counting the pooled strings themselves
+        """
+        size = len(self.flags)
+        size += sum(column.itemsize * len(column) for column in self.pooled.values())
+        size += sum(column.nbytes for column in self.text.values())
+        size += self.image_ends.itemsize * len(self.image_ends)
+        size += self.image_prefixes.itemsize * len(self.image_prefixes)
+        return size + self.image_names.nbytes
@@ -0,0 +1,115 @@
+"""
+File: cooks/__init__.py
+Desc: Specific post-processor depends on the site/template
+
+Each site lives in its own module, imported the first time its cook is asked
+for: `from lovesoup.cooks import Mogi` or `get_cook("mogi")` only load Mogi's
+precook models, not those of every site.
+"""
+
+import importlib
+
+from lovesoup.property_models import Location
+
+# Location is not available on any site yet
+EMPTY_LOCATION = Location(
+    position="", alley_position="", distance_to_main_road="", secondary_alley=""
+)
+
+
+def extract_second_based_on_first(features, first_cond, default=""):
+    """
+    Extracts the second value from a list of feature objects like [[key1, val1], [key2, val2]]
+    Returns:
+        The extracted value or the default value.
+    """
+    if features:
+        return next(
+            (f[1] for f in features if first_cond(f[0])),
+            default,
+        )
+    return default
+
+
+def extract_value_based_on_title(features, title, default=""):
+    """
+    Extracts the value for a specific title from a list of feature objects.
+
+    Args:
+        features (list): The list of feature objects containing title-value pairs.
+        title (str): The title of the feature to extract the value for.
+        default (Any): The default value to return if the title is not found.
+
+    Returns:
+        The extracted value or the default value.
+    """
+    if features:
+        return next(
+            (f.value for f in features if f.title == title),
+            default,
+        )
+    return default
+
+
+# Module and class name of every cook, in ALL_COOKS order
+_COOK_MODULES = {
+    "Mogi": "mogi",
+    "BatDongSan": "batdongsan",
+    "Cenhomes": "cenhomes",
+    "BDS123Vn": "bds123vn",
+    "Muabannet": "muabannet",
+    "Nhatot": "nhatot",
+}
+
+# Site identifiers accepted wherever a site has to be named: the template name
+# ("batdongsancomvn"), the class name ("BatDongSan") or the test_data folder ("batdongsan")
+_SITE_COOKS = {
+    "mogi": "Mogi",
+    "batdongsancomvn": "BatDongSan",
+    "batdongsan": "BatDongSan",
+    "cenhomes": "Cenhomes",
+    "bds123vn": "BDS123Vn",
+    "muabannet": "Muabannet",
+    "nhatot": "Nhatot",
+}
+
+
+def _load_cook(name):
+    cook = globals().get(name)
+    if cook is None:
+        module = importlib.import_module(f"{__name__}.{_COOK_MODULES[name]}")
+        cook = globals()[name] = getattr(module, name)
+    return cook
+
+
+def __getattr__(name):
+    # Cook classes, ALL_COOKS and SITE_ALIASES are loaded on first access
+    if name in _COOK_MODULES:
+        return _load_cook(name)
+    if name == "ALL_COOKS":
+        value = tuple(map(_load_cook, _COOK_MODULES))
+    elif name == "SITE_ALIASES":
+        value = {alias: _load_cook(cook) for alias, cook in _SITE_COOKS.items()}
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted({*globals(), *_COOK_MODULES, "ALL_COOKS", "SITE_ALIASES"})
+
+
+def get_cook(site):
+    """
+    Resolve a site identifier (or a DataExtractor subclass) into its cook class
+    """
+    if isinstance(site, type):
+        from lovesoup.general_extractor import DataExtractor
+
+        if issubclass(site, DataExtractor):
+            return site
+    try:
+        return _load_cook(_SITE_COOKS[str(site).lower()])
+    except KeyError:
+        raise ValueError(f"Unknown site: {site!r}") from None
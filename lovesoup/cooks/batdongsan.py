@@ -0,0 +1,68 @@
+"""
+File: batdongsan.py
+Desc: Post-processor of batdongsan.com.vn pages
+"""
+
+from lovesoup.cooks import EMPTY_LOCATION
+from lovesoup.general_extractor import DataExtractor
+from lovesoup.precook_models.batdongsan_models import BatDongSanPropertyInfo
+from lovesoup.property_models import Address, Measurement, PropertyNormalized
+from lovesoup.regions import RegionHint
+
+
+class BatDongSan(DataExtractor):
+    FIELD_DEPENDENCIES = {
+        "address": ("address",),
+        "area": ("features",),
+        "listing_price": ("features",),
+        "unit_price": ("short_info",),
+        "images": ("images",),
+        "publish_date": ("ad_info",),
+    }
+    FEATURE_MAP = {
+        "area": ("features", "Diện tích"),
+        "listing_price": ("features", "Mức giá"),
+        "publish_date": ("ad_info", "Ngày đăng"),
+    }
+    # From the photos to the contact box
+    REGION_HINT = RegionHint(
+        start='class="re__media-thumbs',
+        end="js__zalo-chat",
+        required=("images", "post_title", "phone"),
+    )
+
+    def __init__(self, template_name="batdongsancomvn", **kwargs):
+        super().__init__(template_name, **kwargs)
+
+    def post_process(self, primary_result):
+        primary_result = self.validate_precook(BatDongSanPropertyInfo, primary_result)
+        features = self.features(primary_result)
+
+        address = self.build(Address, full_address=primary_result.address)
+
+        location = self.shared(EMPTY_LOCATION)
+
+        # Extract area and frontage from features
+        area = self.build(
+            Measurement,
+            area=features["area"],
+            frontage="",  # Assuming frontage is not available in this dataset
+        )
+
+        # Extract other necessary fields
+        listing_price = features["listing_price"]
+        unit_price = next((f.sub for f in primary_result.short_info), "")
+        publish_date = features["publish_date"]
+
+        # Create and return PropertyNormalized object
+        return self.build(
+            PropertyNormalized,
+            address=address,
+            location=location,
+            area=area,
+            land_type="",  # Assuming land_type is not available in this dataset
+            listing_price=listing_price,
+            unit_price=unit_price,
+            images=primary_result.images,
+            publish_date=publish_date,
+        )
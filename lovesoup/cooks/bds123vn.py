@@ -0,0 +1,62 @@
+"""
+File: bds123vn.py
+Desc: Post-processor of bds123.vn pages
+"""
+
+from lovesoup.cooks import EMPTY_LOCATION
+from lovesoup.general_extractor import DataExtractor
+from lovesoup.precook_models.bds123vn_models import BDS123VnPropertyInfo
+from lovesoup.property_models import Address, Measurement, PropertyNormalized
+from lovesoup.regions import RegionHint
+
+
+class BDS123Vn(DataExtractor):
+    FIELD_DEPENDENCIES = {
+        "address": ("address",),
+        "area": ("short_info",),
+        "listing_price": ("short_info",),
+        "images": ("images",),
+        "publish_date": ("features",),
+    }
+    FEATURE_MAP = {
+        "area": ("short_info", "item post-acreage"),
+        "listing_price": ("short_info", "item post-price"),
+        "publish_date": ("features", "Ngày bắt đầu"),
+    }
+    # The page content without its header and footer
+    REGION_HINT = RegionHint(start="<main", end="</main>", required=("title", "images"))
+
+    def __init__(self, template_name="bds123vn", **kwargs):
+        super().__init__(template_name, **kwargs)
+
+    def post_process(self, primary_result):
+        primary_result = self.validate_precook(BDS123VnPropertyInfo, primary_result)
+        features = self.features(primary_result)
+
+        address = self.build(Address, full_address=primary_result.address)
+
+        location = self.shared(EMPTY_LOCATION)
+
+        # Extract area and frontage from features
+        area = self.build(
+            Measurement,
+            area=features["area"],
+            frontage="",  # Assuming frontage is not available in this dataset
+        )
+
+        listing_price = features["listing_price"]
+        unit_price = None
+        publish_date = features["publish_date"]
+
+        # Create and return PropertyNormalized object
+        return self.build(
+            PropertyNormalized,
+            address=address,
+            location=location,
+            area=area,
+            land_type="",  # Assuming land_type is not available in this dataset
+            listing_price=listing_price,
+            unit_price=unit_price,
+            images=primary_result.images,
+            publish_date=publish_date,
+        )
@@ -0,0 +1,80 @@
+"""
+File: cenhomes.py
+Desc: Post-processor of Cenhomes (cenhomes.vn) pages
+"""
+
+from lovesoup.cooks import EMPTY_LOCATION
+from lovesoup.general_extractor import DataExtractor
+from lovesoup.precook_models.cenhomes_models import CenhomesPropertyInfo
+from lovesoup.property_models import Address, Measurement, PropertyNormalized
+
+
+class Cenhomes(DataExtractor):
+    FIELD_DEPENDENCIES = {
+        "address": ("address", "geolocation"),
+        "area": ("features",),
+        "land_type": ("features",),
+        "listing_price": ("short_info",),
+        "unit_price": ("short_info",),
+        "images": ("images_section",),
+        "construction": ("features",),
+    }
+    FEATURE_MAP = {
+        "ward": ("geolocation", "Phường/Xã"),
+        "district": ("geolocation", "Quận/Huyện"),
+        "province": ("geolocation", "Tỉnh/Thành phố"),
+        "area": ("features", "Diện tích"),
+        "floors": ("features", "Số tầng"),
+        "land_type": ("features", "Loại hình"),
+    }
+
+    def __init__(self, template_name="cenhomes", **kwargs):
+        super().__init__(template_name, **kwargs)
+
+    def post_process(self, primary_result):
+        primary_result = self.validate_precook(CenhomesPropertyInfo, primary_result)
+        features = self.features(primary_result)
+
+        address = self.build(
+            Address,
+            full_address=primary_result.address,
+            ward=features["ward"],
+            district=features["district"],
+            province=features["province"],
+        )
+
+        location = self.shared(EMPTY_LOCATION)
+
+        # Extract area and frontage from features
+        area = self.build(
+            Measurement,
+            area=features["area"],
+            frontage="",  # Assuming frontage is not available in this dataset
+        )
+
+        # Extract other necessary fields
+        listing_price = primary_result.short_info.listing_price
+        unit_price = next(iter(primary_result.short_info.unit_price), None)
+        construction = features["floors"]
+        if construction:
+            if area:
+                construction = f"{construction} tầng/{area.area}"
+            else:
+                construction = f"{construction} tầng"
+
+        land_type = features["land_type"]
+
+        # This site doesn't give publish_date
+        # Create and return PropertyNormalized object
+        return self.build(
+            PropertyNormalized,
+            address=address,
+            location=location,
+            area=area,
+            land_type=land_type,  # Assuming land_type is not available in this dataset
+            listing_price=listing_price,
+            unit_price=unit_price,
+            images=primary_result.images_section.images,
+            construction=construction,
+            publish_date="",
+        )
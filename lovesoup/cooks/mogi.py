@@ -0,0 +1,63 @@
+"""
+File: mogi.py
+Desc: Post-processor of Mogi (mogi.vn) pages
+"""
+
+from lovesoup.cooks import EMPTY_LOCATION
+from lovesoup.general_extractor import DataExtractor
+from lovesoup.precook_models.mogi_models import MogiPropertyInfo
+from lovesoup.property_models import Address, Measurement, PropertyNormalized
+from lovesoup.regions import RegionHint
+
+
+class Mogi(DataExtractor):
+    FIELD_DEPENDENCIES = {
+        "address": ("address",),
+        "area": ("features",),
+        "listing_price": ("listing_price",),
+        "images": ("images",),
+        "publish_date": ("features",),
+    }
+    FEATURE_MAP = {
+        "area": ("features", "Diện tích đất"),
+        "publish_date": ("features", "Ngày đăng"),
+    }
+    # From the photos to the agent's phone
+    REGION_HINT = RegionHint(
+        start='<div class="media-item"',
+        end='class="widget',
+        required=("images", "title", "phone"),
+    )
+
+    def __init__(self, template_name="mogi", **kwargs):
+        super().__init__(template_name, **kwargs)
+
+    def post_process(self, primary_result):
+        primary_result = self.validate_precook(MogiPropertyInfo, primary_result)
+        features = self.features(primary_result)
+        address = self.build(Address, full_address=primary_result.address)
+
+        location = self.shared(EMPTY_LOCATION)
+
+        # Extract area and frontage from features
+        area = self.build(
+            Measurement,
+            area=features["area"],
+            frontage="",  # Assuming frontage is not available in this dataset
+        )
+        listing_price = primary_result.listing_price
+        unit_price = None
+        images = primary_result.images
+        publish_date = features["publish_date"]
+        # Create and return PropertyNormalized object
+        return self.build(
+            PropertyNormalized,
+            address=address,
+            location=location,
+            area=area,
+            land_type="",  # Assuming land_type is not available in this dataset
+            listing_price=listing_price,
+            unit_price=unit_price,
+            images=images,
+            publish_date=publish_date,
+        )
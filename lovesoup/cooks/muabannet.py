@@ -0,0 +1,55 @@
+"""
+File: muabannet.py
+Desc: Post-processor of muaban.net pages
+"""
+
+from lovesoup.cooks import EMPTY_LOCATION
+from lovesoup.general_extractor import DataExtractor
+from lovesoup.precook_models.muabannet_models import MuabannetPropertyInfo
+from lovesoup.property_models import Address, Measurement, PropertyNormalized
+
+
+class Muabannet(DataExtractor):
+    FIELD_DEPENDENCIES = {
+        "address": ("address",),
+        "area": ("short_info",),
+        "listing_price": ("listing_price",),
+        "images": ("images",),
+    }
+    FEATURE_MAP = {
+        "area": ("short_info", "Diện tích sử dụng"),
+    }
+
+    def __init__(self, template_name="muabannet", **kwargs):
+        super().__init__(template_name, **kwargs)
+
+    def post_process(self, primary_result):
+        primary_result = self.validate_precook(MuabannetPropertyInfo, primary_result)
+        features = self.features(primary_result)
+
+        address = self.build(Address, full_address=primary_result.address)
+
+        location = self.shared(EMPTY_LOCATION)
+
+        # Extract area and frontage from features
+        area = self.build(
+            Measurement,
+            area=features["area"],
+            frontage="",
+        )
+
+        listing_price = primary_result.listing_price
+        unit_price = None
+        images = primary_result.images
+
+        # Create and return PropertyNormalized object
+        return self.build(
+            PropertyNormalized,
+            address=address,
+            location=location,
+            area=area,
+            land_type="",
+            listing_price=listing_price,
+            unit_price=unit_price,
+            images=images,
+        )
@@ -0,0 +1,110 @@
+"""
+File: nhatot.py
+Desc: Post-processor of Nhà Tốt (nhatot.com) pages
+"""
+
+from lovesoup.cooks import EMPTY_LOCATION
+from lovesoup.general_extractor import DataExtractor, page_text
+from lovesoup.json_scan import find_json_path, find_script_json, loads
+from lovesoup.property_models import Address, Measurement, PropertyNormalized
+from lovesoup.regions import RegionHint
+
+
+class Nhatot(DataExtractor):
+    FIELD_DEPENDENCIES = {
+        "address": ("ad_details",),
+        "area": ("ad_details",),
+        "land_type": ("ad_details",),
+        "listing_price": ("pricing",),
+        "unit_price": ("pricing",),
+        "images": ("ad_details",),
+    }
+
+    # Where the ad lives inside the Next.js page state
+    AD_PATH = ("props", "pageProps", "initialState", "adView", "adInfo", "ad")
+    # Title and pricing, up to the page state script that the fast JSON path
+    # reads on its own
+    REGION_HINT = RegionHint(
+        start="<h1",
+        end='type="application/json"',
+        keys=("title", "pricing"),
+        required=("title", "pricing"),
+    )
+
+    CACHE_OPTIONS = DataExtractor.CACHE_OPTIONS + ("fast_json",)
+
+    # The ad is read from the page state script as "ad", or kept whole as "ad_details"
+    RAW_KEYS = {"ad_details": ("ad_details", "ad")}
+
+    def __init__(self, template_name="nhatot", fast_json=True, **kwargs):
+        """
+        fast_json: read the ad straight from the page state script, without running
+            its template selector nor decoding the whole page state.
+        """
+        super().__init__(template_name, **kwargs)
+        self.fast_json = fast_json
+
+    def options(self):
+        return {**super().options(), "fast_json": self.fast_json}
+
+    def extract(self, html_content, keys=None):
+        if not self.fast_json or self.engine != "plan":
+            return super().extract(html_content, keys)
+
+        primary_result = super().extract(
+            html_content,
+            keys=[k for k in (self.plan.keys if keys is None else keys) if k != "ad_details"],
+        )
+        del primary_result["ad_details"]
+        if keys is not None and "ad_details" not in keys:
+            primary_result["ad"] = {}
+            return primary_result
+
+        script = find_script_json(page_text(html_content))
+        try:
+            primary_result["ad"] = find_json_path(script, self.AD_PATH)
+        except (TypeError, IndexError, KeyError, ValueError):
+            # Unexpected layout: keep the raw script and let post_process decode it all
+            primary_result["ad_details"] = self.plan.extract(
+                html_content, keys=["ad_details"]
+            )["ad_details"]
+        return primary_result
+
+    def post_process(self, primary_result):
+        location = self.shared(EMPTY_LOCATION)
+
+        listing_price = primary_result["pricing"].get("listing_price")
+        unit_price = primary_result["pricing"].get("unit_price")
+
+        data = primary_result.get("ad")
+        if data is None:
+            data = loads(primary_result["ad_details"])
+            for key in self.AD_PATH:
+                data = data[key]
+
+        # The ad is empty only when none of its fields were asked for, see `fields`
+        images = data["images"] if data else None
+
+        # The ad comes from the page state JSON, which no template model has
+        # checked: its values are validated even in trusted mode
+        area = Measurement(
+            area=str(data.get("size")) + data.get("size_unit_string") if data else None,
+            frontage="",
+        )
+
+        address = Address(
+            full_address="",  # Can be inferred from other. Create another constructor method here would be nice
+            ward=data.get("ward_name"),
+            district=data.get("area_name"),
+            street=data.get("street_name"),
+        )
+        # Create and return PropertyNormalized object
+        return PropertyNormalized(
+            address=address,
+            location=location,
+            area=area,
+            land_type=data.get("category_name"),
+            listing_price=listing_price,
+            unit_price=unit_price,
+            images=images,
+        )
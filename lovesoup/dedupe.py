@@ -0,0 +1,579 @@
+"""
+File: dedupe.py
+Desc: Incremental near-duplicate index over extracted listings (MinHash and LSH banding)
+
+The same property gets posted on several sites and reposted every day.
+`DedupeIndex` finds, for every listing added, the listings already in the
+index it is a near-duplicate of, without comparing it to all of them:
+
+    index = DedupeIndex()
+    for result in index.add_many(listings):     # PropertyNormalized, dicts or JSONL records
+        if result.matches:
+            print(result.id, "duplicates", result.matches, "group", result.group)
+    index.save("dedupe-index/")
+    index = DedupeIndex.load("dedupe-index/")   # and keep adding
+
+Every listing gets two MinHash signatures:
+    - content: normalized address (through `lovesoup.gazetteer`: province,
+      district, ward, street, house number), price and area on log-scale
+      buckets, land type. Reposts on other sites share it;
+    - images: file names of the images, without size suffixes. Reposts on
+      the same site share it, even with another address or price.
+Signatures are cut into bands; listings sharing a band are candidates, and
+candidates whose estimated similarity (the share of equal MinHash values)
+reaches the threshold of either signature are duplicates. Duplicates are
+grouped with a union-find, `group` being the first listing of the group.
+
+Band keys go to a dict while they are few, then to sorted NumPy arrays
+looked up with binary search, merged as they grow (log-structured). NumPy
+is needed (`pip install numpy`).
+"""
+
+import json
+import math
+import os
+import re
+import zlib
+from functools import lru_cache
+from itertools import chain, islice, repeat, zip_longest
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from lovesoup.columnar import Listing, parse_area, parse_price
+from lovesoup.gazetteer import bare_name, fold, split_address
+from lovesoup.property_models import PropertyNormalized
+
+MAX_HASH = np.uint64(0xFFFFFFFF)
+_PRIME = np.uint64((1 << 61) - 1)
+_MIX = np.uint64(0x100000001B3)
+_BAND_SALT = np.uint64(0x9E3779B97F4A7C15)
+
+# Log-scale bucket widths: prices within ~4% and areas within ~4% share a bucket
+PRICE_STEP = 1.04
+AREA_STEP = 1.04
+
+_WORD = re.compile(r"[a-z0-9]+")
+_STREET_WORDS = frozenset({"duong", "pho", "d"})
+_IMAGE_SIZE = re.compile(r"([-_.]?\d{2,4}x\d{2,4}|[-_.](thumb|small|medium|large|crop|resize))+$")
+
+_FORMAT_VERSION = 1
+
+
+class DedupeResult(NamedTuple):
+    """
+    A listing added to the index: its id, its group and the listings it
+    duplicates, as (id, similarity) pairs
+    """
+
+    id: int
+    group: int
+    matches: List[Tuple[int, float]]
+
+
+@lru_cache(maxsize=65536)
+def _norm(text: Optional[str]) -> str:
+    """
+    Folded words of a name without its type word: "Quận Tây Hồ" -> "tay ho"
+    """
+    if not text:
+        return ""
+    words = _WORD.findall(fold(bare_name(text.strip())))
+    while words and words[0] in _STREET_WORDS and len(words) > 1:
+        words = words[1:]
+    return " ".join(words)
+
+
+def _buckets(name: str, value: float, step: float) -> List[str]:
+    """
+    Two log-scale grids shifted by half a bucket: close values share at least one bucket
+    """
+    if not value > 0 or math.isinf(value):
+        return []
+    position = math.log(value) / math.log(step)
+    return [f"{name}a{math.floor(position)}", f"{name}b{math.floor(position + 0.5)}"]
+
+
+def image_stem(url: str) -> str:
+    """
+    File name of an image URL, without extension nor size suffix:
+    ".../2024/05/abc123_600x400.jpg" -> "abc123"
+    """
+    name = url.split("?", 1)[0].rstrip("/").rsplit("/", 1)[-1].lower()
+    name = name.rsplit(".", 1)[0] if "." in name else name
+    return _IMAGE_SIZE.sub("", name) or name
+
+
+def _listing_fields(listing: Listing) -> Tuple:
+    """
+    (address fields, listing price, area, land type, images) of any listing form
+    """
+    if isinstance(listing, PropertyNormalized):
+        address = listing.address
+        fields = (
+            (
+                address.full_address,
+                address.house_no,
+                address.street,
+                address.ward,
+                address.district,
+                address.province,
+            )
+            if address is not None
+            else (None,) * 6
+        )
+        area = listing.area.area if listing.area is not None else None
+        return fields, listing.listing_price, area, listing.land_type, listing.images
+    if "result" in listing and "source" in listing:
+        listing = listing["result"] or {}
+    address = listing.get("address") or {}
+    fields = tuple(
+        address.get(name)
+        for name in ("full_address", "house_no", "street", "ward", "district", "province")
+    )
+    area = (listing.get("area") or {}).get("area")
+    return fields, listing.get("listing_price"), area, listing.get("land_type"), listing.get("images")
+
+
+def _paired(listings: Iterable[Listing], keys: Iterable[Optional[str]]) -> Iterator[Tuple]:
+    """
+    (listing, key) pairs, raising ValueError when there are more of one than of the other
+    """
+    missing = object()
+    for listing, key in zip_longest(listings, keys, fillvalue=missing):
+        if listing is missing or key is missing:
+            raise ValueError("Expected as many keys as listings")
+        yield listing, key
+
+
+def _source(listing: Listing) -> Optional[str]:
+    return listing.get("source") if isinstance(listing, dict) else None
+
+
+def listing_features(listing: Listing) -> Tuple[List[str], List[str]]:
+    """
+    Content and image features of a listing. The content ones are empty when
+    the listing says too little to be compared (no district, or neither price nor area).
+    """
+    (full_address, house_no, street, ward, district, province), price, area, land_type, images = (
+        _listing_fields(listing)
+    )
+    # As Gazetteer.fill: without a full address, the province comes from the other fields
+    text = full_address or ", ".join(filter(None, (street, ward, district, province)))
+    if text:
+        parts = split_address(text)
+        house_no = house_no or parts.house_no
+        street = street or parts.street
+        ward = ward or parts.ward
+        district = district or parts.district
+        province = province or parts.province
+
+    content: List[str] = []
+    district = _norm(district)
+    price_features = []
+    if price:
+        value, per = parse_price(price)
+        price_features = _buckets(f"p{per}", value, PRICE_STEP)
+    area_features = _buckets("a", parse_area(area), AREA_STEP) if area else []
+    if district and (price_features or area_features):
+        place = f"{_norm(province)}/{district}"
+        content.append(f"d:{place}")
+        ward = _norm(ward)
+        if ward:
+            content.append(f"w:{place}/{ward}")
+        street = _norm(street)
+        if street:
+            # Weighed by repeating it: another street is another property
+            content += [f"s{i}:{place}/{street}" for i in range(2)]
+            house_no = _norm(house_no)
+            if house_no:
+                content += [f"h{i}:{place}/{street}/{house_no}" for i in range(2)]
+        content += price_features + area_features
+        if land_type:
+            content.append(f"t:{_norm(land_type)}")
+
+    stems = {image_stem(url) for url in images or () if url}
+    return content, [f"i:{stem}" for stem in stems if stem]
+
+
+def _hashes(features: Iterable[str]) -> List[int]:
+    return [zlib.crc32(feature.encode("utf-8")) for feature in features]
+
+
+def _minhash(sets: Sequence[List[int]], a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """
+    MinHash signatures (one row per set) of sets of 32-bit feature hashes.
+    Empty sets get MAX_HASH everywhere.
+    """
+    lengths = np.fromiter(map(len, sets), dtype=np.int64, count=len(sets))
+    signatures = np.full((len(sets), len(a)), MAX_HASH, dtype=np.uint64)
+    total = int(lengths.sum())
+    if total:
+        flat = np.fromiter(chain.from_iterable(sets), dtype=np.uint64, count=total)
+        # a, flat < 2**32: a * flat + b fits in 64 bits
+        values = (flat[:, None] * a + b) % _PRIME & MAX_HASH
+        nonempty = lengths > 0
+        starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))[nonempty]
+        signatures[nonempty] = np.minimum.reduceat(values, starts, axis=0)
+    return signatures.astype(np.uint32)
+
+
+class _Segment(NamedTuple):
+    keys: np.ndarray  # uint64, sorted
+    ids: np.ndarray  # uint32, listing of each key
+
+    @classmethod
+    def build(cls, keys: np.ndarray, ids: np.ndarray) -> "_Segment":
+        order = np.argsort(keys, kind="stable")
+        return cls(keys[order], ids[order])
+
+    def lookup(self, keys: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (query position, listing id) pairs for every key found
+        """
+        left = np.searchsorted(self.keys, keys, "left")
+        counts = np.searchsorted(self.keys, keys, "right") - left
+        found = np.nonzero(counts)[0]
+        if not len(found):
+            return found, found
+        counts = counts[found]
+        positions = np.repeat(found, counts)
+        # Index of every matching key: its run start plus its rank in the run
+        ranks = np.arange(int(counts.sum())) - np.repeat(np.cumsum(counts) - counts, counts)
+        return positions, self.ids[np.repeat(left[found], counts) + ranks]
+
+
+class DedupeIndex:
+    """
+    Near-duplicate index over listings, see the module docstring
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.55,
+        image_threshold: float = 0.5,
+        content_bands: int = 20,
+        image_bands: int = 8,
+        rows: int = 4,
+        seed: int = 1,
+        flush_size: int = 65536,
+        max_candidates: int = 1000,
+    ):
+        """
+        Args:
+            threshold: content similarity from which two listings are duplicates.
+            image_threshold: image similarity from which two listings are duplicates.
+            content_bands, image_bands, rows: LSH bands of each signature, of
+                `rows` MinHash values each. More bands find more candidates.
+            seed: seed of the MinHash functions; indexes are only comparable
+                with the same seed and sizes.
+            flush_size: listings whose band keys are kept in a dict before
+                going to a sorted segment.
+            max_candidates: candidates checked per listing at most, latest first.
+        """
+        self.threshold = threshold
+        self.image_threshold = image_threshold
+        self.content_bands = content_bands
+        self.image_bands = image_bands
+        self.rows = rows
+        self.seed = seed
+        self.flush_size = flush_size
+        self.max_candidates = max_candidates
+
+        self.content_perm = content_bands * rows
+        width = (content_bands + image_bands) * rows
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, 1 << 32, size=width, dtype=np.uint64)
+        self._b = rng.integers(0, 1 << 32, size=width, dtype=np.uint64)
+
+        self._n = 0
+        self._signatures = np.empty((1024, width), dtype=np.uint32)
+        self._parent = np.empty(1024, dtype=np.int64)
+        self.keys: List[Optional[str]] = []
+        self._buffer: Dict[int, List[int]] = {}
+        self._buffered: List[Tuple[np.ndarray, int]] = []  # band keys of the listings in the buffer
+        self._segments: List[_Segment] = []
+
+    def __len__(self) -> int:
+        return self._n
+
+    def signatures(self, listings: Sequence[Listing]) -> np.ndarray:
+        """
+        Content and image signatures of listings, side by side
+        """
+        content, images = [], []
+        for listing in listings:
+            content_features, image_features = listing_features(listing)
+            content.append(_hashes(content_features))
+            images.append(_hashes(image_features))
+        split = self.content_perm
+        return np.hstack(
+            (
+                _minhash(content, self._a[:split], self._b[:split]),
+                _minhash(images, self._a[split:], self._b[split:]),
+            )
+        )
+
+    def _band_keys(self, signatures: np.ndarray) -> np.ndarray:
+        """
+        One 64-bit key per band, 0 for bands of empty signatures
+        """
+        n = len(signatures)
+        bands = self.content_bands + self.image_bands
+        rows = signatures.reshape(n, bands, self.rows).astype(np.uint64)
+        keys = np.zeros((n, bands), dtype=np.uint64)
+        for row in range(self.rows):
+            keys = keys * _MIX ^ rows[:, :, row]
+        keys ^= np.arange(1, bands + 1, dtype=np.uint64) * _BAND_SALT
+        keys |= np.uint64(1)  # never 0
+        split = self.content_perm
+        empty_content = (signatures[:, :split] == MAX_HASH).all(axis=1)
+        empty_images = (signatures[:, split:] == MAX_HASH).all(axis=1)
+        keys[empty_content, : self.content_bands] = 0
+        keys[empty_images, self.content_bands :] = 0
+        return keys
+
+    def _similarities(self, signature: np.ndarray, candidates: np.ndarray) -> Tuple[np.ndarray, ...]:
+        split = self.content_perm
+        equal = self._signatures[candidates] == signature
+        content = equal[:, :split].mean(axis=1)
+        images = equal[:, split:].mean(axis=1)
+        # Empty signatures are equal but say nothing
+        if (signature[:split] == MAX_HASH).all():
+            content[:] = 0
+        if (signature[split:] == MAX_HASH).all():
+            images[:] = 0
+        return content, images
+
+    def _grow(self, size: int) -> None:
+        capacity = len(self._parent)
+        if size <= capacity:
+            return
+        while capacity < size:
+            capacity *= 2
+        signatures = np.empty((capacity, self._signatures.shape[1]), dtype=np.uint32)
+        signatures[: self._n] = self._signatures[: self._n]
+        parent = np.empty(capacity, dtype=np.int64)
+        parent[: self._n] = self._parent[: self._n]
+        self._signatures, self._parent = signatures, parent
+
+    def find(self, listing_id: int) -> int:
+        """
+        Group of a listing: the first listing added of its duplicates
+        """
+        parent = self._parent
+        root = listing_id
+        while parent[root] != root:
+            root = parent[root]
+        while parent[listing_id] != root:
+            parent[listing_id], listing_id = root, parent[listing_id]
+        return int(root)
+
+    def _union(self, first: int, second: int) -> int:
+        first, second = self.find(first), self.find(second)
+        root = min(first, second)
+        self._parent[first] = self._parent[second] = root
+        return root
+
+    def _segment_candidates(self, keys: np.ndarray) -> List[np.ndarray]:
+        """
+        Listings of the segments sharing a band key with each row of `keys`, once each
+        """
+        flat = keys.ravel()
+        bands = keys.shape[1]
+        pairs = []
+        for segment in self._segments:
+            positions, ids = segment.lookup(flat)
+            pairs.append((positions // bands) << 32 | ids.astype(np.int64))
+        if not pairs:
+            return [np.zeros(0, dtype=np.int64)] * len(keys)
+        pairs = np.unique(np.concatenate(pairs))
+        bounds = np.searchsorted(pairs >> 32, np.arange(1, len(keys)))
+        return np.split(pairs & 0xFFFFFFFF, bounds)
+
+    def _buffer_candidates(self, band_keys: np.ndarray) -> set:
+        candidates = set()
+        for key in band_keys.tolist():
+            if key:
+                ids = self._buffer.get(key)
+                if ids:
+                    candidates.update(ids)
+        return candidates
+
+    def _check(self, signature: np.ndarray, ids: np.ndarray, buffered: set) -> List[Tuple[int, float]]:
+        """
+        The candidates, from the segments and the buffer, that are duplicates
+        """
+        if buffered:
+            ids = np.concatenate((ids, np.fromiter(buffered, dtype=np.int64, count=len(buffered))))
+        if not len(ids):
+            return []
+        if len(ids) > self.max_candidates:
+            ids = np.sort(ids)[-self.max_candidates :]
+        content, images = self._similarities(signature, ids)
+        duplicate = (content >= self.threshold) | (images >= self.image_threshold)
+        scores = np.maximum(content, images)
+        return sorted(
+            zip(ids[duplicate].tolist(), scores[duplicate].round(3).tolist()),
+            key=lambda match: (-match[1], match[0]),
+        )
+
+    def query(self, listings: Sequence[Listing]) -> List[List[Tuple[int, float]]]:
+        """
+        Duplicates already in the index of each listing, without adding them
+        """
+        signatures = self.signatures(listings)
+        keys = self._band_keys(signatures)
+        found = self._segment_candidates(keys)
+        return [
+            self._check(signature, candidates, self._buffer_candidates(band_keys))
+            for signature, band_keys, candidates in zip(signatures, keys, found)
+        ]
+
+    def add_many(
+        self,
+        listings: Iterable[Listing],
+        keys: Optional[Iterable[Optional[str]]] = None,
+        batch_size: int = 4096,
+    ) -> Iterator[DedupeResult]:
+        """
+        Add listings, yielding a DedupeResult for each in order. Listings of
+        the same batch are matched against each other too.
+
+        keys: a name kept for each listing (its URL...), defaults to the
+            source of JSONL records. There must be one per listing.
+        """
+        if keys is None:
+            pairs = zip(listings, repeat(None))
+        else:
+            pairs = _paired(listings, keys)
+        while True:
+            chunk = list(islice(pairs, batch_size))
+            if not chunk:
+                return
+            batch = [listing for listing, _ in chunk]
+            batch_keys = [key if key is not None else _source(listing) for listing, key in chunk]
+            yield from self._add_batch(batch, batch_keys)
+
+    def add(self, listing: Listing, key: Optional[str] = None) -> DedupeResult:
+        return next(self.add_many([listing], [key]))
+
+    def _add_batch(self, batch: List[Listing], batch_keys: List[Optional[str]]) -> Iterator[DedupeResult]:
+        signatures = self.signatures(batch)
+        band_keys = self._band_keys(signatures)
+        found = self._segment_candidates(band_keys)
+        self._grow(self._n + len(batch))
+        results = []
+        for signature, keys, candidates, key in zip(signatures, band_keys, found, batch_keys):
+            listing_id = self._n
+            matches = self._check(signature, candidates, self._buffer_candidates(keys))
+            self._signatures[listing_id] = signature
+            self._parent[listing_id] = listing_id
+            self._n += 1
+            self.keys.append(key)
+            for band_key in keys.tolist():
+                if band_key:
+                    self._buffer.setdefault(band_key, []).append(listing_id)
+            self._buffered.append((keys, listing_id))
+            group = listing_id
+            for match_id, _ in matches:
+                group = self._union(group, match_id)
+            results.append(DedupeResult(listing_id, group, matches))
+        # Between batches only: segments were looked up once for the whole batch
+        if len(self._buffered) >= self.flush_size:
+            self._flush()
+        return iter(results)
+
+    def _flush(self) -> None:
+        """
+        Move the buffered band keys to a sorted segment, merging segments of similar size
+        """
+        if not self._buffered:
+            return
+        keys = np.vstack([keys for keys, _ in self._buffered])
+        ids = np.repeat(
+            np.fromiter((i for _, i in self._buffered), dtype=np.uint32), keys.shape[1]
+        )
+        keys = keys.ravel()
+        used = keys != 0
+        self._segments.append(_Segment.build(keys[used], ids[used]))
+        self._buffer = {}
+        self._buffered = []
+        while len(self._segments) > 1 and len(self._segments[-2].keys) <= 2 * len(
+            self._segments[-1].keys
+        ):
+            last, before = self._segments.pop(), self._segments.pop()
+            self._segments.append(
+                _Segment.build(
+                    np.concatenate((before.keys, last.keys)),
+                    np.concatenate((before.ids, last.ids)),
+                )
+            )
+
+    def groups(self) -> np.ndarray:
+        """
+        Group of every listing, by id
+        """
+        return np.fromiter((self.find(i) for i in range(self._n)), dtype=np.int64, count=self._n)
+
+    def save(self, path) -> None:
+        """
+        Write the index to the directory `path` (created if needed)
+        """
+        os.makedirs(path, exist_ok=True)
+        self._flush()
+        keys = np.concatenate([segment.keys for segment in self._segments] or [np.zeros(0, np.uint64)])
+        ids = np.concatenate([segment.ids for segment in self._segments] or [np.zeros(0, np.uint32)])
+        self._segments = [_Segment.build(keys, ids)] if len(keys) else []
+        if self._segments:
+            keys, ids = self._segments[0]
+        np.save(os.path.join(path, "signatures.npy"), self._signatures[: self._n])
+        np.save(os.path.join(path, "groups.npy"), self.groups())
+        np.save(os.path.join(path, "band_keys.npy"), keys)
+        np.save(os.path.join(path, "band_ids.npy"), ids)
+        with open(os.path.join(path, "keys.jsonl"), "w", encoding="utf-8") as file:
+            for key in self.keys:
+                file.write(json.dumps(key, ensure_ascii=False) + "\n")
+        meta = {
+            "version": _FORMAT_VERSION,
+            "listings": self._n,
+            "threshold": self.threshold,
+            "image_threshold": self.image_threshold,
+            "content_bands": self.content_bands,
+            "image_bands": self.image_bands,
+            "rows": self.rows,
+            "seed": self.seed,
+        }
+        with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as file:
+            json.dump(meta, file, indent=2)
+
+    @classmethod
+    def load(cls, path, **kwargs) -> "DedupeIndex":
+        """
+        An index written by `save`, ready to take more listings. `kwargs`
+        override flush_size and max_candidates.
+        """
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as file:
+            meta = json.load(file)
+        if meta.get("version") != _FORMAT_VERSION:
+            raise ValueError(f"Unsupported dedupe index version: {meta.get('version')!r}")
+        index = cls(
+            threshold=meta["threshold"],
+            image_threshold=meta["image_threshold"],
+            content_bands=meta["content_bands"],
+            image_bands=meta["image_bands"],
+            rows=meta["rows"],
+            seed=meta["seed"],
+            **kwargs,
+        )
+        n = meta["listings"]
+        index._grow(n)
+        index._n = n
+        index._signatures[:n] = np.load(os.path.join(path, "signatures.npy"))
+        index._parent[:n] = np.load(os.path.join(path, "groups.npy"))
+        keys = np.load(os.path.join(path, "band_keys.npy"))
+        if len(keys):
+            index._segments = [_Segment(keys, np.load(os.path.join(path, "band_ids.npy")))]
+        with open(os.path.join(path, "keys.jsonl"), encoding="utf-8") as file:
+            index.keys = [json.loads(line) for line in file]
+        return index
@@ -0,0 +1,200 @@
+"""
+File: dedupe_benchmark.py
+Desc: Insert and lookup benchmark of the near-duplicate index over synthetic listings
+
+Usage:
+    python -m lovesoup.dedupe_benchmark 1000000
+    python -m lovesoup.dedupe_benchmark 20000 --duplicate-rate 0.3 --output dedupe.json
+"""
+
+import argparse
+import json
+import pathlib
+import random
+import sys
+import tempfile
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from lovesoup.benchmark import peak_rss_mb
+from lovesoup.dedupe import DedupeIndex
+from lovesoup.gazetteer import bare_name, default_gazetteer, fold
+
+_STREET_NAMES = (
+    "Nguyễn Trãi", "Lê Lợi", "Trần Hưng Đạo", "Hai Bà Trưng", "Lê Văn Lương", "Điện Biên Phủ",
+    "Võ Văn Kiệt", "Nguyễn Văn Cừ", "Phạm Văn Đồng", "Láng Hạ", "Lý Thường Kiệt", "Hoàng Diệu",
+    "Quang Trung", "Nguyễn Huệ", "Bạch Đằng", "Lê Duẩn", "Nguyễn Du", "Trường Chinh",
+    "Giải Phóng", "Kim Mã", "Xuân Thủy", "Cầu Giấy", "Tôn Đức Thắng", "Nguyễn Thị Minh Khai",
+    "Phan Đình Phùng", "Hùng Vương", "Lạc Long Quân", "Âu Cơ", "Nguyễn Văn Linh", "Lê Hồng Phong",
+    "Trần Phú", "Ngô Gia Tự", "Nguyễn Chí Thanh", "Tây Sơn", "Chùa Bộc", "Thái Hà",
+    "Hoàng Quốc Việt", "Phan Văn Trị", "Cộng Hòa", "Nam Kỳ Khởi Nghĩa",
+)
+
+
+def _address_text(parts: Tuple, style: int) -> str:
+    """
+    The same address the way different sites write it
+    """
+    house_no, street, ward, district, province = parts
+    if style == 0:
+        text = f"{house_no} Đường {street}, Phường {ward}, {district}, {province}"
+    elif style == 1:
+        district = district.replace("Quận ", "Q. ")
+        text = f"Số {house_no} {street}, P. {ward}, {district}, {bare_name(province)}"
+    else:
+        text = f"{house_no} {street}, Phuong {ward}, {district}, {bare_name(province)}"
+        text = fold(text).title()
+    # Reposts sometimes leave the house number out
+    return text.replace("Số  ", "").strip()
+
+
+def _listing(parts: Tuple, price: float, area: float, stems: List[str], style: int) -> Dict:
+    sizes = ("", "_600x400", "-thumb", "_1200x800")
+    return {
+        "address": {"full_address": _address_text(parts, style)},
+        "listing_price": f"{price / 1e9:.2f} tỷ".replace(".", ","),
+        "area": {"area": f"{area:g} m²"},
+        "images": [
+            f"https://cdn{style}.example.com/{stem}{sizes[style]}.jpg" for stem in stems
+        ],
+    }
+
+
+def synthetic_listings(
+    count: int, duplicate_rate: float = 0.2, seed: int = 0
+) -> Iterator[Tuple[Dict, int]]:
+    """
+    Yield (listing, property) for `count` listings over the bundled districts,
+    a `duplicate_rate` share of them reposting an earlier property: on the same
+    site (same images, rounded price and area) or on another one (another
+    address style, slightly different price, other images, house number
+    sometimes left out).
+    """
+    rng = random.Random(seed)
+    units = default_gazetteer().units
+    districts = [unit for unit in units if unit.level == 1]
+    # Most listings are in the two big cities
+    big = [
+        unit for unit in districts if units[unit.province].name.endswith(("Hà Nội", "Hồ Chí Minh"))
+    ]
+    originals: List[Tuple] = []
+    for i in range(count):
+        if originals and rng.random() < duplicate_rate:
+            # Reposts of recent properties, kept as a bounded sample
+            prop, parts, price, area, stems = originals[rng.randrange(len(originals))]
+            if rng.random() < 0.5:
+                style = 0
+                price = round(price / 1e7) * 1e7
+                area = round(area)
+            else:
+                style = rng.randrange(1, 3)
+                price *= 1 + rng.uniform(-0.02, 0.02)
+                stems = [f"{rng.getrandbits(64):016x}" for _ in stems]
+                if rng.random() < 0.3:
+                    parts = ("",) + parts[1:]
+            yield _listing(parts, price, area, stems, style), prop
+            continue
+        district = rng.choice(big) if rng.random() < 0.7 else rng.choice(districts)
+        ward = str(rng.randint(1, 20)) if rng.random() < 0.5 else rng.choice(_STREET_NAMES)
+        parts = (
+            str(rng.randint(1, 300)),
+            rng.choice(_STREET_NAMES),
+            ward,
+            district.name,
+            units[district.province].name,
+        )
+        price = 10 ** rng.uniform(8.7, 10.5)
+        area = round(10 ** rng.uniform(1.4, 2.5), 1)
+        stems = [f"{rng.getrandbits(64):016x}" for _ in range(rng.randint(3, 10))]
+        record = (i, parts, price, area, stems)
+        if len(originals) < 200_000:
+            originals.append(record)
+        else:
+            originals[rng.randrange(len(originals))] = record
+        yield _listing(parts, price, area, stems, 0), i
+
+
+def _pairs(labels) -> int:
+    counts = np.unique(labels, return_counts=True, axis=0)[1].astype(np.int64)
+    return int((counts * (counts - 1) // 2).sum())
+
+
+def _percentile(values: List[float], q: float) -> float:
+    return float(np.percentile(values, q, method="nearest")) if values else 0.0
+
+
+def bench_dedupe(count: int, duplicate_rate: float = 0.2, queries: int = 1000, seed: int = 0) -> Dict:
+    """
+    Build a DedupeIndex over `count` synthetic listings, then time single
+    lookups, a save and a load. Precision and recall are over pairs of
+    listings of the same property.
+    """
+    index = DedupeIndex()
+    truth = np.empty(count, dtype=np.int64)
+    started = time.perf_counter()
+    listings = synthetic_listings(count, duplicate_rate, seed)
+
+    def unlabelled():
+        for i, (listing, prop) in enumerate(listings):
+            truth[i] = prop
+            yield listing
+
+    for _ in index.add_many(unlabelled()):
+        pass
+    insert_s = time.perf_counter() - started
+
+    groups = index.groups()
+    predicted, actual = _pairs(groups), _pairs(truth)
+    found = _pairs(np.stack((groups, truth), axis=1))
+
+    sample = [listing for listing, _ in synthetic_listings(queries, duplicate_rate, seed + 1)]
+    latencies = []
+    for listing in sample:
+        started = time.perf_counter()
+        index.query([listing])
+        latencies.append(time.perf_counter() - started)
+
+    with tempfile.TemporaryDirectory() as path:
+        started = time.perf_counter()
+        index.save(path)
+        save_s = time.perf_counter() - started
+        disk = sum(f.stat().st_size for f in pathlib.Path(path).iterdir())
+        started = time.perf_counter()
+        DedupeIndex.load(path)
+        load_s = time.perf_counter() - started
+
+    return {
+        "listings": count,
+        "inserts_per_sec": round(count / insert_s, 1),
+        "query_p50_ms": round(_percentile(latencies, 50) * 1000, 3),
+        "query_p99_ms": round(_percentile(latencies, 99) * 1000, 3),
+        "precision": round(found / predicted, 4) if predicted else 1.0,
+        "recall": round(found / actual, 4) if actual else 1.0,
+        "save_s": round(save_s, 2),
+        "load_s": round(load_s, 2),
+        "disk_mb": round(disk / 2**20, 1),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[2])
+    parser.add_argument("listings", type=int, help="listings to add to the index")
+    parser.add_argument("--duplicate-rate", type=float, default=0.2, help="share of reposts")
+    parser.add_argument("--queries", type=int, default=1000, help="single lookups to time")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=pathlib.Path, help="write results as JSON")
+    args = parser.parse_args(argv)
+
+    report = bench_dedupe(args.listings, args.duplicate_rate, args.queries, args.seed)
+    for name, value in report.items():
+        print(f"{name:<16} {value}")
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
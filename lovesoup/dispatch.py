@@ -0,0 +1,139 @@
+"""
+File: dispatch.py
+Desc: Pick the right cook for a page from its URL or a cheap fingerprint of its HTML
+
+Detection never parses the page. In order it tries:
+    1. the domain of the URL, when one is given;
+    2. the canonical link / og:url / og:site_name found in the head of the page;
+    3. site-specific marker strings (class names, CDN hosts) in the first
+       MARKER_SIZE characters, earliest one wins.
+"""
+
+import re
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+from lovesoup import cooks
+from lovesoup.cooks import get_cook
+from lovesoup.general_extractor import DataExtractor
+
+# Registered domain -> template name
+SITE_DOMAINS = {
+    "batdongsan.com.vn": "batdongsancomvn",
+    "mogi.vn": "mogi",
+    "cenhomes.vn": "cenhomes",
+    "bds123.vn": "bds123vn",
+    "muaban.net": "muabannet",
+    "nhatot.com": "nhatot",
+}
+
+# Strings that only show up in pages of one site
+SITE_MARKERS = {
+    "batdongsancomvn": ("js__pr-title", "re__pr-", "batdongsan.com.vn"),
+    "mogi": ("mogi.vn",),
+    "cenhomes": ("cenhomes.vn",),
+    "bds123vn": ("bds123.vn", "static123.com"),
+    "muabannet": ("muaban.net",),
+    "nhatot": ("nhatot.com", "chotot.com"),
+}
+
+HEAD_SIZE = 16 * 1024
+# Markers sit in the head or the top of the body: a page without any there
+# is not scanned to its end
+MARKER_SIZE = 64 * 1024
+
+_CANONICAL = re.compile(
+    r"<link\b[^>]*\brel\s*=\s*[\"']?canonical[\"']?[^>]*>", re.IGNORECASE
+)
+_OG_META = re.compile(
+    r"<meta\b[^>]*\bproperty\s*=\s*[\"']?og:(?:url|site_name)[\"']?[^>]*>", re.IGNORECASE
+)
+_HREF = re.compile(r"\bhref\s*=\s*[\"']?([^\"'\s>]+)", re.IGNORECASE)
+_CONTENT = re.compile(r"\bcontent\s*=\s*[\"']([^\"']*)", re.IGNORECASE)
+
+
+class UnknownSiteError(ValueError):
+    pass
+
+
+def site_from_url(url: str) -> Optional[str]:
+    """
+    Template name for a URL (or a bare host name), None when the domain is unknown
+    """
+    host = urlsplit(url if "//" in url else f"//{url}").hostname or ""
+    for domain, site in SITE_DOMAINS.items():
+        if host == domain or host.endswith(f".{domain}"):
+            return site
+    return None
+
+
+def _site_from_head(head: str) -> Optional[str]:
+    for tag in _CANONICAL.findall(head):
+        href = _HREF.search(tag)
+        if href and site_from_url(href.group(1)):
+            return site_from_url(href.group(1))
+    for tag in _OG_META.findall(head):
+        content = _CONTENT.search(tag)
+        if content and site_from_url(content.group(1).strip()):
+            return site_from_url(content.group(1).strip())
+    return None
+
+
+def _site_from_markers(html: str) -> Optional[str]:
+    best: Tuple[int, Optional[str]] = (min(len(html), MARKER_SIZE), None)
+    for site, markers in SITE_MARKERS.items():
+        for marker in markers:
+            position = html.find(marker, 0, best[0])
+            if position != -1:
+                best = (position, site)
+    return best[1]
+
+
+def detect_site(html: Optional[str] = None, url: Optional[str] = None) -> Optional[str]:
+    """
+    Template name of the site a page comes from, or None when it can't be told
+    """
+    if url:
+        site = site_from_url(url)
+        if site:
+            return site
+    if html:
+        return _site_from_head(html[:HEAD_SIZE]) or _site_from_markers(html)
+    return None
+
+
+class Dispatcher:
+    """
+    Keeps one warm extractor per site and routes every page to the right one.
+    Keyword arguments are passed to every extractor (e.g. instrumentation).
+    """
+
+    def __init__(self, **extractor_kwargs):
+        self.extractors: Dict[str, DataExtractor] = {}
+        for cook_cls in cooks.ALL_COOKS:
+            extractor = cook_cls(**extractor_kwargs)
+            self.extractors[extractor.template] = extractor
+
+    def extractor_for(
+        self, html: Optional[str] = None, url: Optional[str] = None, site=None
+    ) -> DataExtractor:
+        if site is not None:
+            cook_cls = get_cook(site)
+            for extractor in self.extractors.values():
+                if type(extractor) is cook_cls:
+                    return extractor
+            raise UnknownSiteError(f"No extractor for site {site!r}")
+        detected = detect_site(html, url)
+        if detected is None:
+            raise UnknownSiteError(f"Can't tell which site this page comes from (url={url!r})")
+        return self.extractors[detected]
+
+    def run_html(self, html_content: str, url: Optional[str] = None, site=None, **kwargs):
+        return self.extractor_for(html_content, url, site).run_html(html_content, **kwargs)
+
+    def run(self, source_path: str, url: Optional[str] = None, site=None, **kwargs):
+        if site is None and (url is None or site_from_url(url) is None):
+            # Only the page itself can tell
+            with open(source_path, "r", encoding="utf-8") as file:
+                return self.run_html(file.read(), url, **kwargs)
+        return self.extractor_for(url=url, site=site).run(source_path, **kwargs)
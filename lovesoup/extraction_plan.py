@@ -0,0 +1,325 @@
+"""
+File: extraction_plan.py
+Desc: Compiled execution plan for selectorlib templates.
+
+A template is compiled once: every CSS selector is translated to XPath and
+compiled by lxml up front. A page is then parsed once and the whole template
+is evaluated on that single tree. Top-level selectors that start with the same
+compound selector (e.g. all the `div.main-info ...` keys of mogi.yaml) share
+one query for that prefix and only search inside its match.
+
+The output is the same as `selectorlib.Extractor.extract` for the same template.
+
+A plan can be saved with `to_dict` and loaded back with `from_dict`, which only
+compiles the stored XPath expressions: parsel and cssselect are then not even
+imported.
+"""
+
+import inspect
+import re
+from typing import Dict, Iterable, List, Optional, Union
+
+import lxml.html
+from lxml import etree
+
+# Same XPath namespaces parsel uses for HTML documents
+_NAMESPACES = {
+    "re": "http://exslt.org/regular-expressions",
+    "set": "http://exslt.org/sets",
+}
+
+_TEXT_NODES = etree.XPath(".//text()", smart_strings=False)
+_LINKS = etree.XPath(".//@href", smart_strings=False)
+
+_ITEM_TYPES = ("Text", "Link", "HTML", "Attribute", "Image")
+
+# Only plain descendant chains like "div.main-info div.price" are split into prefix/suffix
+_UNSPLITTABLE = re.compile(r"[,>+~]|[\[(][^\])]*\s")
+
+
+_TRANSLATOR = None
+
+
+def _css_to_xpath(css: str, prefix: str = "descendant-or-self::") -> str:
+    # Same translator parsel uses, only imported when a template is compiled from CSS
+    global _TRANSLATOR
+    if _TRANSLATOR is None:
+        from parsel.csstranslator import HTMLTranslator
+
+        _TRANSLATOR = HTMLTranslator()
+    return _TRANSLATOR.css_to_xpath(css, prefix=prefix)
+
+
+def _compile(xpath: str) -> etree.XPath:
+    return etree.XPath(xpath, namespaces=_NAMESPACES, smart_strings=False)
+
+
+def _as_list(result) -> List:
+    return result if isinstance(result, list) else [result]
+
+
+def split_descendant_chain(css: str) -> Optional[List[str]]:
+    """
+    Split a CSS selector made only of descendant combinators into its compound
+    selectors. Returns None when the selector uses anything else.
+    """
+    if _UNSPLITTABLE.search(css):
+        return None
+    parts = css.split()
+    return parts if len(parts) > 1 else None
+
+
+def extract_text(node) -> str:
+    if isinstance(node, str):
+        return node.strip()
+    return " ".join(t.strip() for t in _TEXT_NODES(node) if t.strip())
+
+
+class SelectorPlan:
+    """
+    One compiled selector of a template, with its compiled children
+    """
+
+    __slots__ = (
+        "name",
+        "xpath",
+        "select_self",
+        "multiple",
+        "item_type",
+        "attribute",
+        "formatter",
+        "children",
+        "prefix",
+        "suffix_xpath",
+    )
+
+    def __init__(self, name: str, config: Dict, formatters: Dict, top_level=False):
+        self.name = name
+        self.multiple = config.get("multiple") is True
+        self.item_type = config.get("type", "Text")
+        self.attribute = config.get("attribute")
+        self.formatter = formatters[config["format"]] if "format" in config else None
+        self.prefix = None
+        self.suffix_xpath = None
+        self.select_self = False
+        self.xpath = None
+
+        if "children" in config:
+            self.children = [
+                SelectorPlan(child_name, child_config, formatters)
+                for child_name, child_config in config["children"].items()
+            ]
+        else:
+            self.children = None
+            if self.item_type not in _ITEM_TYPES:
+                raise ValueError(f"Unknown type {self.item_type!r} for {name!r}")
+
+        if config.get("xpath") is not None:
+            self.xpath = _compile(config["xpath"])
+        elif config["css"] == "":
+            self.select_self = True
+        else:
+            self.xpath = _compile(self._first_only(_css_to_xpath(config["css"])))
+            chain = split_descendant_chain(config["css"]) if top_level else None
+            if chain:
+                self.prefix = chain[0]
+                self.suffix_xpath = _compile(
+                    self._first_only(
+                        _css_to_xpath(" ".join(chain[1:]), prefix="descendant::")
+                    )
+                )
+
+    def to_dict(self) -> Dict:
+        return {
+            "name": self.name,
+            "multiple": self.multiple,
+            "type": self.item_type,
+            "attribute": self.attribute,
+            "format": self.formatter.name if self.formatter else None,
+            "select_self": self.select_self,
+            "xpath": self.xpath.path if self.xpath is not None else None,
+            "prefix": self.prefix,
+            "suffix_xpath": self.suffix_xpath.path if self.suffix_xpath is not None else None,
+            "children": None if self.children is None else [c.to_dict() for c in self.children],
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict, formatters: Dict) -> "SelectorPlan":
+        plan = cls.__new__(cls)
+        plan.name = data["name"]
+        plan.multiple = data["multiple"]
+        plan.item_type = data["type"]
+        plan.attribute = data["attribute"]
+        plan.formatter = formatters[data["format"]] if data["format"] else None
+        plan.select_self = data["select_self"]
+        plan.xpath = _compile(data["xpath"]) if data["xpath"] is not None else None
+        plan.prefix = data["prefix"]
+        plan.suffix_xpath = (
+            _compile(data["suffix_xpath"]) if data["suffix_xpath"] is not None else None
+        )
+        plan.children = (
+            None
+            if data["children"] is None
+            else [cls.from_dict(child, formatters) for child in data["children"]]
+        )
+        return plan
+
+    def _first_only(self, xpath: str) -> str:
+        # Single-value selectors only ever use the first match
+        return xpath if self.multiple else f"({xpath})[1]"
+
+    def select(self, node, prefix_hits: Optional[Dict] = None) -> List:
+        if self.select_self:
+            return [node]
+        if self.prefix is not None and prefix_hits is not None:
+            hits = prefix_hits.get(self.prefix)
+            if hits is not None and len(hits) <= 1:
+                return _as_list(self.suffix_xpath(hits[0])) if hits else []
+        return _as_list(self.xpath(node))
+
+    def evaluate(self, node, prefix_hits: Optional[Dict] = None):
+        elements = self.select(node, prefix_hits)
+        if not elements:
+            return None
+        if not self.multiple:
+            return self.value(elements[0])
+        return [self.value(element) for element in elements]
+
+    def blank(self):
+        """
+        Placeholder for a selector that was not evaluated
+        """
+        if self.multiple:
+            return []
+        if self.children is not None:
+            return {}
+        return ""
+
+    def value(self, element):
+        if self.children is not None:
+            return {child.name: child.evaluate(element) for child in self.children}
+
+        item_type = self.item_type
+        if item_type == "Text":
+            content = extract_text(element)
+        elif isinstance(element, str):
+            content = element if item_type == "HTML" else None
+        elif item_type == "Link":
+            links = _LINKS(element)
+            content = links[0] if links else None
+        elif item_type == "HTML":
+            content = etree.tostring(
+                element, method="html", encoding="unicode", with_tail=False
+            )
+        elif item_type == "Attribute":
+            content = element.get(self.attribute)
+        else:  # Image
+            content = element.get("src")
+
+        if self.formatter:
+            content = self.formatter.format(content)
+        return content
+
+
+class ExtractionPlan:
+    """
+    Compiled form of a whole selectorlib template config
+    """
+
+    def __init__(self, config: Dict, formatters: Iterable = ()):
+        formatters_by_name = self._formatters_by_name(formatters)
+
+        self.selectors = [
+            SelectorPlan(name, selector_config, formatters_by_name, top_level=True)
+            for name, selector_config in config.items()
+        ]
+        self.keys = [s.name for s in self.selectors]
+
+        # Prefixes worth sharing: used by at least two top-level selectors
+        counts = {}
+        for selector in self.selectors:
+            if selector.prefix is not None:
+                counts[selector.prefix] = counts.get(selector.prefix, 0) + 1
+        self.prefixes = {
+            prefix: _compile(_css_to_xpath(prefix))
+            for prefix, count in counts.items()
+            if count > 1
+        }
+        for selector in self.selectors:
+            if selector.prefix is not None and selector.prefix not in self.prefixes:
+                selector.prefix = None
+                selector.suffix_xpath = None
+
+    @staticmethod
+    def _formatters_by_name(formatters: Iterable) -> Dict:
+        formatters = [f() if inspect.isclass(f) else f for f in formatters]
+        return {f.name: f for f in formatters}
+
+    def to_dict(self) -> Dict:
+        """
+        JSON-serializable form of the compiled plan, see `from_dict`
+        """
+        return {
+            "selectors": [selector.to_dict() for selector in self.selectors],
+            "prefixes": {prefix: xpath.path for prefix, xpath in self.prefixes.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict, formatters: Iterable = ()) -> "ExtractionPlan":
+        formatters_by_name = cls._formatters_by_name(formatters)
+        plan = cls.__new__(cls)
+        plan.selectors = [
+            SelectorPlan.from_dict(selector, formatters_by_name)
+            for selector in data["selectors"]
+        ]
+        plan.keys = [s.name for s in plan.selectors]
+        plan.prefixes = {prefix: _compile(xpath) for prefix, xpath in data["prefixes"].items()}
+        return plan
+
+    @staticmethod
+    def parse(html: Union[str, bytes], base_url: Optional[str] = None):
+        """
+        Parse a page the same way parsel (and so selectorlib) does for text
+        input. The page may also be given as UTF-8 bytes, which saves decoding it.
+        """
+        if isinstance(html, str):
+            html = html.strip().replace("\x00", "").encode("utf-8")
+        else:
+            html = html.strip().replace(b"\x00", b"")
+        body = html or b"<html/>"
+        parser = lxml.html.HTMLParser(recover=True, encoding="utf-8", huge_tree=True)
+        root = etree.fromstring(body, parser=parser, base_url=base_url)
+        if root is None:
+            root = etree.fromstring(b"<html/>", parser=parser, base_url=base_url)
+        if base_url:
+            root.make_links_absolute()
+        return root
+
+    def evaluate(self, root, keys: Optional[Iterable[str]] = None) -> Dict:
+        """
+        Evaluate the template (or only `keys` of it) on an already parsed page
+        """
+        if keys is not None:
+            keys = set(keys)
+        prefix_hits = {}
+        for prefix, xpath in self.prefixes.items():
+            prefix_hits[prefix] = xpath(root) if self._needed(prefix, keys) else None
+
+        fields_data = {}
+        for selector in self.selectors:
+            if keys is None or selector.name in keys:
+                fields_data[selector.name] = selector.evaluate(root, prefix_hits)
+        return fields_data
+
+    def _needed(self, prefix: str, keys: Optional[Iterable[str]]) -> bool:
+        if keys is None:
+            return True
+        return any(s.prefix == prefix and s.name in keys for s in self.selectors)
+
+    def extract(
+        self,
+        html: Union[str, bytes],
+        base_url: Optional[str] = None,
+        keys: Optional[Iterable[str]] = None,
+    ) -> Dict:
+        return self.evaluate(self.parse(html, base_url), keys)
@@ -0,0 +1,138 @@
+"""
+File: features.py
+Desc: Title -> value lookup over the feature lists of a page
+
+Sites list most of their details as (title, value) pairs: "Diện tích: 85 m²",
+"Ngày đăng: 22/10/2024"... Each cook declares which title of which list
+gives which value, and every list is indexed once per page:
+
+    FEATURE_MAP = {
+        "area": ("features", "Diện tích"),
+        "publish_date": ("ad_info", "Ngày đăng"),
+    }
+
+Titles are compared after normalization (NFC, non-breaking spaces, repeated
+whitespace, trailing colon), so "Diện tích:" and "Diện tích\xa0" match "Diện tích".
+"""
+
+import unicodedata
+from functools import lru_cache
+from operator import attrgetter
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+FeatureMap = Dict[str, Tuple[str, str]]
+
+_TITLE = attrgetter("title")
+_VALUE = attrgetter("value")
+
+
+@lru_cache(maxsize=4096)
+def normalize_title(title: Optional[str]) -> str:
+    if not title:
+        return ""
+    title = unicodedata.normalize("NFC", title).replace("\xa0", " ")
+    return " ".join(title.split()).rstrip(":").rstrip()
+
+
+def _sequence_pair(feature) -> Optional[Tuple[Any, Any]]:
+    if isinstance(feature, (list, tuple)) and len(feature) >= 2:
+        return feature[0], feature[1]
+    return None
+
+
+def _dict_pair(feature: Dict) -> Optional[Tuple[Any, Any]]:
+    if "item" in feature:
+        return _sequence_pair(feature["item"])
+    return feature.get("title"), feature.get("value")
+
+
+def _item_pair(feature) -> Optional[Tuple[Any, Any]]:
+    return _sequence_pair(feature.item)
+
+
+def _title_pair(feature) -> Tuple[Any, Any]:
+    return feature.title, getattr(feature, "value", None)
+
+
+def _any_pair(feature) -> Optional[Tuple[Any, Any]]:
+    if hasattr(feature, "item"):
+        return _item_pair(feature)
+    if hasattr(feature, "title"):
+        return _title_pair(feature)
+    return _sequence_pair(feature)
+
+
+@lru_cache(maxsize=None)
+def _pair_getter(cls: type) -> Callable[[Any], Optional[Tuple[Any, Any]]]:
+    # Looked up once per class: hasattr() is slow on pydantic models
+    # when the attribute is missing
+    if issubclass(cls, dict):
+        return _dict_pair
+    if issubclass(cls, (list, tuple)):
+        return _sequence_pair
+    fields = getattr(cls, "model_fields", None)
+    if fields is None:
+        return _any_pair
+    if "item" in fields:
+        return _item_pair
+    if "title" in fields:
+        return _title_pair
+    return _sequence_pair
+
+
+def feature_pair(feature: Any) -> Optional[Tuple[Any, Any]]:
+    """
+    (title, value) of a feature, whatever its shape in the precook model:
+    an object or dict with title/value, an object or dict with an `item`
+    list, or a plain [title, value] list
+    """
+    return _pair_getter(type(feature))(feature)
+
+
+class FeatureIndex:
+    """
+    Values of a feature list by normalized title. When a title shows up
+    more than once, the first value wins.
+    """
+
+    __slots__ = ("values",)
+
+    def __init__(self, features: Optional[Iterable] = None):
+        # Built backwards so that the first value of a title wins
+        features = list(features or ())[::-1]
+        self.values: Dict[str, Any] = {}
+        if features and _pair_getter(type(features[-1])) is _title_pair:
+            # The usual case, a list of one precook model: read it column-wise
+            try:
+                titles = map(normalize_title, map(_TITLE, features))
+                self.values = dict(zip(titles, map(_VALUE, features)))
+                return
+            except AttributeError:
+                pass
+        for pair in map(feature_pair, features):
+            if pair is not None:
+                self.values[normalize_title(pair[0])] = pair[1]
+
+    def get(self, title: str, default: Any = "") -> Any:
+        return self.values.get(normalize_title(title), default)
+
+    def __contains__(self, title: str) -> bool:
+        return normalize_title(title) in self.values
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+
+def resolve_features(feature_map: FeatureMap, source: Any, default: Any = "") -> Dict[str, Any]:
+    """
+    Look every entry of `feature_map` up in the feature lists of `source`
+    (a precook model), indexing each list once
+    """
+    indexes: Dict[str, FeatureIndex] = {}
+    resolved = {}
+    for name, (attribute, title) in feature_map.items():
+        index = indexes.get(attribute)
+        if index is None:
+            index = indexes[attribute] = FeatureIndex(getattr(source, attribute, None))
+        resolved[name] = index.get(title, default)
+    return resolved
@@ -0,0 +1,556 @@
+"""
+File: gazetteer.py
+Desc: Split free-text Vietnamese addresses into Address fields with a gazetteer
+
+Most sites give the address as one string:
+
+    "15, Đường Nhật Chiêu, Phường Nhật Tân, Quận Tây Hồ, Hà Nội"
+
+`Gazetteer.split` turns it into house number, alley, street, ward, district
+and province. Names are matched in a token trie built once from the bundled
+list of administrative units (`data/vn_admin_units.csv`: the 63 provinces and
+their districts as of 2024, before the 2025 reorganization), with or without
+accents and with or without their prefix ("Quận Tây Hồ", "Q. Tây Hồ", "Tay Ho").
+The province is looked for from the end of the address, then a district of
+that province before it, then a ward of that district. Parts the dataset
+doesn't list (wards, most of the time) are taken from their prefix
+("Phường"/"P.", "Xã", "Thị trấn"/"TT."...). Streets, alleys and house
+numbers are told by their prefix or their position before the ward.
+
+A dataset listing wards can be loaded with `Gazetteer.from_csv`, same columns
+as the bundled one (province, district, ward). Results are memoized per
+address string.
+"""
+
+import csv
+import io
+import re
+import unicodedata
+from functools import lru_cache
+from importlib import resources
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from lovesoup.property_models import Address
+
+PROVINCE, DISTRICT, WARD = range(3)
+
+# Type words of the unit names, longest first
+_TYPE_WORDS = ("Thành phố ", "Thị trấn ", "Thị xã ", "Phường ", "Huyện ", "Quận ", "Tỉnh ", "Xã ")
+
+# Folded prefixes, at each level, and how they are written out
+_WRITTEN = {
+    PROVINCE: {
+        ("tinh",): "Tỉnh",
+        ("thanh", "pho"): "Thành phố",
+        ("tp",): "Thành phố",
+    },
+    DISTRICT: {
+        ("quan",): "Quận",
+        ("q",): "Quận",
+        ("huyen",): "Huyện",
+        ("h",): "Huyện",
+        ("thi", "xa"): "Thị xã",
+        ("tx",): "Thị xã",
+        ("thanh", "pho"): "Thành phố",
+        ("tp",): "Thành phố",
+    },
+    WARD: {
+        ("phuong",): "Phường",
+        ("p",): "Phường",
+        ("xa",): "Xã",
+        ("thi", "tran"): "Thị trấn",
+        ("tt",): "Thị trấn",
+    },
+}
+
+# Other ways listings name a province
+PROVINCE_ALIASES = {
+    "Thành phố Hồ Chí Minh": ("tphcm", "tp hcm", "hcm", "sai gon", "saigon"),
+    "Thành phố Hà Nội": ("tphn", "tp hn"),
+    "Tỉnh Bà Rịa - Vũng Tàu": ("brvt", "ba ria vung tau"),
+    "Tỉnh Thừa Thiên Huế": ("tt hue", "thua thien hue"),
+    "Tỉnh Đắk Lắk": ("daklak", "dac lac"),
+    "Tỉnh Đắk Nông": ("daknong", "dac nong"),
+}
+
+# Parts that are neither a street nor an address: projects, labels...
+_NOT_STREET = frozenset({"du", "khu", "kdt", "chung", "toa", "dia", "can", "lo", "duan"})
+
+_HOUSE_NO = re.compile(r"\s*(?:[Ss]ố\s*)?(\d+[A-Za-z]?(?:[/-]\d+[A-Za-z]?)*)(?=[\s,.]|$)[\s.]*")
+_TOKEN = re.compile(r"[a-z]+|[0-9]+|[,;:|()\n]")
+_SEPARATORS = frozenset(",;:|()\n")
+_TRIM = " \t.-–"
+
+_END = ""  # trie key holding the units a pattern ends on
+
+Prefixes = Dict[Tuple[str, ...], Tuple[str, Tuple[str, ...]]]
+
+
+def _folding_table() -> Dict[int, str]:
+    """
+    One character for one, so that positions in the folded text are positions in the text
+    """
+    table = {ord(c): c.lower() for c in "ABCDEFGHIJKLMNOPQRSTUVWXYZ"}
+    table[ord("đ")] = table[ord("Đ")] = "d"
+    for code in range(0xC0, 0x1F00):
+        base = unicodedata.normalize("NFD", chr(code))[0]
+        if base.isascii() and base.isalpha():
+            table[code] = base.lower()
+    for code in range(0x300, 0x370):
+        table[code] = " "  # stray combining marks
+    return table
+
+
+_FOLD = _folding_table()
+
+
+def fold(text: str) -> str:
+    """
+    Lowercase, no accents, same length: "Phường Đại Kim" -> "phuong dai kim"
+    """
+    if not unicodedata.is_normalized("NFC", text):
+        text = unicodedata.normalize("NFC", text)
+    return text.translate(_FOLD)
+
+
+def _tokens(text: str) -> Tuple[str, ...]:
+    return tuple(token for token in _TOKEN.findall(fold(text)) if token not in _SEPARATORS)
+
+
+def _prefixes(written: Dict[Tuple[str, ...], str]) -> Prefixes:
+    """
+    Folded prefix -> (written-out prefix, prefix as written with accents).
+    Abbreviations are written the same way with or without accents.
+    """
+    table = {}
+    for folded, word in written.items():
+        accented = tuple(word.lower().split()) if _tokens(word) == folded else folded
+        table[folded] = (word, accented)
+    return table
+
+
+_PREFIXES = {level: _prefixes(written) for level, written in _WRITTEN.items()}
+_STREET = _prefixes({("duong",): "Đường", ("d",): "Đường", ("pho",): "Phố"})
+_ALLEY = _prefixes({("ngo",): "Ngõ", ("ngach",): "Ngách", ("hem",): "Hẻm", ("kiet",): "Kiệt"})
+
+
+def bare_name(name: str) -> str:
+    """
+    A unit name without its type word: "Quận Tây Hồ" -> "Tây Hồ"
+    """
+    for word in _TYPE_WORDS:
+        if name.startswith(word):
+            return name[len(word) :]
+    return name
+
+
+class AdminUnit(NamedTuple):
+    level: int
+    name: str
+    parent: Optional[int]  # index of the unit it belongs to
+    province: int  # index of its province
+
+
+class AddressParts(NamedTuple):
+    house_no: Optional[str] = None
+    alley: Optional[str] = None
+    street: Optional[str] = None
+    ward: Optional[str] = None
+    district: Optional[str] = None
+    province: Optional[str] = None
+
+
+class _Match(NamedTuple):
+    start: int  # token positions
+    end: int
+    units: Tuple[int, ...]
+    # Bare names not filling their part: only trusted right before the unit
+    # they belong to, when they start the part ("Tây Hồ Hà Nội") or come
+    # right after a ward of theirs ("Đại Kim Hoàng Mai Hà Nội"), see `_pick`
+    weak: Tuple[int, ...] = ()
+    first: bool = False  # starts its part
+
+
+class _Token(NamedTuple):
+    text: str  # folded
+    start: int  # characters in the address
+    end: int
+    segment: int
+
+
+class Gazetteer:
+    """
+    Administrative units and the trie matching their names in addresses
+    """
+
+    def __init__(self, rows: Iterable[Tuple[str, str, str]], cache_size: int = 65536):
+        """
+        Args:
+            rows: (province, district, ward) full names, district and ward may be empty.
+                Where a name is ambiguous, units listed first win.
+            cache_size: number of addresses whose split is kept.
+        """
+        self.units: List[AdminUnit] = []
+        self._index: Dict[Tuple[int, Optional[int], str], int] = {}
+        for province, district, ward in rows:
+            unit = self._add(PROVINCE, province, None)
+            if district:
+                unit = self._add(DISTRICT, district, unit)
+                if ward:
+                    self._add(WARD, ward, unit)
+        self.has_wards = any(unit.level == WARD for unit in self.units)
+        self._trie: Dict = {}
+        # Units whose own type the prefix names come first: "TX Hoàng Mai" is
+        # Thị xã Hoàng Mai before Quận Hoàng Mai
+        for own_type in (True, False):
+            for i, unit in enumerate(self.units):
+                bare_text = bare_name(unit.name)
+                own_word = unit.name[: len(unit.name) - len(bare_text)].strip()
+                bare = _tokens(bare_text)
+                for prefix, (word, _) in _PREFIXES[unit.level].items():
+                    if (word == own_word) == own_type:
+                        self._insert(prefix + bare, i, strong=True)
+                if not own_type:
+                    continue
+                if not bare[0].isdigit():
+                    # "Quận 7" has to say "Quận", a bare "7" is a house number
+                    self._insert(bare, i, strong=False)
+                if unit.level == PROVINCE:
+                    for alias in PROVINCE_ALIASES.get(unit.name, ()):
+                        self._insert(_tokens(alias), i, strong=True)
+        self.split = lru_cache(maxsize=cache_size)(self._split)
+
+    @classmethod
+    def from_csv(cls, path, **kwargs) -> "Gazetteer":
+        with open(path, newline="", encoding="utf-8") as file:
+            return cls(_read_rows(file), **kwargs)
+
+    def _add(self, level: int, name: str, parent: Optional[int]) -> int:
+        name = " ".join(unicodedata.normalize("NFC", name).split())
+        key = (level, parent, name)
+        index = self._index.get(key)
+        if index is None:
+            index = len(self.units)
+            province = index if parent is None else self.units[parent].province
+            self.units.append(AdminUnit(level, name, parent, province))
+            self._index[key] = index
+        return index
+
+    def _insert(self, tokens: Tuple[str, ...], unit: int, strong: bool) -> None:
+        node = self._trie
+        for token in tokens:
+            node = node.setdefault(token, {})
+        # Weak (bare) names are only trusted when they make a whole part of the address
+        units = node.setdefault(_END, ([], []))[0 if strong else 1]
+        if unit not in units:
+            units.append(unit)
+
+    def _matches(self, tokens: List[_Token], seg_bounds: List[Tuple[int, int]]) -> List[_Match]:
+        """
+        Longest unit name starting at every token
+        """
+        matches = []
+        last = len(tokens)
+        for i in range(last):
+            node = self._trie
+            found = None
+            j = i
+            while j < last:
+                node = node.get(tokens[j].text)
+                if node is None:
+                    break
+                j += 1
+                if _END in node:
+                    found = (j, node[_END])
+            if found is None:
+                continue
+            end, (strong, weak) = found
+            units = list(strong)
+            if weak:
+                if seg_bounds[tokens[i].segment] == (i, end):
+                    units += [unit for unit in weak if unit not in units]
+                elif end == last:
+                    # "... Quận 7 Hồ Chí Minh": a province closing the address
+                    units += [u for u in weak if self.units[u].level == PROVINCE and u not in units]
+            pending = tuple(unit for unit in weak if unit not in units)
+            if units or pending:
+                first = seg_bounds[tokens[i].segment][0] == i
+                matches.append(_Match(i, end, tuple(units), pending, first))
+        # Right to left in `_pick`, the longest of the names ending on the same token first
+        matches.sort(key=lambda match: (match.end, -match.start))
+        return matches
+
+    def _pick(
+        self,
+        matches: List[_Match],
+        level: int,
+        before: int,
+        parent: Optional[int],
+        parent_found: bool = False,
+    ) -> Optional[Tuple[_Match, int]]:
+        """
+        Rightmost match ending before token `before` naming a unit of `level`
+        (belonging to `parent` when given). With `parent_found`, the parent
+        was found at `before`, and a bare name running up to it counts too.
+        """
+        for match in reversed(matches):
+            if match.end > before:
+                continue
+            units = match.units
+            if parent_found and match.end == before:
+                units += tuple(unit for unit in match.weak if self._leads(matches, match, unit))
+            for unit in units:
+                candidate = self.units[unit]
+                if candidate.level == level and (parent is None or candidate.parent == parent):
+                    return match, unit
+        return None
+
+    def _leads(self, matches: List[_Match], match: _Match, unit: int) -> bool:
+        """
+        Whether a bare name is where its part starts, or right after a ward of its own
+        """
+        if match.first:
+            return True
+        return self.units[unit].level == DISTRICT and any(
+            self.units[ward].level == WARD and self.units[ward].parent == unit
+            for before in matches
+            if before.end == match.start and before.first
+            for ward in before.units + before.weak
+        )
+
+    def _split(self, address: str) -> AddressParts:
+        """
+        Address fields found in a free-text address, None where nothing was found
+        """
+        if not address:
+            return AddressParts()
+        if not unicodedata.is_normalized("NFC", address):
+            address = unicodedata.normalize("NFC", address)
+        tokens: List[_Token] = []
+        segment = 0
+        for found in _TOKEN.finditer(address.translate(_FOLD)):
+            if found.group() in _SEPARATORS:
+                segment += 1
+            else:
+                tokens.append(_Token(found.group(), found.start(), found.end(), segment))
+        if not tokens:
+            return AddressParts()
+        seg_bounds: List[Tuple[int, int]] = [(0, 0)] * (segment + 1)
+        for i, token in enumerate(tokens):
+            start, _ = seg_bounds[token.segment]
+            if i == 0 or tokens[i - 1].segment != token.segment:
+                start = i
+            seg_bounds[token.segment] = (start, i + 1)
+
+        matches = self._matches(tokens, seg_bounds)
+        found: Dict[int, Tuple[int, int, str]] = {}  # level -> (start, end, name)
+        before = len(tokens)
+        province = district = None
+        picked = self._pick(matches, PROVINCE, before, None)
+        if picked is not None:
+            match, province = picked
+            found[PROVINCE] = (match.start, match.end, self.units[province].name)
+            before = match.start
+        picked = self._pick(matches, DISTRICT, before, province, province is not None)
+        if picked is not None:
+            match, district = picked
+            if province is None and self.has_wards:
+                # Several districts of that name: the one with a ward before it
+                for unit in match.units:
+                    if self.units[unit].level == DISTRICT and self._pick(
+                        matches, WARD, match.start, unit, True
+                    ):
+                        district = unit
+                        break
+            found[DISTRICT] = (match.start, match.end, self.units[district].name)
+            before = match.start
+            if province is None:
+                province = self.units[district].province
+                found[PROVINCE] = (len(tokens), len(tokens), self.units[province].name)
+        if district is not None and self.has_wards:
+            picked = self._pick(matches, WARD, before, district, True)
+            if picked is not None:
+                match, ward = picked
+                found[WARD] = (match.start, match.end, self.units[ward].name)
+                before = match.start
+
+        # Districts and wards the gazetteer doesn't know, from their prefix. Every
+        # province is known: "Tỉnh lộ 10" is a road.
+        for level in (DISTRICT, WARD):
+            if level in found:
+                continue
+            prefixed = self._prefixed(address, tokens, seg_bounds, level, before)
+            if prefixed is not None:
+                found[level] = prefixed
+                before = prefixed[0]
+
+        house_no, alley, street = self._street(address, tokens, seg_bounds, before)
+        return AddressParts(
+            house_no,
+            alley,
+            street,
+            *(found[level][2] if level in found else None for level in (WARD, DISTRICT, PROVINCE)),
+        )
+
+    def _prefixed(self, address, tokens, seg_bounds, level, before) -> Optional[Tuple]:
+        """
+        Rightmost part ending before token `before` and starting with a prefix of `level`
+        """
+        start_segment = tokens[before].segment if before < len(tokens) else len(seg_bounds) - 1
+        for segment in range(start_segment, -1, -1):
+            start, end = seg_bounds[segment]
+            end = min(end, before)
+            if start >= end:
+                continue
+            named = _after_prefix(address, tokens, start, end, _PREFIXES[level])
+            if named is not None:
+                word, name_start = named
+                name = address[tokens[name_start].start : tokens[end - 1].end].strip(_TRIM)
+                return start, end, f"{word} {name}"
+        return None
+
+    def _street(self, address, tokens, seg_bounds, before) -> Tuple[Optional[str], ...]:
+        """
+        House number, alley and street from the parts before token `before`
+        """
+        house_no = alley = street = None
+        last_segment = tokens[before].segment if before < len(tokens) else len(seg_bounds)
+        if before < len(tokens) and seg_bounds[last_segment][0] < before:
+            last_segment += 1  # the ward or district shares its part
+        for segment in range(min(last_segment, len(seg_bounds)) - 1, -1, -1):
+            start, end = seg_bounds[segment]
+            end = min(end, before)
+            if start >= end:
+                continue
+            text = address[tokens[start].start : tokens[end - 1].end]
+            number = _HOUSE_NO.match(text)
+            if number is not None:
+                if number.end() == len(text):
+                    # A part holding only the number
+                    house_no = house_no or number.group(1)
+                    continue
+                offset = tokens[start].start + number.end()
+                while start < end and tokens[start].start < offset:
+                    start += 1
+            if start >= end:
+                continue
+            if alley is None:
+                after = _alley_end(address, tokens, start, end)
+                if after > start:
+                    alley = address[tokens[start].start : tokens[after - 1].end].strip(_TRIM)
+                    if number is not None:
+                        house_no = house_no or number.group(1)
+                    if after == end or street is not None:
+                        continue
+                    # "Ngõ 34 Nguyễn Trãi": alley 34 of Nguyễn Trãi street
+                    street = address[tokens[after].start : tokens[end - 1].end].strip(_TRIM)
+                    continue
+            if street is not None:
+                continue
+            at = _street_start(address, tokens, start, end)
+            # Without a prefix, only the part right before the ward or district
+            unprefixed = segment == last_segment - 1 and tokens[start].text not in _NOT_STREET
+            if at is not None or unprefixed:
+                street = address[tokens[start if at is None else at].start : tokens[end - 1].end]
+                street = street.strip(_TRIM)
+                if number is not None:
+                    house_no = house_no or number.group(1)
+        return house_no, alley, street
+
+    def fill(self, address: Optional[Address]) -> Optional[Address]:
+        """
+        A copy of `address` with its empty fields filled in from `full_address`
+        (or, without one, from the fields it has)
+        """
+        if address is None:
+            return None
+        text = address.full_address or ", ".join(
+            filter(None, (address.street, address.ward, address.district, address.province))
+        )
+        parts = self.split(text) if text else AddressParts()
+        missing = {
+            field: value
+            for field, value in parts._asdict().items()
+            if value and not getattr(address, field)
+        }
+        if not missing:
+            return address
+        return address.model_copy(update=missing)
+
+
+def _is_prefix(address: str, tokens, start: int, prefix, accented) -> bool:
+    """
+    Whether tokens start with `prefix`. In an address written with accents,
+    they must be there too: "Ngô Quyền" is a street, "Ngõ 5" an alley.
+    """
+    stop = start + len(prefix)
+    if tuple(token.text for token in tokens[start:stop]) != prefix:
+        return False
+    if address.isascii():
+        return True
+    return tuple(address[t.start : t.end].lower() for t in tokens[start:stop]) == accented
+
+
+def _after_prefix(address, tokens, start, end, prefixes: Prefixes) -> Optional[Tuple[str, int]]:
+    """
+    Written-out prefix and first token of the name when tokens[start:end] starts with a prefix
+    """
+    for prefix, (word, accented) in prefixes.items():
+        stop = start + len(prefix)
+        if stop < end and _is_prefix(address, tokens, start, prefix, accented):
+            return word, stop
+    return None
+
+
+def _alley_end(address, tokens, start, end) -> int:
+    """
+    End of the alleys tokens[start:end] starts with ("Ngõ 34", "Ngõ 34 Ngách 12"),
+    `start` when there is none
+    """
+    after = start
+    while after < end:
+        named = _after_prefix(address, tokens, after, end, _ALLEY)
+        if named is None:
+            break
+        after = named[1]
+        if not tokens[after].text.isdigit():
+            return end  # a named alley, up to the end of the part
+        while after < end and tokens[after].text.isdigit():
+            after += 1
+    return after
+
+
+def _street_start(address, tokens, start, end) -> Optional[int]:
+    """
+    First token of a street name written with its prefix ("Đường X", "Phố X")
+    """
+    for i in range(start, end - 1):
+        for prefix, (_, accented) in _STREET.items():
+            # "Phố" or "Đ." open the part, "Đường" can follow a project name
+            if (i == start or prefix == ("duong",)) and _is_prefix(
+                address, tokens, i, prefix, accented
+            ):
+                return i
+    return None
+
+
+def _read_rows(file) -> Iterable[Tuple[str, str, str]]:
+    for row in csv.DictReader(file):
+        yield row["province"], row.get("district") or "", row.get("ward") or ""
+
+
+@lru_cache(maxsize=None)
+def default_gazetteer() -> Gazetteer:
+    """
+    The gazetteer of the bundled dataset, built on first use
+    """
+    data = resources.files("lovesoup").joinpath("data", "vn_admin_units.csv")
+    return Gazetteer(_read_rows(io.StringIO(data.read_text(encoding="utf-8"))))
+
+
+def split_address(address: str) -> AddressParts:
+    return default_gazetteer().split(address)
+
+
+def fill_address(address: Optional[Address]) -> Optional[Address]:
+    return default_gazetteer().fill(address)
@@ -3,19 +3,66 @@ File: extract.py
 Desc: General extractor function based on template
 """
 
+import hashlib
 import importlib.resources as pkg_resources
+import json
+import os
 import re
+import threading
 import unicodedata
 from abc import ABC, abstractmethod
-from typing import Annotated, Dict
+from contextlib import nullcontext
+from functools import lru_cache
+from typing import (
+    TYPE_CHECKING,
+    Annotated,
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Type,
+    TypeVar,
+    Union,
+)
 
-from loguru import logger
+from pydantic import BaseModel, ValidationError
 from pydantic.functional_validators import AfterValidator
-from selectorlib import Extractor
-from selectorlib.formatter import Formatter
 
 from lovesoup import precook_templates
+from lovesoup.extraction_plan import ExtractionPlan
+from lovesoup.features import FeatureMap, resolve_features
 from lovesoup.property_models import PropertyNormalized
+from lovesoup.regions import MISSING, NO_MARKER, NOT_COVERED, REGION, REGION_PATHS, RegionHint
+
+if TYPE_CHECKING:
+    from selectorlib import Extractor
+
+    from lovesoup.instrumentation import Instrumentation
+    from lovesoup.result_cache import ResultCache
+
+# loguru, selectorlib, parsel and yaml are only imported when needed: for an
+# error, for the "selectorlib" engine, or to compile a template that has no
+# precompiled plan (see `precompile_templates`)
+
+
+# A page as text, or as UTF-8 bytes
+Page = Union[str, bytes]
+
+
+def page_text(html_content: Page) -> str:
+    if isinstance(html_content, bytes):
+        return html_content.decode("utf-8")
+    return html_content
+
+
+def _log_error(message: str) -> None:
+    from loguru import logger
+
+    logger.error(message)
 
 
 def read_yaml_file(file_name: str) -> str:
@@ -28,10 +75,24 @@ def read_yaml_file(file_name: str) -> str:
             content = yaml_file.read()
             return content
     except Exception as e:
-        logger.error(f"Error loading template file {file_name}\n Error: {e}")
+        _log_error(f"Error loading template file {file_name}\n Error: {e}")
         raise
 
 
+class Formatter:
+    """
+    Same interface as `selectorlib.formatter.Formatter`, which selectorlib
+    accepts as well, without importing selectorlib
+    """
+
+    def format(self, text: str):
+        return text
+
+    @property
+    def name(self) -> str:
+        return self.__class__.__name__
+
+
 class ImageURLFormatter(Formatter):
     def format(self, text: str) -> str:
         # Pattern to match src or data-src
@@ -43,38 +104,566 @@ class ImageURLFormatter(Formatter):
         return ""
 
 
+DEFAULT_FORMATTERS = (ImageURLFormatter,)
+
+
+class CompiledTemplate:
+    """
+    A template compiled once and shared by every extractor built from it.
+    The key identifies the template name, the formatter set and the exact
+    YAML content, so an edited template never reuses a stale build.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        content: str,
+        formatters: Tuple = DEFAULT_FORMATTERS,
+        precompiled: Optional[Dict] = None,
+    ):
+        """
+        precompiled: plan saved by `precompile_templates` for this exact
+            content and formatters; the template is compiled from its YAML otherwise.
+        """
+        self.name = name
+        self.content = content
+        self.content_hash = template_content_hash(content)
+        self.formatters = formatters
+        self.formatter_names = _formatter_names(formatters)
+        self._config = None
+        self._extractor = None
+        if precompiled is not None:
+            self.plan = ExtractionPlan.from_dict(precompiled, formatters)
+        else:
+            self.plan = ExtractionPlan(self.config, formatters)
+
+    @property
+    def key(self) -> Tuple[str, Tuple[str, ...], str]:
+        return (self.name, self.formatter_names, self.content_hash)
+
+    @property
+    def config(self) -> Dict:
+        if self._config is None:
+            import yaml
+
+            # What selectorlib.Extractor.from_yaml_string does
+            self._config = yaml.safe_load(self.content)
+        return self._config
+
+    @property
+    def extractor(self) -> "Extractor":
+        if self._extractor is None:
+            from selectorlib import Extractor
+
+            self._extractor = Extractor(self.config, formatters=list(self.formatters))
+        return self._extractor
+
+
+_TEMPLATE_CACHE: Dict[Tuple[str, Tuple[str, ...], str], CompiledTemplate] = {}
+_TEMPLATE_CACHE_LOCK = threading.Lock()
+# Template name -> (YAML content, content hash), read once per process
+_TEMPLATE_SOURCES: Dict[str, Tuple[str, str]] = {}
+
+
+def template_content_hash(content: str) -> str:
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def _formatter_names(formatters: Iterable) -> Tuple[str, ...]:
+    return tuple(
+        sorted(getattr(f, "__name__", None) or type(f).__name__ for f in formatters)
+    )
+
+
+def plan_file_name(template_name: str) -> str:
+    return f"{template_name}.plan.json"
+
+
+def _load_precompiled(template_name: str, key: Tuple) -> Optional[Dict]:
+    """
+    The precompiled plan of a template, if one was built from this exact content
+    """
+    path = pkg_resources.files(precook_templates) / plan_file_name(template_name)
+    try:
+        artifact = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    _, formatter_names, content_hash = key
+    if artifact.get("content_hash") != content_hash:
+        return None
+    if tuple(artifact.get("formatters", ())) != formatter_names:
+        return None
+    return artifact["plan"]
+
+
+def get_compiled_template(
+    template_name: str, formatters: Tuple = DEFAULT_FORMATTERS
+) -> CompiledTemplate:
+    """
+    Return the compiled template for `template_name`, building it only the
+    first time this (name, formatters, content) combination is seen in the process.
+    The YAML file is only read the first time too, until `clear_template_cache`.
+    """
+    source = _TEMPLATE_SOURCES.get(template_name)
+    if source is None:
+        content = read_yaml_file(f"{template_name}.yaml")
+        source = _TEMPLATE_SOURCES[template_name] = (content, template_content_hash(content))
+    content, content_hash = source
+    key = (template_name, _formatter_names(formatters), content_hash)
+    compiled = _TEMPLATE_CACHE.get(key)
+    if compiled is None:
+        with _TEMPLATE_CACHE_LOCK:
+            compiled = _TEMPLATE_CACHE.get(key)
+            if compiled is None:
+                precompiled = _load_precompiled(template_name, key)
+                compiled = CompiledTemplate(template_name, content, formatters, precompiled)
+                _TEMPLATE_CACHE[key] = compiled
+    return compiled
+
+
+def available_templates() -> List[str]:
+    """
+    Names of every template bundled in the templates folder
+    """
+    return sorted(
+        entry.name[: -len(".yaml")]
+        for entry in pkg_resources.files(precook_templates).iterdir()
+        if entry.name.endswith(".yaml")
+    )
+
+
+def warm_templates(
+    template_names: Optional[Iterable[str]] = None,
+    formatters: Tuple = DEFAULT_FORMATTERS,
+) -> List[CompiledTemplate]:
+    """
+    Compile templates ahead of time, e.g. at worker startup.
+    Defaults to every bundled template.
+    """
+    if template_names is None:
+        template_names = available_templates()
+    return [get_compiled_template(name, formatters) for name in template_names]
+
+
+def precompile_templates(
+    template_names: Optional[Iterable[str]] = None,
+    formatters: Tuple = DEFAULT_FORMATTERS,
+    out_dir: Optional[str] = None,
+) -> List[str]:
+    """
+    Save the compiled plan of templates (default all) next to their YAML, as
+    {name}.plan.json. Extractors then load it instead of compiling the
+    template, as long as the YAML content is unchanged. Returns the files written.
+    """
+    if template_names is None:
+        template_names = available_templates()
+    if out_dir is None:
+        out_dir = list(precook_templates.__path__)[0]
+    written = []
+    for name in template_names:
+        content = read_yaml_file(f"{name}.yaml")
+        compiled = CompiledTemplate(name, content, formatters)
+        artifact = {
+            "template": name,
+            "content_hash": compiled.content_hash,
+            "formatters": list(compiled.formatter_names),
+            "plan": compiled.plan.to_dict(),
+        }
+        path = os.path.join(out_dir, plan_file_name(name))
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(artifact, file, ensure_ascii=False, indent=1)
+            file.write("\n")
+        written.append(path)
+    return written
+
+
+def stale_precompiled_templates(
+    template_names: Optional[Iterable[str]] = None,
+    formatters: Tuple = DEFAULT_FORMATTERS,
+) -> List[str]:
+    """
+    Templates (default all) whose precompiled plan is missing or out of date
+    """
+    if template_names is None:
+        template_names = available_templates()
+    stale = []
+    for name in template_names:
+        content = read_yaml_file(f"{name}.yaml")
+        key = (name, _formatter_names(formatters), template_content_hash(content))
+        if _load_precompiled(name, key) is None:
+            stale.append(name)
+    return stale
+
+
+def clear_template_cache() -> None:
+    with _TEMPLATE_CACHE_LOCK:
+        _TEMPLATE_CACHE.clear()
+        _TEMPLATE_SOURCES.clear()
+
+
+ENGINES = ("plan", "selectorlib")
+
+ModelT = TypeVar("ModelT", bound=BaseModel)
+
+_IMMUTABLE = (type(None), str, int, float, bool, tuple, frozenset)
+
+
+@lru_cache(maxsize=None)
+def _shareable_defaults(model: Type[BaseModel]) -> Optional[Dict]:
+    """
+    Field defaults of `model`, None when some can't be shared between instances
+    (required fields, factories, mutable defaults)
+    """
+    defaults = {}
+    for name, field in model.model_fields.items():
+        if field.default_factory is not None or not isinstance(field.default, _IMMUTABLE):
+            return None
+        defaults[name] = field.default
+    return defaults
+
+
+def construct_model(model: Type[ModelT], **values) -> ModelT:
+    """
+    Build a model instance from trusted values, without validation.
+    Same result as `model.model_construct`, which in pydantic v2 is slower
+    than validating: it goes through every field in Python.
+    """
+    defaults = _shareable_defaults(model)
+    if defaults is None:
+        return model.model_construct(**values)
+    instance = model.__new__(model)
+    object.__setattr__(instance, "__dict__", {**defaults, **values})
+    object.__setattr__(instance, "__pydantic_fields_set__", set(values))
+    object.__setattr__(instance, "__pydantic_extra__", None)
+    object.__setattr__(instance, "__pydantic_private__", None)
+    return instance
+
+
+_NO_STAGE = nullcontext()
+
+
 class DataExtractor(ABC):
-    def __init__(self, template_name: str):
+    def __init__(
+        self,
+        template_name: str,
+        engine: str = "plan",
+        instrumentation: Optional["Instrumentation"] = None,
+        result_cache: Optional["ResultCache"] = None,
+        trusted: bool = False,
+        strict: bool = False,
+        region_hints: bool = False,
+        split_addresses: bool = False,
+    ):
+        """
+        Args:
+            template_name: name of the YAML template in the templates folder.
+            engine: "plan" evaluates the compiled extraction plan,
+                "selectorlib" runs the template through `selectorlib.Extractor`.
+                Both give the same result.
+            instrumentation: collects per-stage timings and counters, see
+                `lovesoup.instrumentation`. Nothing is recorded without it.
+            result_cache: serve pages already extracted with the same template
+                from this cache, see `lovesoup.result_cache`.
+            trusted: build the output models without validating them again
+                (their values come from the validated precook model) and share
+                the constant sub-models between results, which must then be
+                treated as read-only.
+            strict: validate the template output into the precook model in
+                pydantic strict mode, without any type coercion.
+            region_hints: parse only the region of the page given by the cook's
+                REGION_HINT, falling back to the whole page when the hint fails.
+                `region_paths` counts how often each way was taken.
+            split_addresses: fill the Address fields the site leaves empty
+                (house number, street, ward, district...) from the full
+                address, see `lovesoup.gazetteer`.
+        """
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown engine {engine!r}, expected one of {ENGINES}")
         self.template = template_name
-        self.extractor = Extractor.from_yaml_string(
-            read_yaml_file(f"{template_name}.yaml"), formatters=[ImageURLFormatter]
-        )
+        self.engine = engine
+        self.instrumentation = instrumentation
+        self.result_cache = result_cache
+        self.trusted = trusted
+        self.strict = strict
+        self.region_hints = region_hints and self.REGION_HINT is not None
+        self.region_paths: Dict[str, int] = dict.fromkeys(REGION_PATHS, 0)
+        self.split_addresses = split_addresses
+        self.compiled_template = get_compiled_template(template_name)
+        self.plan = self.compiled_template.plan
+
+    def options(self) -> Dict[str, Any]:
+        """
+        Constructor arguments besides the template name, to build the same
+        cook in a worker process, see `lovesoup.batch`
+        """
+        return {
+            "engine": self.engine,
+            "instrumentation": self.instrumentation,
+            "result_cache": self.result_cache,
+            "trusted": self.trusted,
+            "strict": self.strict,
+            "region_hints": self.region_hints,
+            "split_addresses": self.split_addresses,
+        }
+
+    @property
+    def extractor(self) -> "Extractor":
+        """
+        selectorlib's extractor for the template, built on first use
+        """
+        return self.compiled_template.extractor
+
+    # Called with the name of every stage a page enters ("read", "parse",
+    # "select", "validate", "post_process", "address"), see `lovesoup.isolation`
+    stage_listener: Optional[Callable[[str], None]] = None
 
-    def exec_precook(self, source_path: str) -> Dict:
+    def _stage(self, name: str):
+        if self.stage_listener is not None:
+            self.stage_listener(name)
+        if self.instrumentation is None:
+            return _NO_STAGE
+        return self.instrumentation.stage(self.template, name)
+
+    def extract(self, html_content: Page, keys: Optional[Iterable[str]] = None) -> Dict:
+        """
+        Run the template over a page (text or UTF-8 bytes) and return the raw
+        (precook) result.
+
+        With `keys`, only those top-level template keys are evaluated; the
+        others get an empty placeholder so the precook models still validate.
+        """
+        if self.engine == "selectorlib":
+            with self._stage("select"):
+                primary_result = self.extractor.extract(page_text(html_content))
+        else:
+            primary_result = None
+            if self.region_hints:
+                primary_result = self._extract_region(html_content, keys)
+            if primary_result is None:
+                with self._stage("parse"):
+                    root = self.plan.parse(html_content)
+                with self._stage("select"):
+                    primary_result = self.plan.evaluate(root, keys)
+
+        if self.instrumentation is not None:
+            self.instrumentation.record_selectors(self.template, primary_result)
+        if keys is not None and self.engine != "selectorlib":
+            for selector in self.plan.selectors:
+                primary_result.setdefault(selector.name, selector.blank())
+        return primary_result
+
+    def _extract_region(self, html_content: Page, keys: Optional[Iterable[str]]) -> Optional[Dict]:
+        """
+        Template output from the region of the page only, None when the whole
+        page has to be parsed
+        """
+        hint = self.REGION_HINT
+        if keys is not None:
+            keys = list(keys)
+        region = None
+        if not hint.covers(keys):
+            path = NOT_COVERED
+        else:
+            region = hint.slice(html_content)
+            path = NO_MARKER if region is None else REGION
+        primary_result = None
+        if region is not None:
+            with self._stage("parse"):
+                root = self.plan.parse(region)
+            with self._stage("select"):
+                primary_result = self.plan.evaluate(root, keys)
+            if hint.missing(primary_result, keys):
+                path = MISSING
+                primary_result = None
+        self.region_paths[path] += 1
+        if self.instrumentation is not None:
+            self.instrumentation.record_region_path(self.template, path)
+        return primary_result
+
+    def read_source(self, source_path: str) -> str:
         try:
             # Read the HTML content from the provided source path
-            with open(source_path, "r", encoding="utf-8") as file:
+            with self._stage("read"), open(source_path, "r", encoding="utf-8") as file:
                 html_content = file.read()
 
         except Exception as e:
-            logger.error(f"Error reading file: {e}")
+            _log_error(f"Error reading file: {e}")
             raise
+        if self.instrumentation is not None:
+            self.instrumentation.record_page(self.template, os.path.getsize(source_path))
+        return html_content
+
+    def exec_precook(self, source_path: str, keys: Optional[Iterable[str]] = None) -> Dict:
+        html_content = self.read_source(source_path)
         # Extract data using the template
-        extracted_data = self.extractor.extract(html_content)
+        extracted_data = self.extract(html_content, keys)
 
         return extracted_data
 
+    def validate_precook(self, model: Type[ModelT], primary_result: Dict) -> ModelT:
+        """
+        Validate the raw template output into the site's precook model
+        """
+        with self._stage("validate"):
+            try:
+                return model.model_validate(primary_result, strict=self.strict)
+            except ValidationError:
+                if self.instrumentation is not None:
+                    self.instrumentation.record_validation_failure(self.template)
+                raise
+
+    def build(self, model: Type[ModelT], **values) -> ModelT:
+        """
+        Instantiate an output model, skipping validation in trusted mode
+        """
+        if self.trusted:
+            return construct_model(model, **values)
+        return model(**values)
+
+    def shared(self, instance: ModelT) -> ModelT:
+        """
+        A constant sub-model: the instance itself in trusted mode, a copy otherwise
+        """
+        if self.trusted:
+            return instance
+        # Already validated, a plain copy of its values is enough
+        return construct_model(type(instance), **instance.__dict__)
+
+    # Where the template's data lives in the page, used with `region_hints=True`,
+    # see `lovesoup.regions`
+    REGION_HINT: Optional[RegionHint] = None
+
+    # Value name -> (feature list attribute of the precook model, title),
+    # see `lovesoup.features`
+    FEATURE_MAP: FeatureMap = {}
+
+    def features(self, precook: BaseModel) -> Dict[str, Any]:
+        """
+        Values of FEATURE_MAP for a page, "" for titles it doesn't list
+        """
+        return resolve_features(self.FEATURE_MAP, precook)
+
     @abstractmethod
     def post_process(self, primary_result: Dict) -> PropertyNormalized:
         raise NotImplementedError
 
-    def run(self, source_path: str):
-        primary_result = self.exec_precook(source_path)
-        return self.post_process(primary_result)
+    # PropertyNormalized field -> template keys it is built from. Subclasses
+    # fill this in to support `fields=`; fields missing here need no selector.
+    FIELD_DEPENDENCIES: Dict[str, Tuple[str, ...]] = {}
+
+    # Template key -> keys of the raw output its value ends up under, for cooks
+    # whose `extract` stores some keys under other names; see `lovesoup.incremental`
+    RAW_KEYS: Dict[str, Tuple[str, ...]] = {}
 
-    def run_html(self, html_content: str):
-        primary_result = self.extractor.extract(html_content)
-        return self.post_process(primary_result)
+    def template_keys_for(self, fields: Optional[Iterable[str]]) -> Optional[List[str]]:
+        """
+        Template keys needed to build `fields`, or None for the whole template
+        """
+        if fields is None or not self.FIELD_DEPENDENCIES:
+            return None
+        keys = []
+        for field in fields:
+            if field not in PropertyNormalized.model_fields:
+                raise ValueError(f"Unknown PropertyNormalized field: {field!r}")
+            for key in self.FIELD_DEPENDENCIES.get(field, ()):
+                if key not in keys:
+                    keys.append(key)
+        return keys
+
+    @staticmethod
+    def select_fields(
+        result: PropertyNormalized, fields: Optional[Iterable[str]]
+    ) -> PropertyNormalized:
+        """
+        Keep only `fields` of a result, the others are left to their defaults
+        """
+        if fields is None:
+            return result
+        return PropertyNormalized.model_construct(
+            **{field: getattr(result, field) for field in fields}
+        )
+
+    def to_result(self, primary_result: Dict) -> PropertyNormalized:
+        """
+        The result of a raw template output: post_process, then the address
+        split when asked for
+        """
+        with self._stage("post_process"):
+            result = self.post_process(primary_result)
+        if self.split_addresses and result.address is not None:
+            from lovesoup.gazetteer import fill_address
+
+            with self._stage("address"):
+                result.address = fill_address(result.address)
+        return result
+
+    def run(self, source_path: str, fields: Optional[Iterable[str]] = None):
+        """
+        fields: PropertyNormalized fields to fill in. Only the template keys
+            they depend on are evaluated; other fields are left empty.
+        """
+        fields = None if fields is None else list(fields)
+        if self.result_cache is not None and fields is None:
+            return self._run_cached(self.read_source(source_path))
+        primary_result = self.exec_precook(source_path, self.template_keys_for(fields))
+        return self.select_fields(self.to_result(primary_result), fields)
+
+    def record_page(self, html_content: Page) -> None:
+        """
+        Count a page held in memory, and its size in bytes, in the instrumentation
+        """
+        if self.instrumentation is not None:
+            size = len(html_content)
+            if isinstance(html_content, str):
+                size = len(html_content.encode("utf-8"))
+            self.instrumentation.record_page(self.template, size)
+
+    def run_html(self, html_content: Page, fields: Optional[Iterable[str]] = None):
+        """
+        Same as `run` for a page held in memory, as text or UTF-8 bytes
+        """
+        fields = None if fields is None else list(fields)
+        self.record_page(html_content)
+        if self.result_cache is not None and fields is None:
+            return self._run_cached(page_text(html_content))
+        primary_result = self.extract(html_content, self.template_keys_for(fields))
+        return self.select_fields(self.to_result(primary_result), fields)
+
+    # Options that change the result of a page, part of its result cache key
+    CACHE_OPTIONS: Tuple[str, ...] = ("trusted", "strict", "region_hints", "split_addresses")
+
+    def _run_cached(self, html_content: str) -> PropertyNormalized:
+        options = ",".join(f"{name}={getattr(self, name)!r}" for name in self.CACHE_OPTIONS)
+        key = self.result_cache.key(
+            self.template, self.compiled_template.content_hash, html_content, options
+        )
+        result = self.result_cache.get(key)
+        if result is None:
+            result = self.to_result(self.extract(html_content))
+            self.result_cache.put(key, result)
+        return result
+
+    def run_many(
+        self,
+        sources: Iterable,
+        workers: Optional[int] = None,
+        chunksize: int = 8,
+        ordered: bool = True,
+        return_exceptions: bool = False,
+    ) -> Iterator[PropertyNormalized]:
+        """
+        Extract many pages (file paths or HTML strings) with a process pool.
+        Results are streamed back, see `lovesoup.batch.extract_many`.
+        """
+        from lovesoup.batch import extract_many
+
+        return extract_many(
+            ((self, source) for source in sources),
+            workers=workers,
+            chunksize=chunksize,
+            ordered=ordered,
+            return_exceptions=return_exceptions,
+        )
 
 
 # Create a type alias for VinaStr with constraints using Annotated
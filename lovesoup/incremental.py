@@ -0,0 +1,391 @@
+"""
+File: incremental.py
+Desc: Re-extraction of an archive after a template edit, evaluating only the selectors that changed
+
+A run that keeps the raw template output of every page (`write_raw`) lets a
+later template edit be applied without running the whole template again:
+`diff_template` compares the compiled plans of the old and new YAML and tells
+which top-level keys changed (and the PropertyNormalized fields built from
+them); `reextract` then evaluates only those keys on each page, takes the
+other keys from the stored raw output, and runs post_process again.
+
+    write_raw(items, "raw.jsonl.gz", workers=8)          # once, the full run
+
+    # after editing mogi.yaml, before `python -m lovesoup.precompile`
+    diff = diff_template("mogi")        # against the (now stale) mogi.plan.json
+    with RawSink("raw-new.jsonl.gz") as raw, JsonlSink("out.jsonl.gz") as out:
+        for record in reextract(read_jsonl("raw.jsonl.gz"), [diff], workers=8):
+            raw.write_record(record)
+            out.write_record(record.extraction_record())
+
+Per stored page, by the template version it was extracted with:
+    - the current one: post_process only, the page is not read;
+    - the old one of a diff: the changed keys only, or post_process only when
+      keys were just removed;
+    - any other, or no raw output: the whole template.
+The page is still parsed to evaluate changed keys, but only the part of it
+the cook's REGION_HINT points to when the hint covers those keys (see
+`lovesoup.regions`).
+"""
+
+import argparse
+import json
+import os
+import pathlib
+import sys
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+from lovesoup import precook_templates
+from lovesoup.batch import (
+    ExtractionError,
+    ExtractionRecord,
+    describe_source,
+    iter_records,
+    read_page,
+    resolve_cook,
+    resolve_tasks,
+)
+from lovesoup.cooks import get_cook
+from lovesoup.extraction_plan import ExtractionPlan
+from lovesoup.general_extractor import (
+    DEFAULT_FORMATTERS,
+    CompiledTemplate,
+    DataExtractor,
+    plan_file_name,
+    template_content_hash,
+)
+from lovesoup.property_models import PropertyNormalized
+from lovesoup.sinks import JsonlSink, error_dict, read_jsonl
+
+
+class TemplateDiff(NamedTuple):
+    """
+    What changed between two versions of a template
+    """
+
+    template: str
+    old_hash: str
+    new_hash: str
+    changed: Tuple[str, ...]  # top-level keys edited or added
+    removed: Tuple[str, ...]  # top-level keys gone
+    fields: Tuple[str, ...]  # PropertyNormalized fields built from those keys
+
+
+class RawRecord(NamedTuple):
+    """
+    Outcome of one page with its raw template output, set even when
+    post_process failed
+    """
+
+    source: str
+    site: Optional[str]
+    template_hash: Optional[str]
+    raw: Optional[Dict]
+    result: Optional[PropertyNormalized]
+    error: Optional[ExtractionError]
+
+    def extraction_record(self) -> ExtractionRecord:
+        return ExtractionRecord(self.source, self.site, self.result, self.error)
+
+
+def _selects(selector) -> Dict:
+    """
+    What a compiled selector evaluates. Its shared prefix is left out: the
+    prefix and suffix split selects the same elements as its full XPath, and
+    changes with the other keys sharing it.
+    """
+    data = selector.to_dict()
+    del data["prefix"], data["suffix_xpath"]
+    return data
+
+
+def diff_plans(old: ExtractionPlan, new: ExtractionPlan) -> Tuple[Tuple[str, ...], Tuple[str, ...]]:
+    """
+    (changed, removed) top-level keys. A key is changed when anything its
+    compiled selector evaluates differs: XPath, type, attribute, formatter
+    name or children.
+    """
+    before = {selector.name: _selects(selector) for selector in old.selectors}
+    changed = tuple(
+        selector.name for selector in new.selectors if before.get(selector.name) != _selects(selector)
+    )
+    removed = tuple(name for name in before if name not in new.keys)
+    return changed, removed
+
+
+def fields_for_keys(cook: DataExtractor, keys: Iterable[str]) -> Tuple[str, ...]:
+    """
+    PropertyNormalized fields built from any of `keys`, by the cook's
+    FIELD_DEPENDENCIES (every field when it has none)
+    """
+    keys = set(keys)
+    if not keys:
+        return ()
+    if not cook.FIELD_DEPENDENCIES:
+        return tuple(PropertyNormalized.model_fields)
+    return tuple(
+        field for field, needed in cook.FIELD_DEPENDENCIES.items() if keys.intersection(needed)
+    )
+
+
+def load_plan(
+    template_name: str, old=None, formatters: Tuple = DEFAULT_FORMATTERS
+) -> Tuple[ExtractionPlan, str]:
+    """
+    Compiled plan and content hash of an older version of a template.
+
+    old: its YAML text, the path of its YAML file or of a plan saved by
+        `precompile_templates`. Defaults to the plan bundled next to the
+        template, which is the old version until the templates are precompiled again.
+    """
+    if old is None:
+        old = os.path.join(list(precook_templates.__path__)[0], plan_file_name(template_name))
+    if isinstance(old, str) and "\n" in old:
+        content = old
+    else:
+        path = pathlib.Path(old)
+        if path.suffix == ".json":
+            artifact = json.loads(path.read_text(encoding="utf-8"))
+            return ExtractionPlan.from_dict(artifact["plan"], formatters), artifact["content_hash"]
+        content = path.read_text(encoding="utf-8")
+    return CompiledTemplate(template_name, content, formatters).plan, template_content_hash(content)
+
+
+def diff_template(site, old=None) -> TemplateDiff:
+    """
+    Diff the current template of a site (anything `get_cook` accepts, or a
+    cook) against an older version of it, see `load_plan`
+    """
+    cook = site if isinstance(site, DataExtractor) else get_cook(site)()
+    old_plan, old_hash = load_plan(cook.template, old, cook.compiled_template.formatters)
+    new_hash = cook.compiled_template.content_hash
+    if old_hash == new_hash:
+        changed, removed = (), ()
+    else:
+        changed, removed = diff_plans(old_plan, cook.plan)
+    return TemplateDiff(
+        cook.template,
+        old_hash,
+        new_hash,
+        changed,
+        removed,
+        fields_for_keys(cook, changed + removed),
+    )
+
+
+def _merge(cook: DataExtractor, raw: Dict, fresh: Dict, keys: Tuple, removed: Tuple) -> Dict:
+    """
+    The stored raw output with the values of `keys` taken from `fresh` and `removed` dropped
+    """
+    raw = dict(raw)
+    for key in removed + tuple(keys):
+        for name in cook.RAW_KEYS.get(key, (key,)):
+            raw.pop(name, None)
+    for key in keys:
+        for name in cook.RAW_KEYS.get(key, (key,)):
+            if name in fresh:
+                raw[name] = fresh[name]
+    return raw
+
+
+def _extract_raw_chunk(chunk: List[Tuple]) -> List[RawRecord]:
+    """
+    Worker entry point. Tasks carry (page, stored raw output, keys to
+    evaluate, keys removed) as their source; keys None means the whole template.
+    """
+    records = []
+    for cook_cls, template_name, options, (source, raw, keys, removed), label in chunk:
+        label = label or describe_source(source)
+        template_hash = result = error = None
+        try:
+            page = None
+            if cook_cls is None:
+                page = read_page(source)
+            template_name, cook = resolve_cook(cook_cls, template_name, options, page)
+            if (keys is None or keys) and page is None:
+                page = read_page(source)
+            if keys is None:
+                raw = cook.extract(page)
+            elif keys or removed:
+                fresh = cook.extract(page, keys) if keys else {}
+                raw = _merge(cook, raw, fresh, keys, removed)
+            template_hash = cook.compiled_template.content_hash
+            # post_process may consume its input (Nhatot)
+            result = cook.to_result(dict(raw))
+        except Exception as e:
+            if template_hash is None:
+                # The template itself failed, the stored output is no longer of any use
+                raw = None
+            error = ExtractionError(template_name or "auto", label, type(e).__name__, str(e))
+        records.append(RawRecord(label, template_name, template_hash, raw, result, error))
+    return records
+
+
+def extract_raw(
+    items: Iterable[Tuple],
+    workers: Optional[int] = None,
+    chunksize: int = 8,
+    ordered: bool = True,
+) -> Iterator[RawRecord]:
+    """
+    Like `lovesoup.batch.extract_records`, but every record also carries the
+    raw template output of its page, for `reextract` to reuse later
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    tasks = (
+        (cook_cls, template_name, options, (source, None, None, ()), label)
+        for cook_cls, template_name, options, source, label in resolve_tasks(items)
+    )
+    return iter_records(tasks, workers, chunksize, ordered, _extract_raw_chunk)
+
+
+def reextract(
+    records: Iterable[Dict],
+    diffs: Iterable[TemplateDiff] = (),
+    workers: Optional[int] = None,
+    chunksize: int = 8,
+    ordered: bool = True,
+    page: Optional[Callable[[Dict], Union[str, os.PathLike]]] = None,
+    region_hints: bool = True,
+) -> Iterator[RawRecord]:
+    """
+    Bring stored raw records (as written by RawSink) up to the current
+    templates, see the module docstring.
+
+    Args:
+        records: stored raw records, e.g. `read_jsonl("raw.jsonl.gz")`.
+        diffs: diffs of the edited templates, from `diff_template`.
+        page: the page (file path or HTML) of a stored record, by default
+            its "source". Only called for records that need their page.
+        region_hints: parse only the region of the page the cook's
+            REGION_HINT points to, when it covers the keys to evaluate.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    diffs = {diff.template: diff for diff in diffs}
+    if page is None:
+        page = _stored_source
+
+    current: Dict[Optional[str], Tuple] = {None: (None, None, None)}
+    options = (("region_hints", True),) if region_hints else ()
+
+    def tasks():
+        for record in records:
+            site = record.get("site")
+            if site not in current:
+                cook = get_cook(site)()
+                current[site] = (type(cook), cook.template, cook.compiled_template.content_hash)
+            # Pages of an unknown site are told apart again by the worker
+            cook_cls, template_name, current_hash = current[site]
+            template_hash, raw = record.get("template_hash"), record.get("raw")
+            diff = diffs.get(template_name)
+            removed = ()
+            if raw is None or template_hash is None or cook_cls is None:
+                keys = None
+            elif template_hash == current_hash:
+                keys = ()
+            elif diff is not None and template_hash == diff.old_hash:
+                keys, removed = diff.changed, diff.removed
+            else:
+                keys = None
+            source = page(record) if keys is None or keys else None
+            yield (
+                cook_cls,
+                template_name,
+                options,
+                (source, raw, keys, removed),
+                record.get("source"),
+            )
+
+    return iter_records(tasks(), workers, chunksize, ordered, _extract_raw_chunk)
+
+
+def _stored_source(record: Dict) -> str:
+    return record["source"]
+
+
+class RawSink(JsonlSink):
+    """
+    JSONL file of raw records: source, site, template hash, error and raw
+    template output, read back with `lovesoup.sinks.read_jsonl`
+    """
+
+    def write_record(self, record: RawRecord) -> None:
+        self.write_line(
+            {
+                "source": record.source,
+                "site": record.site,
+                "template_hash": record.template_hash,
+                "error": None if record.error is None else error_dict(record.error),
+                "raw": record.raw,
+            }
+        )
+
+
+def write_raw(
+    items: Iterable[Tuple],
+    path,
+    workers: Optional[int] = None,
+    chunksize: int = 8,
+    results_path=None,
+    **sink_kwargs,
+) -> Tuple[int, int]:
+    """
+    Extract (site, source) pairs into a raw JSONL file (and their results
+    into `results_path`, if given). Returns the number of records written and failed.
+    """
+    results = JsonlSink(results_path, **sink_kwargs) if results_path is not None else None
+    try:
+        with RawSink(path, **sink_kwargs) as sink:
+            for record in extract_raw(items, workers, chunksize, ordered=False):
+                sink.write_record(record)
+                if results is not None:
+                    results.write_record(record.extraction_record())
+    finally:
+        if results is not None:
+            results.close()
+    return sink.written, sink.failed
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[2].split(": ", 1)[1])
+    parser.add_argument("template", help="site or template name")
+    parser.add_argument(
+        "--old", help="old YAML or .plan.json, default the plan bundled next to the template"
+    )
+    parser.add_argument("--raw", type=pathlib.Path, help="raw records to bring up to date")
+    parser.add_argument("--raw-output", type=pathlib.Path, help="where to write the new raw records")
+    parser.add_argument("--output", type=pathlib.Path, help="where to write the new results")
+    parser.add_argument("--workers", type=int)
+    args = parser.parse_args(argv)
+
+    diff = diff_template(args.template, args.old)
+    print(f"changed: {', '.join(diff.changed) or '-'}")
+    print(f"removed: {', '.join(diff.removed) or '-'}")
+    print(f"fields:  {', '.join(diff.fields) or '-'}")
+    if args.raw is None:
+        return 0
+    if args.raw_output is None and args.output is None:
+        parser.error("--raw needs --raw-output or --output")
+
+    raw = RawSink(args.raw_output) if args.raw_output else None
+    out = JsonlSink(args.output) if args.output else None
+    failed = 0
+    try:
+        for record in reextract(read_jsonl(args.raw), [diff], workers=args.workers):
+            failed += record.error is not None
+            if raw is not None:
+                raw.write_record(record)
+            if out is not None:
+                out.write_record(record.extraction_record())
+    finally:
+        for sink in (raw, out):
+            if sink is not None:
+                sink.close()
+    print(f"failed:  {failed}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,413 @@
+"""
+File: ingest.py
+Desc: asyncio pipeline fetching pages over HTTP and extracting them in a process pool
+
+Fetching and extraction overlap: while workers parse pages, the fetcher keeps
+downloading the next ones, until the bounded queue between the two stages is
+full. Records come out as an async iterator:
+
+    async for record in ingest(urls, fetcher=Fetcher(per_host=4, rate=2.0)):
+        if record.error is None:
+            print(record.source, record.result.listing_price)
+
+The fetcher is a small HTTP/1.1 client on top of asyncio streams: keep-alive
+connections pooled per host, a limit on concurrent requests overall and per
+host, an optional per-host request rate, gzip/deflate bodies and redirects.
+"""
+
+import asyncio
+import os
+import ssl
+import zlib
+from collections import defaultdict
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import (
+    AsyncIterable,
+    AsyncIterator,
+    Dict,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Union,
+)
+from urllib.parse import urljoin, urlsplit
+
+from lovesoup.batch import ExtractionError, ExtractionRecord, extract_chunk, init_worker
+from lovesoup.cooks import get_cook
+from lovesoup.dispatch import detect_site
+
+USER_AGENT = "lovesoup"
+REDIRECTS = (301, 302, 303, 307, 308)
+
+HostKey = Tuple[str, str, int]
+_Connection = Tuple[asyncio.StreamReader, asyncio.StreamWriter]
+
+
+class HTTPStatusError(Exception):
+    def __init__(self, url: str, status: int):
+        super().__init__(f"HTTP {status} for {url}")
+        self.url = url
+        self.status = status
+
+
+class Page(NamedTuple):
+    url: str
+    status: int
+    headers: Dict[str, str]
+    text: str
+
+
+def _host_key(url: str) -> Tuple[HostKey, str]:
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https"):
+        raise ValueError(f"Not an HTTP URL: {url!r}")
+    port = parts.port or (443 if parts.scheme == "https" else 80)
+    target = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+    return (parts.scheme, parts.hostname, port), target
+
+
+def _charset(headers: Dict[str, str]) -> str:
+    for param in headers.get("content-type", "").split(";")[1:]:
+        name, _, value = param.strip().partition("=")
+        if name.lower() == "charset" and value:
+            return value.strip("\"'")
+    return "utf-8"
+
+
+def _decompress(body: bytes, encoding: str) -> bytes:
+    if encoding == "gzip":
+        return zlib.decompress(body, 16 + zlib.MAX_WBITS)
+    if encoding == "deflate":
+        return zlib.decompress(body)
+    return body
+
+
+class RateLimiter:
+    """
+    Spaces out requests to the same host to at most `rate` per second
+    """
+
+    def __init__(self, rate: Optional[float]):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next: Dict[HostKey, float] = {}
+
+    async def wait(self, key: HostKey) -> None:
+        if not self.interval:
+            return
+        now = asyncio.get_running_loop().time()
+        slot = max(now, self._next.get(key, now))
+        self._next[key] = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+class Fetcher:
+    def __init__(
+        self,
+        concurrency: int = 32,
+        per_host: int = 4,
+        rate: Optional[float] = None,
+        timeout: float = 30.0,
+        max_redirects: int = 5,
+        headers: Optional[Dict[str, str]] = None,
+    ):
+        """
+        Args:
+            concurrency: requests in flight over all hosts.
+            per_host: requests in flight, and so open connections, per host.
+            rate: requests per second per host, unlimited when None.
+            timeout: seconds for a whole request, connection included.
+            max_redirects: redirects followed before giving up.
+            headers: extra request headers.
+        """
+        self.concurrency = concurrency
+        self.per_host = per_host
+        self.timeout = timeout
+        self.max_redirects = max_redirects
+        self.headers = {"User-Agent": USER_AGENT, "Accept-Encoding": "gzip, deflate"}
+        self.headers.update(headers or {})
+        self.rate_limiter = RateLimiter(rate)
+        self.requests = 0
+        self.connections_opened = 0
+        self._slots = asyncio.Semaphore(concurrency)
+        self._host_slots: Dict[HostKey, asyncio.Semaphore] = defaultdict(
+            lambda: asyncio.Semaphore(per_host)
+        )
+        self._idle: Dict[HostKey, List[_Connection]] = defaultdict(list)
+        self._ssl = ssl.create_default_context()
+
+    async def fetch(self, url: str) -> Page:
+        """
+        GET `url`, following redirects. Raises HTTPStatusError for 4xx/5xx answers.
+        """
+        for _ in range(self.max_redirects + 1):
+            status, headers, body = await self._get(url)
+            if status in REDIRECTS and "location" in headers:
+                url = urljoin(url, headers["location"])
+                continue
+            if status >= 400:
+                raise HTTPStatusError(url, status)
+            text = body.decode(_charset(headers), errors="replace")
+            return Page(url, status, headers, text)
+        raise HTTPStatusError(url, status)
+
+    async def _get(self, url: str) -> Tuple[int, Dict[str, str], bytes]:
+        key, target = _host_key(url)
+        async with self._slots, self._host_slots[key]:
+            await self.rate_limiter.wait(key)
+            self.requests += 1
+            return await asyncio.wait_for(self._request(key, target), self.timeout)
+
+    async def _request(self, key: HostKey, target: str) -> Tuple[int, Dict[str, str], bytes]:
+        while True:
+            connection, reused = await self._connect(key)
+            try:
+                status, headers, body, keep_alive = await self._exchange(
+                    connection, key, target
+                )
+            except (ConnectionError, asyncio.IncompleteReadError):
+                self._close(connection)
+                if reused:
+                    # The server dropped an idle keep-alive connection, try a new one
+                    continue
+                raise
+            except BaseException:
+                self._close(connection)
+                raise
+            if keep_alive:
+                self._idle[key].append(connection)
+            else:
+                self._close(connection)
+            return status, headers, body
+
+    async def _connect(self, key: HostKey) -> Tuple[_Connection, bool]:
+        idle = self._idle[key]
+        while idle:
+            connection = idle.pop()
+            if not connection[0].at_eof() and not connection[1].is_closing():
+                return connection, True
+            self._close(connection)
+        scheme, host, port = key
+        connection = await asyncio.open_connection(
+            host, port, ssl=self._ssl if scheme == "https" else None
+        )
+        self.connections_opened += 1
+        return connection, False
+
+    async def _exchange(self, connection: _Connection, key: HostKey, target: str):
+        reader, writer = connection
+        scheme, host, port = key
+        default_port = 443 if scheme == "https" else 80
+        host_header = host if port == default_port else f"{host}:{port}"
+        lines = [f"GET {target} HTTP/1.1", f"Host: {host_header}"]
+        lines += [f"{name}: {value}" for name, value in self.headers.items()]
+        lines.append("Connection: keep-alive")
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+        await writer.drain()
+
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionResetError("Connection closed before the response")
+        version, status = status_line.decode("latin-1").split(None, 2)[:2]
+        status = int(status)
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        connection_header = headers.get("connection", "").lower()
+        if version == "HTTP/1.0":
+            keep_alive = connection_header == "keep-alive"
+        else:
+            keep_alive = connection_header != "close"
+
+        if status in (204, 304) or 100 <= status < 200:
+            body = b""
+        elif headers.get("transfer-encoding", "").lower() == "chunked":
+            body = await self._read_chunked(reader)
+        elif "content-length" in headers:
+            body = await reader.readexactly(int(headers["content-length"]))
+        else:
+            body = await reader.read()
+            keep_alive = False
+        body = _decompress(body, headers.get("content-encoding", "").lower())
+        return status, headers, body, keep_alive
+
+    @staticmethod
+    async def _read_chunked(reader: asyncio.StreamReader) -> bytes:
+        chunks = []
+        while True:
+            size = int((await reader.readline()).split(b";")[0].strip() or b"0", 16)
+            if size == 0:
+                # Skip the trailers
+                while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass
+                return b"".join(chunks)
+            chunks.append(await reader.readexactly(size))
+            await reader.readline()
+
+    @staticmethod
+    def _close(connection: _Connection) -> None:
+        connection[1].close()
+
+    async def close(self) -> None:
+        for connections in self._idle.values():
+            for connection in connections:
+                self._close(connection)
+        self._idle.clear()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+        return False
+
+
+async def _aiter(items: Union[Iterable, AsyncIterable]) -> AsyncIterator:
+    if hasattr(items, "__aiter__"):
+        async for item in items:
+            yield item
+    else:
+        for item in items:
+            yield item
+
+
+def _error_record(url: str, error: BaseException) -> ExtractionRecord:
+    site = detect_site(url=url)
+    extraction_error = ExtractionError(site or "auto", url, type(error).__name__, str(error))
+    return ExtractionRecord(url, site, None, extraction_error)
+
+
+def _extraction_task(url: str, html: str) -> Tuple:
+    # Unknown domains are detected from the page itself by the worker
+    site = detect_site(url=url)
+    return (get_cook(site) if site else None, site, (), html, url)
+
+
+_DONE = object()
+
+
+async def ingest(
+    urls: Union[Iterable[str], AsyncIterable[str]],
+    fetcher: Optional[Fetcher] = None,
+    workers: Optional[int] = None,
+    queue_size: int = 64,
+    executor: Optional[Executor] = None,
+) -> AsyncIterator[ExtractionRecord]:
+    """
+    Fetch and extract every URL, yielding an ExtractionRecord per URL as soon
+    as it is done (not in input order). Fetch failures and HTTP errors come
+    out as records with an error, like extraction failures.
+
+    Args:
+        urls: page URLs, a plain or an async iterable, consumed lazily.
+        fetcher: HTTP client, a default Fetcher when None (closed at the end).
+        workers: extraction processes, defaults to the number of CPUs. With 1,
+            pages are extracted in a thread, still overlapping the fetches.
+        queue_size: fetched pages waiting for a worker before fetching pauses.
+        executor: extract in this executor instead of starting a pool.
+    """
+    loop = asyncio.get_running_loop()
+    own_fetcher = fetcher is None
+    fetcher = fetcher or Fetcher()
+    if workers is None:
+        workers = os.cpu_count() or 1
+    own_executor = executor is None
+    if executor is None:
+        if workers > 1:
+            executor = ProcessPoolExecutor(max_workers=workers, initializer=init_worker)
+        else:
+            executor = ThreadPoolExecutor(max_workers=1, initializer=init_worker)
+
+    pages: asyncio.Queue = asyncio.Queue(queue_size)
+    records: asyncio.Queue = asyncio.Queue(queue_size)
+    # Every fetch and extraction task, so they can all be cancelled if the
+    # caller stops iterating early
+    tasks = set()
+
+    def spawn(coroutine) -> asyncio.Future:
+        task = asyncio.ensure_future(coroutine)
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+        return task
+
+    async def fetch_one(url: str, slot: asyncio.Semaphore) -> None:
+        try:
+            page = await fetcher.fetch(url)
+            await pages.put((url, page.text, None))
+        except Exception as e:
+            await pages.put((url, None, e))
+        finally:
+            slot.release()
+
+    async def fetch_all() -> None:
+        # Never more fetch tasks than the fetcher can serve at once, so the
+        # URL iterable is only read as fast as pages come in
+        slot = asyncio.Semaphore(fetcher.concurrency)
+        fetches = []
+        async for url in _aiter(urls):
+            await slot.acquire()
+            fetches.append(spawn(fetch_one(url, slot)))
+            fetches = [task for task in fetches if not task.done()]
+        await asyncio.gather(*fetches)
+        await pages.put(_DONE)
+
+    async def extract_one(url: str, html: str, slot: asyncio.Semaphore) -> None:
+        try:
+            chunk = [_extraction_task(url, html)]
+            for record in await loop.run_in_executor(executor, extract_chunk, chunk):
+                await records.put(record)
+        except Exception as e:
+            await records.put(_error_record(url, e))
+        finally:
+            slot.release()
+
+    async def extract_all() -> None:
+        # A couple of pages per worker in flight, the rest waits in `pages`
+        slot = asyncio.Semaphore(max(workers, 1) * 2)
+        extractions = []
+        while True:
+            item = await pages.get()
+            if item is _DONE:
+                break
+            url, html, error = item
+            if error is not None:
+                await records.put(_error_record(url, error))
+                continue
+            await slot.acquire()
+            extractions.append(spawn(extract_one(url, html, slot)))
+            extractions = [task for task in extractions if not task.done()]
+        await asyncio.gather(*extractions)
+
+    async def run() -> None:
+        try:
+            await asyncio.gather(fetch_all(), extract_all())
+        except Exception as e:
+            await records.put(e)
+        await records.put(_DONE)
+
+    runner = spawn(run())
+    try:
+        while True:
+            record = await records.get()
+            if record is _DONE:
+                break
+            if isinstance(record, Exception):
+                raise record
+            yield record
+    finally:
+        for task in list(tasks):
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if own_fetcher:
+            await fetcher.close()
+        if own_executor:
+            await loop.run_in_executor(
+                None, lambda: executor.shutdown(wait=True, cancel_futures=True)
+            )
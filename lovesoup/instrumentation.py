@@ -0,0 +1,272 @@
+"""
+File: instrumentation.py
+Desc: Per-stage timings and counters for DataExtractor
+
+Pass an `Instrumentation` to any cook to see where the time goes:
+
+    metrics = Instrumentation()
+    extractor = Mogi(instrumentation=metrics)
+    extractor.run(path)
+    print(metrics.to_prometheus())
+
+Stages are "read" (file reading), "parse" (HTML parsing), "select" (template
+evaluation), "post_process" (cooks.py logic) and "validate" (precook model
+validation, which happens inside "post_process") and, with `split_addresses`,
+"address". Without an instrumentation object, extractors skip all of this
+bookkeeping.
+
+Every selector and child selector of the template output is also counted as
+matched, empty (found, but with no text or value) or missing (found nothing),
+see `selector_outcomes` and `lovesoup.telemetry`.
+"""
+
+import json
+import time
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+StageCallback = Callable[[str, str, float], None]
+
+MATCHED, EMPTY, MISSING = "matched", "empty", "missing"
+OUTCOMES = (MATCHED, EMPTY, MISSING)
+
+
+def _outcome(path: str, value, outcomes: List[Tuple[str, str]]) -> str:
+    if value is None:
+        return MISSING
+    if isinstance(value, dict):
+        # Children: each one counts on its own, the parent matched if one of them did
+        found = [_record(f"{path}.{name}", child, outcomes) for name, child in value.items()]
+    elif isinstance(value, list):
+        found = [_outcome(path, item, outcomes) for item in value]
+    else:
+        return EMPTY if value == "" else MATCHED
+    return MATCHED if MATCHED in found else EMPTY
+
+
+def _record(path: str, value, outcomes: List[Tuple[str, str]]) -> str:
+    outcome = _outcome(path, value, outcomes)
+    outcomes.append((path, outcome))
+    return outcome
+
+
+def selector_outcomes(primary_result: Dict) -> List[Tuple[str, str]]:
+    """
+    (selector path, outcome) of every selector in a template output, children
+    as "parent.child" once per element of their parent. A selector is missing
+    when it found nothing (or its attribute is not set), empty when what it
+    found has no text, and matched otherwise.
+    """
+    outcomes = []
+    for key, value in primary_result.items():
+        _record(key, value, outcomes)
+    return outcomes
+
+
+class _Stage:
+    __slots__ = ("owner", "template", "name", "started")
+
+    def __init__(self, owner: "Instrumentation", template: str, name: str):
+        self.owner = owner
+        self.template = template
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.owner.record_stage(
+            self.template, self.name, time.perf_counter() - self.started, exc is not None
+        )
+        return False
+
+
+class Instrumentation:
+    """
+    Collects stage durations and counters, labelled by template name.
+    Counters only grow; `merge` adds up instances coming from several workers.
+    """
+
+    _COUNTERS = (
+        "stage_seconds",
+        "stage_calls",
+        "stage_errors",
+        "pages",
+        "bytes_in",
+        "validation_failures",
+        "selector_hits",
+        "selector_misses",
+        "region_paths",
+        "selector_outcomes",
+    )
+
+    def __init__(self, on_stage: Optional[StageCallback] = None):
+        """
+        on_stage: called with (template, stage, seconds) after every stage
+        """
+        self.on_stage = on_stage
+        self.stage_seconds: Dict[Tuple[str, str], float] = defaultdict(float)
+        self.stage_calls: Dict[Tuple[str, str], int] = defaultdict(int)
+        self.stage_errors: Dict[Tuple[str, str], int] = defaultdict(int)
+        self.pages: Dict[str, int] = defaultdict(int)
+        self.bytes_in: Dict[str, int] = defaultdict(int)
+        self.validation_failures: Dict[str, int] = defaultdict(int)
+        self.selector_hits: Dict[Tuple[str, str], int] = defaultdict(int)
+        self.selector_misses: Dict[Tuple[str, str], int] = defaultdict(int)
+        self.region_paths: Dict[Tuple[str, str], int] = defaultdict(int)
+        self.selector_outcomes: Dict[Tuple[str, str, str], int] = defaultdict(int)
+
+    def stage(self, template: str, name: str) -> _Stage:
+        return _Stage(self, template, name)
+
+    def record_stage(self, template: str, name: str, seconds: float, failed=False):
+        key = (template, name)
+        self.stage_seconds[key] += seconds
+        self.stage_calls[key] += 1
+        if failed:
+            self.stage_errors[key] += 1
+        if self.on_stage is not None:
+            self.on_stage(template, name, seconds)
+
+    def record_page(self, template: str, size: int) -> None:
+        self.pages[template] += 1
+        self.bytes_in[template] += size
+
+    def record_validation_failure(self, template: str) -> None:
+        self.validation_failures[template] += 1
+
+    def record_region_path(self, template: str, path: str) -> None:
+        """
+        How a page went with region hints on, see `lovesoup.regions`
+        """
+        self.region_paths[(template, path)] += 1
+
+    def record_selectors(self, template: str, primary_result: Dict) -> None:
+        """
+        A selector hits when it produced something other than None or an empty value
+        """
+        for key, value in primary_result.items():
+            if value is None or value == "" or value == []:
+                self.selector_misses[(template, key)] += 1
+            else:
+                self.selector_hits[(template, key)] += 1
+        for path, outcome in selector_outcomes(primary_result):
+            self.selector_outcomes[(template, path, outcome)] += 1
+
+    def clear(self) -> None:
+        for name in self._COUNTERS:
+            getattr(self, name).clear()
+
+    def merge(self, other: "Instrumentation") -> "Instrumentation":
+        for name in self._COUNTERS:
+            mine = getattr(self, name)
+            for key, value in getattr(other, name).items():
+                mine[key] += value
+        return self
+
+    def to_dict(self) -> Dict:
+        templates = {}
+
+        def entry(template):
+            return templates.setdefault(
+                template,
+                {
+                    "pages": 0,
+                    "bytes_in": 0,
+                    "validation_failures": 0,
+                    "stages": {},
+                    "selectors": {},
+                    "region_paths": {},
+                    "selector_outcomes": {},
+                },
+            )
+
+        for template, count in self.pages.items():
+            entry(template)["pages"] = count
+            entry(template)["bytes_in"] = self.bytes_in[template]
+        for template, count in self.validation_failures.items():
+            entry(template)["validation_failures"] = count
+        for (template, stage), seconds in self.stage_seconds.items():
+            entry(template)["stages"][stage] = {
+                "seconds": seconds,
+                "calls": self.stage_calls[(template, stage)],
+                "errors": self.stage_errors.get((template, stage), 0),
+            }
+        for template, selector in set(self.selector_hits) | set(self.selector_misses):
+            entry(template)["selectors"][selector] = {
+                "hits": self.selector_hits.get((template, selector), 0),
+                "misses": self.selector_misses.get((template, selector), 0),
+            }
+        for (template, path), count in self.region_paths.items():
+            entry(template)["region_paths"][path] = count
+        for (template, path, outcome), count in self.selector_outcomes.items():
+            outcomes = entry(template)["selector_outcomes"].setdefault(
+                path, dict.fromkeys(OUTCOMES, 0)
+            )
+            outcomes[outcome] = count
+        return templates
+
+    def to_json(self, **kwargs) -> str:
+        return json.dumps(self.to_dict(), **kwargs)
+
+    def to_prometheus(self, prefix: str = "lovesoup") -> str:
+        """
+        Prometheus text exposition format
+        """
+        lines = []
+
+        def metric(name: str, help_text: str, samples: Iterable[Tuple[Dict, float]]):
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} counter")
+            for labels, value in samples:
+                label_text = ",".join(f'{k}="{v}"' for k, v in labels.items())
+                lines.append(f"{prefix}_{name}{{{label_text}}} {value}")
+
+        def by_stage(counter):
+            return [
+                ({"template": t, "stage": s}, v) for (t, s), v in sorted(counter.items())
+            ]
+
+        def by_template(counter):
+            return [({"template": t}, v) for t, v in sorted(counter.items())]
+
+        def by_selector(counter):
+            return [
+                ({"template": t, "selector": s}, v) for (t, s), v in sorted(counter.items())
+            ]
+
+        metric("stage_seconds_total", "Time spent per stage.", by_stage(self.stage_seconds))
+        metric("stage_calls_total", "Stage executions.", by_stage(self.stage_calls))
+        metric("stage_errors_total", "Stages that raised.", by_stage(self.stage_errors))
+        metric("pages_total", "Pages extracted.", by_template(self.pages))
+        metric("bytes_in_total", "Input size of the pages.", by_template(self.bytes_in))
+        metric(
+            "validation_failures_total",
+            "Precook model validation failures.",
+            by_template(self.validation_failures),
+        )
+        metric(
+            "selector_hits_total",
+            "Template selectors that found a value.",
+            by_selector(self.selector_hits),
+        )
+        metric(
+            "selector_misses_total",
+            "Template selectors that found nothing.",
+            by_selector(self.selector_misses),
+        )
+        metric(
+            "region_paths_total",
+            "Pages parsed from their region hint, or in full and why.",
+            [({"template": t, "path": p}, v) for (t, p), v in sorted(self.region_paths.items())],
+        )
+        metric(
+            "selector_outcomes_total",
+            "Selectors and child selectors that matched, were empty or missing.",
+            [
+                ({"template": t, "selector": s, "outcome": o}, v)
+                for (t, s, o), v in sorted(self.selector_outcomes.items())
+            ],
+        )
+        return "\n".join(lines) + "\n"
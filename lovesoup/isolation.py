@@ -0,0 +1,449 @@
+"""
+File: isolation.py
+Desc: Batch extraction isolating every page: timeouts, memory caps, recycled workers
+
+`extract_records` runs pages in a process pool: a page that hangs holds its
+worker forever, and a worker that dies (segfault, OOM killer) breaks the whole
+pool. Here every worker has its own pipe and takes one page at a time:
+
+    - a page running longer than `timeout` is stopped inside its worker
+      (SIGALRM); a worker that still doesn't answer, stuck in C code, is
+      killed and replaced;
+    - `memory_limit_mb` caps the address space of the workers, a page going
+      over it fails with MemoryError instead of taking the machine down;
+    - a worker whose RSS is over `max_rss_mb` after a page, or that ran
+      `max_pages_per_worker` pages, is replaced by a fresh one;
+    - pages that timed out, ran out of memory or killed their worker are
+      retried `retries` times on a fresh worker (exceptions raised by the
+      cooks are not: the same page fails the same way);
+    - pages failing for good are copied to `quarantine_dir` when given.
+
+Failed pages come back as records whose error is a PageFailure, telling the
+stage the page failed at and the hash of the page:
+
+    for record in extract_isolated(items, workers=8, timeout=10):
+        if record.error is not None:
+            print(record.error.to_dict())
+"""
+
+import hashlib
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import signal
+import time
+from collections import deque
+from multiprocessing.connection import wait
+from typing import Deque, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from pydantic import ValidationError
+
+from lovesoup.batch import (
+    ExtractionError,
+    ExtractionRecord,
+    describe_source,
+    drain_metrics,
+    init_worker,
+    is_html,
+    merge_metrics,
+    read_page,
+    resolve_cook,
+    resolve_tasks,
+)
+
+# What a worker is doing, shared with the parent to tell where a page hung
+STAGES = ("idle", "read", "detect", "extract", "post_process")
+IDLE, READ, DETECT, EXTRACT, POST_PROCESS = range(len(STAGES))
+# Stages the cooks go through, see `DataExtractor.stage_listener`
+COOK_STAGES = {
+    "read": READ,
+    "parse": EXTRACT,
+    "select": EXTRACT,
+    "post_process": POST_PROCESS,
+    "validate": POST_PROCESS,
+    "address": POST_PROCESS,
+}
+
+# Failures a fresh worker may get past
+RETRYABLE = frozenset({"PageTimeout", "MemoryError", "WorkerCrashed"})
+
+# Time a worker is given to answer once its page timed out, before it is killed
+KILL_GRACE = 2.0
+
+
+class PageTimeout(Exception):
+    """
+    A page ran longer than the timeout
+    """
+
+
+class PageFailure(ExtractionError):
+    """
+    A page that failed in an isolated run, with the stage it failed at
+    ("read", "detect", "extract", "post_process" or "validate"), the SHA-256
+    of the page and the number of times it was tried.
+    """
+
+    def __init__(
+        self,
+        site: str,
+        source: str,
+        error_type: str,
+        message: str,
+        stage: str,
+        input_hash: Optional[str] = None,
+        attempts: int = 1,
+    ):
+        super().__init__(site, source, error_type, message)
+        self.stage = stage
+        self.input_hash = input_hash
+        self.attempts = attempts
+
+    def __reduce__(self):
+        return (
+            self.__class__,
+            (
+                self.site,
+                self.source,
+                self.error_type,
+                self.message,
+                self.stage,
+                self.input_hash,
+                self.attempts,
+            ),
+        )
+
+    def to_dict(self) -> Dict:
+        return {
+            "site": self.site,
+            "source": self.source,
+            "stage": self.stage,
+            "type": self.error_type,
+            "message": self.message,
+            "input_hash": self.input_hash,
+            "attempts": self.attempts,
+        }
+
+
+class _Limits(NamedTuple):
+    timeout: Optional[float]
+    max_rss_mb: Optional[float]
+    memory_limit_mb: Optional[int]
+    max_pages: Optional[int]
+
+
+def rss_mb() -> float:
+    """
+    Current resident set size of this process, the peak one where /proc is missing
+    """
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1 << 20)
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _limit_memory(memory_limit_mb: Optional[int]) -> None:
+    if not memory_limit_mb:
+        return
+    _, hard = resource.getrlimit(resource.RLIMIT_AS)
+    limit = memory_limit_mb << 20
+    if hard != resource.RLIM_INFINITY:
+        limit = min(limit, hard)
+    resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+
+
+def _on_alarm(signum, frame):
+    raise PageTimeout("Page took longer than the timeout")
+
+
+def _run_stages(
+    cook_cls: Optional[type], template_name: Optional[str], options: Tuple, source, stage
+):
+    """
+    `batch.extract_one`, telling the parent which stage the page is at
+    """
+    stage.value = READ
+    page = read_page(source)
+    if cook_cls is None:
+        stage.value = DETECT
+    template_name, cook = resolve_cook(cook_cls, template_name, options, page)
+    stage.value = EXTRACT
+
+    def enter(name: str) -> None:
+        stage.value = COOK_STAGES.get(name, stage.value)
+
+    cook.stage_listener = enter
+    try:
+        return template_name, cook.run_html(page)
+    finally:
+        cook.stage_listener = None
+
+
+def _failed_stage(stage: int, error: BaseException) -> str:
+    if stage == POST_PROCESS and isinstance(error, ValidationError):
+        return "validate"
+    return STAGES[stage]
+
+
+def _worker_main(conn, stage, limits: _Limits) -> None:
+    """
+    Worker process: runs the pages sent over `conn` one at a time, until it
+    gets None or has to be recycled. Answers (index, site, result, failure,
+    retiring, counters) for every page, failure being (stage, error type,
+    message) and counters what its Instrumentation objects counted.
+    """
+    _limit_memory(limits.memory_limit_mb)
+    init_worker()
+    signal.signal(signal.SIGALRM, _on_alarm)
+    pages = 0
+    while True:
+        task = conn.recv()
+        if task is None:
+            return
+        index, cook_cls, template_name, options, source = task
+        site, result, failure = template_name, None, None
+        out_of_memory = False
+        try:
+            if limits.timeout:
+                signal.setitimer(signal.ITIMER_REAL, limits.timeout)
+            try:
+                site, result = _run_stages(cook_cls, template_name, options, source, stage)
+            finally:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+        except MemoryError as e:
+            out_of_memory = True
+            failure = (STAGES[stage.value], "MemoryError", str(e))
+        except Exception as e:
+            failure = (_failed_stage(stage.value, e), type(e).__name__, str(e))
+        stage.value = IDLE
+        pages += 1
+        retiring = (
+            out_of_memory
+            or bool(limits.max_pages and pages >= limits.max_pages)
+            or bool(limits.max_rss_mb and rss_mb() > limits.max_rss_mb)
+        )
+        conn.send((index, site, result, failure, retiring, drain_metrics()))
+        if retiring:
+            return
+
+
+class _Worker:
+    """
+    Parent side of a worker process and the page it is running
+    """
+
+    def __init__(self, context, limits: _Limits):
+        self.conn, child_conn = context.Pipe()
+        self.stage = context.Value("b", IDLE, lock=False)
+        self.process = context.Process(
+            target=_worker_main, args=(child_conn, self.stage, limits), daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        self.job: Optional[Tuple] = None  # (index, task, attempts)
+        self.deadline: Optional[float] = None
+
+    def send(self, job: Tuple, timeout: Optional[float]) -> None:
+        index, (cook_cls, template_name, options, source, _), _ = job
+        self.job = job
+        self.deadline = None if not timeout else time.monotonic() + timeout + KILL_GRACE
+        self.conn.send((index, cook_cls, template_name, options, source))
+
+    def stop(self, kill: bool = False) -> None:
+        if kill:
+            self.process.kill()
+        else:
+            try:
+                self.conn.send(None)
+            except (OSError, ValueError):
+                pass
+        self.process.join(1.0)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+
+def input_hash(source) -> Optional[str]:
+    """
+    SHA-256 of a page (HTML string or file), None when the file can't be read
+    """
+    if is_html(source):
+        return hashlib.sha256(source.encode("utf-8")).hexdigest()
+    digest = hashlib.sha256()
+    try:
+        with open(source, "rb") as file:
+            for block in iter(lambda: file.read(1 << 20), b""):
+                digest.update(block)
+    except OSError:
+        return None
+    return digest.hexdigest()
+
+
+def quarantine(failure: PageFailure, source, directory) -> None:
+    """
+    Keep a failed page and its failure record as <hash>.html and <hash>.json
+    """
+    if failure.input_hash is None:
+        return
+    os.makedirs(directory, exist_ok=True)
+    stem = os.path.join(directory, failure.input_hash)
+    if is_html(source):
+        with open(stem + ".html", "w", encoding="utf-8") as file:
+            file.write(source)
+    else:
+        shutil.copyfile(source, stem + ".html")
+    with open(stem + ".json", "w", encoding="utf-8") as file:
+        json.dump(failure.to_dict(), file, ensure_ascii=False, indent=2)
+
+
+def _signal_name(exitcode: Optional[int]) -> str:
+    if exitcode is not None and exitcode < 0:
+        try:
+            return f"killed by {signal.Signals(-exitcode).name}"
+        except ValueError:
+            pass
+    return f"exit code {exitcode}"
+
+
+def extract_isolated(
+    items: Iterable[Tuple],
+    workers: Optional[int] = None,
+    timeout: Optional[float] = 30.0,
+    max_rss_mb: Optional[float] = None,
+    memory_limit_mb: Optional[int] = None,
+    max_pages_per_worker: Optional[int] = 1000,
+    retries: int = 1,
+    quarantine_dir=None,
+    ordered: bool = True,
+) -> Iterator[ExtractionRecord]:
+    """
+    Like `extract_records`, every page isolated from the others, see the module docstring.
+
+    Args:
+        items: (site, source) pairs or (site, source, label) triples, see `extract_many`.
+        workers: number of worker processes, defaults to the CPU count.
+        timeout: seconds a page may run, None for no limit.
+        max_rss_mb: replace a worker whose RSS is over this after a page.
+        memory_limit_mb: address space limit of each worker (RLIMIT_AS).
+        max_pages_per_worker: replace a worker after this many pages, None never.
+        retries: times a page that timed out, ran out of memory or killed
+            its worker is tried again on a fresh worker.
+        quarantine_dir: directory to copy pages failing for good to, with
+            their failure record.
+        ordered: yield records in input order, otherwise as soon as they are ready.
+
+    Returns:
+        An iterator of ExtractionRecord, errors being PageFailure. Never raises
+        for a failed page.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(workers, 1)
+    limits = _Limits(timeout, max_rss_mb, memory_limit_mb, max_pages_per_worker)
+    context = multiprocessing.get_context()
+
+    tasks = enumerate(resolve_tasks(items))
+    retry: Deque[Tuple] = deque()
+    # Pages sent but not yielded yet: bounds what ordered runs buffer
+    window = workers * 4
+    outstanding = 0
+    done: Dict[int, ExtractionRecord] = {}
+    next_index = 0
+    exhausted = False
+
+    def finish(job: Tuple, site, result, failure: Optional[Tuple]) -> Optional[ExtractionRecord]:
+        """
+        Record of a page, or None when it goes for another try
+        """
+        index, (cook_cls, template_name, _, source, label), attempts = job
+        label = label or describe_source(source)
+        if failure is None:
+            return ExtractionRecord(label, site, result, None)
+        stage, error_type, message = failure
+        if error_type in RETRYABLE and attempts <= retries:
+            retry.append((index, job[1], attempts + 1))
+            return None
+        error = PageFailure(
+            template_name or "auto", label, error_type, message, stage, input_hash(source), attempts
+        )
+        if quarantine_dir is not None:
+            quarantine(error, source, quarantine_dir)
+        return ExtractionRecord(label, template_name, None, error)
+
+    pool: List[_Worker] = [_Worker(context, limits) for _ in range(workers)]
+    try:
+        while True:
+            for worker in pool:
+                if worker.job is not None:
+                    continue
+                if retry:
+                    worker.send(retry.popleft(), timeout)
+                elif not exhausted and outstanding < window:
+                    try:
+                        index, task = next(tasks)
+                    except StopIteration:
+                        exhausted = True
+                        continue
+                    outstanding += 1
+                    worker.send((index, task, 1), timeout)
+            busy = [worker for worker in pool if worker.job is not None]
+            if not busy:
+                break
+
+            deadlines = [worker.deadline for worker in busy if worker.deadline is not None]
+            wait_for = None if not deadlines else max(min(deadlines) - time.monotonic(), 0)
+            ready = wait([worker.conn for worker in busy], wait_for)
+
+            records = []
+            for i, worker in enumerate(pool):
+                if worker.job is None:
+                    continue
+                job = worker.job
+                replace = kill = False
+                if worker.conn in ready:
+                    try:
+                        _, site, result, failure, replace, counters = worker.conn.recv()
+                        for worker_counters in counters:
+                            merge_metrics(worker_counters)
+                    except (EOFError, OSError):
+                        worker.process.join(1.0)
+                        site, result, replace, kill = None, None, True, True
+                        failure = (
+                            STAGES[worker.stage.value],
+                            "WorkerCrashed",
+                            f"Worker died on this page ({_signal_name(worker.process.exitcode)})",
+                        )
+                elif worker.deadline is not None and time.monotonic() >= worker.deadline:
+                    failure = (
+                        STAGES[worker.stage.value],
+                        "PageTimeout",
+                        f"No answer after {timeout + KILL_GRACE:g}s, worker killed",
+                    )
+                    site, result, replace, kill = None, None, True, True
+                else:
+                    continue
+                worker.job = worker.deadline = None
+                if replace:
+                    worker.stop(kill)
+                    pool[i] = _Worker(context, limits)
+                record = finish(job, site, result, failure)
+                if record is not None:
+                    records.append((job[0], record))
+
+            for index, record in records:
+                if ordered:
+                    done[index] = record
+                else:
+                    outstanding -= 1
+                    yield record
+            while next_index in done:
+                outstanding -= 1
+                yield done.pop(next_index)
+                next_index += 1
+    finally:
+        for worker in pool:
+            worker.stop(kill=worker.job is not None)
@@ -0,0 +1,106 @@
+"""
+File: json_scan.py
+Desc: Partial JSON reading for pages that embed their state as a JSON blob.
+
+`find_json_path` walks the JSON text down a path of object keys and only
+decodes the value at the end of it. Everything else is skipped at the token
+level, so reading a small subtree from a big page state neither decodes nor
+holds the rest of the document in memory.
+"""
+
+import json
+import re
+from typing import Any, Optional, Sequence
+
+try:
+    import orjson
+except ImportError:  # optional fast backend
+    orjson = None
+
+# A JSON string, or a bracket. Only these matter when skipping a container.
+_TOKEN = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"|[{}\[\]]')
+_WS = re.compile(r"\s*")
+_DECODER = json.JSONDecoder()
+
+_SCRIPT_JSON = re.compile(
+    r"<script\b[^>]*\btype\s*=\s*[\"']?application/json[\"']?[^>]*>", re.IGNORECASE
+)
+_SCRIPT_END = re.compile(r"</script", re.IGNORECASE)
+
+
+def loads(text: str) -> Any:
+    """
+    Decode a whole JSON document, with orjson when it is installed
+    """
+    if orjson is not None:
+        return orjson.loads(text)
+    return json.loads(text)
+
+
+def _skip_ws(text: str, pos: int) -> int:
+    return _WS.match(text, pos).end()
+
+
+def _skip_value(text: str, pos: int) -> int:
+    """
+    Return the position right after the JSON value starting at `pos`
+    """
+    char = text[pos]
+    if char == '"':
+        return _TOKEN.match(text, pos).end()
+    if char in "{[":
+        depth = 0
+        for token in _TOKEN.finditer(text, pos):
+            char = token.group()
+            if char in "{[":
+                depth += 1
+            elif char in "}]":
+                depth -= 1
+                if depth == 0:
+                    return token.end()
+        raise ValueError("Unterminated JSON container")
+    return _DECODER.raw_decode(text, pos)[1]
+
+
+def find_json_path(text: str, path: Sequence[str]) -> Any:
+    """
+    Decode only the value found at `path` (a sequence of object keys).
+
+    Raises:
+        KeyError: one of the keys is missing, or a value on the path is not an object.
+        ValueError: the text is not valid JSON along the way.
+    """
+    pos = _skip_ws(text, 0)
+    for key in path:
+        if text[pos] != "{":
+            raise KeyError(key)
+        pos = _skip_ws(text, pos + 1)
+        while True:
+            if text[pos] != '"':
+                raise KeyError(key)
+            token = _TOKEN.match(text, pos)
+            name = json.loads(token.group())
+            pos = _skip_ws(text, token.end())
+            if text[pos] != ":":
+                raise ValueError(f"Expected ':' at position {pos}")
+            pos = _skip_ws(text, pos + 1)
+            if name == key:
+                break
+            pos = _skip_ws(text, _skip_value(text, pos))
+            if text[pos] == ",":
+                pos = _skip_ws(text, pos + 1)
+    return _DECODER.raw_decode(text, pos)[0]
+
+
+def find_script_json(html: str) -> Optional[str]:
+    """
+    Text of the first <script type="application/json"> element, found without
+    parsing the page. Returns None when there is no such script.
+    """
+    start = _SCRIPT_JSON.search(html)
+    if start is None:
+        return None
+    end = _SCRIPT_END.search(html, start.end())
+    if end is None:
+        return None
+    return html[start.end() : end.start()].strip()
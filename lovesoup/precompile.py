@@ -0,0 +1,46 @@
+"""
+File: precompile.py
+Desc: Save the compiled plans of the templates, so cooks start without YAML nor CSS translation
+
+    python -m lovesoup.precompile            # every template
+    python -m lovesoup.precompile mogi nhatot
+    python -m lovesoup.precompile --check    # exit 1 if a plan is missing or stale
+
+Run it after editing a template: a stale plan is ignored (its content hash no
+longer matches), and the template is compiled at startup again.
+"""
+
+import argparse
+import sys
+from typing import List, Optional
+
+from lovesoup.general_extractor import (
+    available_templates,
+    precompile_templates,
+    stale_precompiled_templates,
+)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[2].split(": ", 1)[1])
+    parser.add_argument("templates", nargs="*", help="template names, default all")
+    parser.add_argument("--out-dir", help="where to write the plans, default next to the templates")
+    parser.add_argument(
+        "--check", action="store_true", help="only report missing or stale plans"
+    )
+    args = parser.parse_args(argv)
+
+    names = args.templates or available_templates()
+    if args.check:
+        stale = stale_precompiled_templates(names)
+        for name in stale:
+            print(f"STALE {name}")
+        return 1 if stale else 0
+
+    for path in precompile_templates(names, out_dir=args.out_dir):
+        print(f"Wrote {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,113 @@
+"""
+File: regions.py
+Desc: Region hints: parse only the part of a page a template reads
+
+Most templates read one block of the page (the listing), while headers,
+footers, related listings and inline scripts make up most of its size. A
+cook can declare where that block starts and ends:
+
+    REGION_HINT = RegionHint(
+        start='<div class="media-item"',
+        end='class="widget',
+        required=("images", "title", "phone"),
+    )
+
+With `region_hints=True`, the extractor then parses only the slice of the
+page from the tag holding `start` up to the tag holding `end`, and falls
+back to the whole page when:
+    - a marker is not found ("no_marker");
+    - the keys asked for are not all in the region ("not_covered");
+    - a `required` key came out empty from the region ("missing").
+
+Make `required` hold the first and the last things the template reads on
+the page: when both are found in the region, everything in between is too.
+"""
+
+from typing import Any, Dict, Iterable, Optional, Tuple, Union
+
+REGION = "region"
+NO_MARKER = "no_marker"
+NOT_COVERED = "not_covered"
+MISSING = "missing"
+
+# Every way a page can go, in report order
+REGION_PATHS = (REGION, NO_MARKER, NOT_COVERED, MISSING)
+
+
+def is_empty(value: Any) -> bool:
+    """
+    Nothing found: None, an empty string or list, or a dict of such values
+    """
+    if isinstance(value, dict):
+        return all(map(is_empty, value.values()))
+    return value is None or value == "" or value == []
+
+
+class RegionHint:
+    """
+    Where the data of a template lives in its pages, see the module docstring
+    """
+
+    __slots__ = ("start", "end", "keys", "required", "_byte_markers")
+
+    def __init__(
+        self,
+        start: str,
+        end: Optional[str] = None,
+        keys: Optional[Iterable[str]] = None,
+        required: Iterable[str] = (),
+    ):
+        """
+        Args:
+            start: text found in the first tag of the region, or inside it.
+            end: text found in the first tag after the region; None to keep
+                the page up to its end.
+            keys: template keys the region holds, None for all of them.
+            required: keys that must not come out empty from the region.
+        """
+        self.start = start
+        self.end = end
+        self.keys = None if keys is None else frozenset(keys)
+        self.required = tuple(required)
+        self._byte_markers = (start.encode("utf-8"), end and end.encode("utf-8"))
+
+    def covers(self, keys: Optional[Iterable[str]]) -> bool:
+        if self.keys is None:
+            return True
+        return keys is not None and self.keys.issuperset(keys)
+
+    def slice(self, html: Union[str, bytes]) -> Optional[Union[str, bytes]]:
+        """
+        The region of a page (text or UTF-8 bytes), None when a marker is missing
+        """
+        if isinstance(html, bytes):
+            start, end = self._byte_markers
+            tag = b"<"
+        else:
+            start, end = self.start, self.end
+            tag = "<"
+        first = html.find(start)
+        if first < 0:
+            return None
+        # Back to the opening of the tag holding the marker
+        first = max(html.rfind(tag, 0, first + 1), 0)
+        if end is None:
+            return html[first:]
+        last = html.find(end, first + len(start))
+        if last < 0:
+            return None
+        last = max(html.rfind(tag, first, last + 1), first)
+        return html[first:last]
+
+    def missing(self, primary_result: Dict, keys: Optional[Iterable[str]] = None) -> Tuple[str, ...]:
+        """
+        Required keys (among `keys` when given) that came out empty
+        """
+        required = self.required
+        if keys is not None:
+            keys = set(keys)
+            required = [key for key in required if key in keys]
+        return tuple(key for key in required if is_empty(primary_result.get(key)))
+
+    def __repr__(self) -> str:
+        return f"RegionHint(start={self.start!r}, end={self.end!r})"
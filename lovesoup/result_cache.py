@@ -0,0 +1,167 @@
+"""
+File: result_cache.py
+Desc: Content-addressed cache of extracted PropertyNormalized results
+
+Entries are keyed on (template name, template content hash, HTML hash, cook
+options), so re-crawled pages with unchanged content are served without
+parsing them again, and cooks set up differently (e.g. `split_addresses`)
+can share a cache. There is an in-memory LRU tier bounded by the size of the stored
+results, and an optional SQLite tier on disk shared by runs and processes.
+
+As soon as a cache sees a new content hash for a template, every entry built
+with another version of that template is dropped from both tiers.
+
+    cache = ResultCache(max_bytes=256 * 1024 * 1024, path="results.sqlite")
+    extractor = Mogi(result_cache=cache)
+"""
+
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from lovesoup.property_models import PropertyNormalized
+
+
+class CacheKey(NamedTuple):
+    template: str
+    template_hash: str
+    html_hash: str
+    # The cook options the result depends on, see `DataExtractor.CACHE_OPTIONS`
+    options: str = ""
+
+
+_COLUMNS = ("template", "template_hash", "html_hash", "options", "payload")
+
+
+def html_hash(html: str) -> str:
+    """
+    Hash of the page as it is, but for leading and trailing whitespace which
+    parsing drops anyway. Whitespace inside the page can change the
+    extracted text (no-break spaces, <pre>), so it is kept.
+    """
+    return hashlib.sha256(html.strip().encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, path: Optional[str] = None):
+        """
+        Args:
+            max_bytes: size budget of the in-memory tier (serialized results).
+            path: SQLite file for the on-disk tier, no disk tier when None.
+        """
+        self.max_bytes = max_bytes
+        self.path = path
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self._memory: "OrderedDict[CacheKey, bytes]" = OrderedDict()
+        self._template_hashes: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._db = None
+        if path is not None:
+            self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            columns = [row[1] for row in self._db.execute("PRAGMA table_info(results)")]
+            if columns and tuple(columns) != _COLUMNS:
+                # Written by an older version, keyed differently
+                self._db.execute("DROP TABLE results")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                " template TEXT NOT NULL,"
+                " template_hash TEXT NOT NULL,"
+                " html_hash TEXT NOT NULL,"
+                " options TEXT NOT NULL,"
+                " payload BLOB NOT NULL,"
+                " PRIMARY KEY (template, template_hash, html_hash, options))"
+            )
+            self._db.commit()
+
+    def __reduce__(self):
+        # Sent to a worker process: the same SQLite tier, a memory tier of its own
+        return _reopen, (self.max_bytes, self.path)
+
+    def key(self, template: str, template_hash: str, html: str, options: str = "") -> CacheKey:
+        if self._template_hashes.get(template) != template_hash:
+            self.invalidate(template, keep_hash=template_hash)
+            self._template_hashes[template] = template_hash
+        return CacheKey(template, template_hash, html_hash(html), options)
+
+    def get(self, key: CacheKey) -> Optional[PropertyNormalized]:
+        with self._lock:
+            payload = self._memory.get(key)
+            if payload is not None:
+                self._memory.move_to_end(key)
+            elif self._db is not None:
+                row = self._db.execute(
+                    "SELECT payload FROM results"
+                    " WHERE template = ? AND template_hash = ? AND html_hash = ? AND options = ?",
+                    key,
+                ).fetchone()
+                if row is not None:
+                    payload = row[0]
+                    self.disk_hits += 1
+                    self._remember(key, payload)
+            if payload is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return PropertyNormalized.model_validate_json(payload)
+
+    def put(self, key: CacheKey, result: PropertyNormalized) -> None:
+        payload = result.model_dump_json().encode("utf-8")
+        with self._lock:
+            self._remember(key, payload)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)", (*key, payload)
+                )
+                self._db.commit()
+
+    def _remember(self, key: CacheKey, payload: bytes) -> None:
+        previous = self._memory.pop(key, None)
+        if previous is not None:
+            self.current_bytes -= len(previous)
+        if len(payload) > self.max_bytes:
+            return
+        self._memory[key] = payload
+        self.current_bytes += len(payload)
+        while self.current_bytes > self.max_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self.current_bytes -= len(evicted)
+
+    def invalidate(self, template: str, keep_hash: Optional[str] = None) -> None:
+        """
+        Drop the entries of `template`, except those built with `keep_hash`
+        """
+        with self._lock:
+            for key in [k for k in self._memory if k.template == template]:
+                if key.template_hash != keep_hash:
+                    self.current_bytes -= len(self._memory.pop(key))
+            if self._db is not None:
+                self._db.execute(
+                    "DELETE FROM results WHERE template = ? AND template_hash IS NOT ?",
+                    (template, keep_hash),
+                )
+                self._db.commit()
+
+    def __len__(self) -> int:
+        return len(self._memory)
+
+    def close(self) -> None:
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+# Caches rebuilt in this process from another one, see `ResultCache.__reduce__`
+_REOPENED: Dict[Tuple[int, Optional[str]], ResultCache] = {}
+
+
+def _reopen(max_bytes: int, path: Optional[str]) -> ResultCache:
+    cache = _REOPENED.get((max_bytes, path))
+    if cache is None:
+        cache = _REOPENED[(max_bytes, path)] = ResultCache(max_bytes, path)
+    return cache
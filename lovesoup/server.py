@@ -0,0 +1,388 @@
+"""
+File: server.py
+Desc: Long-running extraction service keeping every cook warm
+
+Starting Python and compiling the templates costs much more than extracting
+one page. The service pays it once: worker processes build every cook at
+startup and then serve pages over HTTP, on a TCP port or a Unix socket.
+
+    python -m lovesoup.server --port 8765 --workers 4
+    python -m lovesoup.server --unix /tmp/lovesoup.sock
+
+Endpoints:
+    POST /extract   {"html": "...", "site": "mogi", "url": "...", "id": "..."}
+                    or {"pages": [{...}, {...}]} for a batch; "site" and
+                    "url" are optional hints, the page is detected otherwise.
+                    A raw text/html body works too: POST /extract?site=mogi
+    GET /metrics    Prometheus text, or JSON with ?format=json
+    GET /health
+
+When a worker process dies (killed, out of memory) the request gets a 503
+and a new pool is started for the next ones.
+"""
+
+import argparse
+import bisect
+import json
+import os
+import socketserver
+import sys
+import threading
+import time
+from concurrent.futures import BrokenExecutor, Executor, ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from lovesoup import cooks
+from lovesoup.batch import ExtractionRecord, chunked, extract_chunk, init_worker
+from lovesoup.cooks import get_cook
+from lovesoup.dispatch import detect_site
+from lovesoup.sinks import error_dict
+
+# Upper bounds of the latency histogram, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+MAX_BODY_BYTES = 256 * 1024 * 1024
+
+
+class WorkersUnavailableError(RuntimeError):
+    pass
+
+
+class ServiceMetrics:
+    """
+    Counters and gauges of the service, safe to update from handler threads
+    """
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self.requests = 0
+        self.pages = 0
+        self.errors = 0
+        self.in_flight_requests = 0
+        self.pending_pages = 0
+        self.latency_counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.latency_sum = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def queue_depth(self) -> int:
+        """
+        Pages waiting for a free worker
+        """
+        return max(0, self.pending_pages - self.workers)
+
+    def start(self, pages: int) -> None:
+        with self._lock:
+            self.requests += 1
+            self.in_flight_requests += 1
+            self.pending_pages += pages
+
+    def page_done(self, failed: bool) -> None:
+        with self._lock:
+            self.pending_pages -= 1
+            self.pages += 1
+            if failed:
+                self.errors += 1
+
+    def finish(self, seconds: float, unfinished_pages: int = 0) -> None:
+        with self._lock:
+            self.in_flight_requests -= 1
+            self.pending_pages -= unfinished_pages
+            self.latency_counts[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            self.latency_sum += seconds
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "requests": self.requests,
+                "pages": self.pages,
+                "errors": self.errors,
+                "in_flight_requests": self.in_flight_requests,
+                "pending_pages": self.pending_pages,
+                "queue_depth": self.queue_depth,
+                "latency_seconds": {
+                    "buckets": dict(
+                        zip([*map(str, LATENCY_BUCKETS), "+Inf"], self.latency_counts)
+                    ),
+                    "sum": self.latency_sum,
+                    "count": sum(self.latency_counts),
+                },
+            }
+
+    def to_prometheus(self, prefix: str = "lovesoup_server") -> str:
+        data = self.to_dict()
+        lines = []
+
+        def metric(name, kind, help_text, value):
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+            lines.append(f"{prefix}_{name} {value}")
+
+        metric("requests_total", "counter", "Extraction requests.", data["requests"])
+        metric("pages_total", "counter", "Pages extracted.", data["pages"])
+        metric("errors_total", "counter", "Pages that failed.", data["errors"])
+        metric("in_flight_requests", "gauge", "Requests being served.", data["in_flight_requests"])
+        metric("pending_pages", "gauge", "Pages accepted and not done yet.", data["pending_pages"])
+        metric("queue_depth", "gauge", "Pages waiting for a free worker.", data["queue_depth"])
+        metric("workers", "gauge", "Extraction workers.", data["workers"])
+
+        name = f"{prefix}_request_latency_seconds"
+        lines.append(f"# HELP {name} Time to serve an extraction request.")
+        lines.append(f"# TYPE {name} histogram")
+        cumulative = 0
+        for bound, count in data["latency_seconds"]["buckets"].items():
+            cumulative += count
+            lines.append(f'{name}_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f"{name}_sum {data['latency_seconds']['sum']}")
+        lines.append(f"{name}_count {data['latency_seconds']['count']}")
+        return "\n".join(lines) + "\n"
+
+
+class ExtractionService:
+    """
+    Routes pages to a pool of warm workers. With `workers=0` pages are
+    extracted in the handler threads of the server process instead.
+    """
+
+    def __init__(self, workers: Optional[int] = None, executor: Optional[Executor] = None):
+        if workers is None:
+            workers = os.cpu_count() or 1
+        self.workers = workers
+        # Template name of every cook, to resolve site hints without building cooks
+        self.templates: Dict[type, str] = {cls: cls().template for cls in cooks.ALL_COOKS}
+        self.own_executor = executor is None
+        self.metrics = ServiceMetrics(max(workers, 1))
+        self._restart_lock = threading.Lock()
+        if executor is None:
+            if workers > 0:
+                executor = self._start_pool()
+            else:
+                init_worker()
+        else:
+            self._warm_up(executor)
+        self.executor = executor
+
+    def _warm_up(self, executor: Executor) -> None:
+        # Start the workers (and build their cooks) now, not on the first request
+        for future in [executor.submit(extract_chunk, []) for _ in range(self.metrics.workers)]:
+            future.result()
+
+    def _start_pool(self) -> ProcessPoolExecutor:
+        executor = ProcessPoolExecutor(max_workers=self.workers, initializer=init_worker)
+        self._warm_up(executor)
+        return executor
+
+    def _restart(self, broken: Executor) -> None:
+        """
+        Replace a broken pool, once even when several requests saw it break
+        """
+        with self._restart_lock:
+            if self.own_executor and self.executor is broken:
+                broken.shutdown(wait=False, cancel_futures=True)
+                self.executor = self._start_pool()
+
+    def _task(self, page: Dict, index: int) -> Tuple:
+        html = page.get("html")
+        if not isinstance(html, str):
+            raise ValueError(f"Page {index}: 'html' must be a string")
+        label = str(page.get("id", page.get("url") or index))
+        site = page.get("site")
+        if site is None and page.get("url"):
+            site = detect_site(url=page["url"])
+        if site is None:
+            # The worker detects the site from the page
+            return (None, None, (), html, label)
+        cook_cls = get_cook(site)
+        return (cook_cls, self.templates[cook_cls], (), html, label)
+
+    def extract(self, pages: List[Dict]) -> List[Dict]:
+        """
+        Extract pages given as {"html", "site"?, "url"?, "id"?} dicts, in order
+        """
+        started = time.perf_counter()
+        self.metrics.start(len(pages))
+        done = 0
+        try:
+            tasks = [self._task(page, i) for i, page in enumerate(pages)]
+            # A batch is spread over the workers, a chunk per worker at most
+            chunksize = max(1, -(-len(tasks) // self.metrics.workers))
+            if self.executor is None:
+                chunks = [extract_chunk(chunk) for chunk in chunked(tasks, chunksize)]
+            else:
+                executor = self.executor
+                try:
+                    futures = [
+                        executor.submit(extract_chunk, chunk)
+                        for chunk in chunked(tasks, chunksize)
+                    ]
+                    chunks = [future.result() for future in futures]
+                except BrokenExecutor as e:
+                    self._restart(executor)
+                    raise WorkersUnavailableError("A worker died, try again") from e
+                except Exception as e:
+                    # Page errors are caught in the workers, this is the pool failing
+                    raise WorkersUnavailableError(f"Workers failed: {e!r}") from e
+            results = []
+            for chunk in chunks:
+                for record in chunk:
+                    results.append(_record_dict(record))
+                    self.metrics.page_done(record.error is not None)
+                    done += 1
+            return results
+        finally:
+            self.metrics.finish(time.perf_counter() - started, len(pages) - done)
+
+    def close(self) -> None:
+        if self.own_executor and self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.executor = None
+
+
+def _record_dict(record: ExtractionRecord) -> Dict:
+    return {
+        "id": record.source,
+        "site": record.site,
+        "error": None if record.error is None else error_dict(record.error),
+        "result": None if record.result is None else record.result.model_dump(),
+    }
+
+
+class ExtractionHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "lovesoup"
+
+    @property
+    def service(self) -> ExtractionService:
+        return self.server.service
+
+    def _send(self, status: int, body, content_type: str = "application/json") -> None:
+        if not isinstance(body, (bytes, str)):
+            body = json.dumps(body, ensure_ascii=False)
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", f"{content_type}; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path == "/metrics":
+            if parse_qs(url.query).get("format") == ["json"]:
+                self._send(200, self.service.metrics.to_dict())
+            else:
+                self._send(200, self.service.metrics.to_prometheus(), "text/plain; version=0.0.4")
+        elif url.path == "/health":
+            self._send(200, "ok", "text/plain")
+        else:
+            self._send(404, {"error": f"Unknown path {url.path}"})
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path != "/extract":
+            self._send(404, {"error": f"Unknown path {url.path}"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            # The body can't be told apart from the next request
+            self._send(400, {"error": "Invalid Content-Length"})
+            self.close_connection = True
+            return
+        if length > MAX_BODY_BYTES:
+            self._send(413, {"error": "Payload too large"})
+            self.close_connection = True
+            return
+        body = self.rfile.read(length)
+        try:
+            if self.headers.get_content_type() == "application/json":
+                payload = json.loads(body)
+            else:
+                # Raw HTML, hints in the query string
+                hints = {k: v[-1] for k, v in parse_qs(url.query).items()}
+                payload = {**hints, "html": body.decode("utf-8", errors="replace")}
+            batch = isinstance(payload, dict) and "pages" in payload
+            pages = payload["pages"] if batch else [payload]
+            if not isinstance(pages, list) or not all(isinstance(p, dict) for p in pages):
+                raise ValueError("Expected a page object or {'pages': [page objects]}")
+            results = self.service.extract(pages)
+        except (ValueError, KeyError) as e:
+            # Malformed payload or unknown site hint
+            self._send(400, {"error": str(e)})
+            return
+        except WorkersUnavailableError as e:
+            self._send(503, {"error": str(e)})
+            return
+        except Exception as e:
+            self._send(500, {"error": f"{type(e).__name__}: {e}"})
+            return
+        self._send(200, {"results": results} if batch else results[0])
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ExtractionServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, service: ExtractionService):
+        self.service = service
+        super().__init__(address, ExtractionHandler)
+
+
+class UnixExtractionServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path: str, service: ExtractionService):
+        self.service = service
+        if os.path.exists(path):
+            os.unlink(path)
+        super().__init__(path, ExtractionHandler)
+
+    def get_request(self):
+        request, _ = super().get_request()
+        # BaseHTTPRequestHandler expects a (host, port) client address
+        return request, ("unix", 0)
+
+
+def make_server(
+    host: str = "127.0.0.1",
+    port: int = 8765,
+    unix_socket: Optional[str] = None,
+    workers: Optional[int] = None,
+) -> socketserver.BaseServer:
+    service = ExtractionService(workers)
+    if unix_socket:
+        return UnixExtractionServer(unix_socket, service)
+    return ExtractionServer((host, port), service)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[2])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix", help="listen on this Unix socket instead of TCP")
+    parser.add_argument("--workers", type=int, help="worker processes, default one per CPU")
+    args = parser.parse_args(argv)
+
+    server = make_server(args.host, args.port, args.unix, args.workers)
+    where = args.unix or f"http://{args.host}:{server.server_address[1]}"
+    print(f"lovesoup serving on {where} with {server.service.workers} workers", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.service.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,257 @@
+"""
+File: shm.py
+Desc: Parallel extraction handing pages to the workers through a shared memory arena
+
+With `extract_records`, every page goes to its worker pickled as a str (50 to
+350 KB) and every result comes back as pickled pydantic models. Here the
+parent writes the raw page bytes into a slot of a memory-mapped arena that
+every worker maps too: a task only carries the slot number and the length.
+Files are read straight into their slot, and the workers parse the UTF-8
+bytes as they are: the page is never decoded to text, by the parent nor by
+the worker (except to detect its site when it is not given). Results come back as JSON bytes, decoded into PropertyNormalized by
+pydantic-core on arrival, or left as bytes with `decode=False`.
+
+    for record in extract_shared(items, workers=8):
+        ...
+
+Pages larger than a slot are sent pickled, as `extract_records` does.
+"""
+
+import codecs
+import mmap
+import os
+import tempfile
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Deque, Iterable, Iterator, List, Optional, Tuple
+
+from lovesoup.batch import (
+    Counters,
+    ExtractionRecord,
+    chunked,
+    describe_source,
+    drain_metrics,
+    extract_chunk,
+    extract_html,
+    extract_one,
+    init_worker,
+    is_html,
+    merge_metrics,
+    resolve_tasks,
+)
+from lovesoup.property_models import PropertyNormalized
+
+DEFAULT_SLOT_SIZE = 1 << 20
+
+# Backed by RAM on Linux; any directory works, the pages are not synced to disk
+_SHM_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+# Arena mapped in the current worker process
+_WORKER_ARENA: Optional[memoryview] = None
+
+
+class PageArena:
+    """
+    `slots` fixed-size slots in a memory-mapped file, shared with the workers.
+    The parent hands slots out with `acquire` and gets them back with `release`.
+    """
+
+    def __init__(self, slots: int, slot_size: int = DEFAULT_SLOT_SIZE, directory=_SHM_DIR):
+        self.slots = slots
+        self.slot_size = slot_size
+        fd, self.path = tempfile.mkstemp(prefix="lovesoup-arena-", dir=directory)
+        try:
+            os.ftruncate(fd, slots * slot_size)
+            self._map = mmap.mmap(fd, slots * slot_size)
+        finally:
+            os.close(fd)
+        self.view = memoryview(self._map)
+        self.free: Deque[int] = deque(range(slots))
+
+    @property
+    def size(self) -> int:
+        return self.slots * self.slot_size
+
+    def acquire(self) -> int:
+        return self.free.popleft()
+
+    def release(self, slot: int) -> None:
+        self.free.append(slot)
+
+    def slot(self, slot: int) -> memoryview:
+        start = slot * self.slot_size
+        return self.view[start : start + self.slot_size]
+
+    def write(self, slot: int, data: bytes) -> int:
+        start = slot * self.slot_size
+        self.view[start : start + len(data)] = data
+        return len(data)
+
+    def read_file(self, slot: int, path) -> int:
+        """
+        Read a whole file into a slot. Returns its length, or -1 when it does not fit.
+        """
+        with open(path, "rb") as file:
+            if os.fstat(file.fileno()).st_size > self.slot_size:
+                return -1
+            return file.readinto(self.slot(slot))
+
+    def close(self) -> None:
+        self.view.release()
+        self._map.close()
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def _init_shared_worker(path: str, size: int) -> None:
+    """
+    Pool initializer: map the arena and build every site's cook
+    """
+    global _WORKER_ARENA
+    with open(path, "rb") as file:
+        _WORKER_ARENA = memoryview(mmap.mmap(file.fileno(), size, access=mmap.ACCESS_READ))
+    init_worker()
+
+
+def _extract_slot(
+    cook_cls: Optional[type], template_name: Optional[str], options: Tuple, source
+):
+    if isinstance(source, tuple):
+        start, length = source
+        # One copy out of the arena: the parser strips the page and drops NUL
+        # bytes first, which a view can't do. It costs about 0.1% of the
+        # extraction, see "copy_us" in `lovesoup.benchmark.bench_handoff`
+        source = bytes(_WORKER_ARENA[start : start + length])
+        if source.startswith(codecs.BOM_UTF8):
+            source = source[len(codecs.BOM_UTF8) :]
+        if cook_cls is None:
+            # Telling the site apart needs the text
+            source = source.decode("utf-8")
+        # Otherwise the cooks parse the UTF-8 bytes as they are, without decoding them
+        return extract_html(cook_cls, template_name, options, source)
+    # Pickled with the task: a page too large for a slot, or a file the parent
+    # could not read, which fails here the way it does in `extract_records`
+    return extract_one(cook_cls, template_name, options, source)
+
+
+def _extract_shared_chunk(chunk: List[Tuple]) -> List[Tuple]:
+    """
+    Worker entry point: results are sent back as JSON, followed by what the
+    worker's Instrumentation objects counted
+    """
+    results: List = []
+    for record in extract_chunk(chunk, _extract_slot):
+        data = None if record.result is None else to_json(record.result)
+        results.append((record.source, record.site, data, record.error))
+    return results + drain_metrics()
+
+
+def to_json(result: PropertyNormalized) -> bytes:
+    return result.__pydantic_serializer__.to_json(result)
+
+
+def _record(sent: Tuple, decode: bool) -> ExtractionRecord:
+    source, site, result, error = sent
+    if result is not None and decode:
+        result = PropertyNormalized.model_validate_json(result)
+    return ExtractionRecord(source, site, result, error)
+
+
+def _place(arena: PageArena, task: Tuple) -> Tuple[Tuple, Optional[int]]:
+    """
+    Write the page of a task into a free slot. Returns the task to send and the slot used.
+    """
+    cook_cls, template_name, options, source, label = task
+    label = label or describe_source(source)
+    slot = arena.acquire()
+    if is_html(source):
+        data = source.encode("utf-8")
+        length = arena.write(slot, data) if len(data) <= arena.slot_size else -1
+    else:
+        try:
+            length = arena.read_file(slot, source)
+            if length < 0:
+                with open(source, "r", encoding="utf-8") as file:
+                    source = file.read()
+        except OSError:
+            # Missing or unreadable: the worker gives its error record
+            length = -1
+    if length < 0:
+        # Too large for a slot, or not read: pickled along with the task
+        arena.release(slot)
+        return (cook_cls, template_name, options, source, label), None
+    return (cook_cls, template_name, options, (slot * arena.slot_size, length), label), slot
+
+
+def extract_shared(
+    items: Iterable[Tuple],
+    workers: Optional[int] = None,
+    chunksize: int = 8,
+    ordered: bool = True,
+    slot_size: int = DEFAULT_SLOT_SIZE,
+    decode: bool = True,
+) -> Iterator[ExtractionRecord]:
+    """
+    Like `extract_records`, pages and results going through shared memory.
+
+    Args:
+        items: (site, source) pairs or (site, source, label) triples, see `extract_many`.
+        workers: number of worker processes, defaults to the CPU count.
+        chunksize: number of pages sent to a worker at once.
+        ordered: yield records in input order, otherwise as soon as they are ready.
+        slot_size: largest page, in bytes, passed through the arena.
+        decode: turn results into PropertyNormalized objects; with False the
+            records hold the JSON bytes instead.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(workers, 1)
+    # As in extract_records, a couple of chunks in flight per worker at most
+    max_pending = workers * 2
+    arena = PageArena(max_pending * chunksize, slot_size)
+    pool = ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_shared_worker,
+        initargs=(arena.path, arena.size),
+    )
+    with arena, pool:
+        pending = deque()  # (future, slots)
+
+        def finished() -> Iterator[ExtractionRecord]:
+            if ordered:
+                done = [pending.popleft()]
+            else:
+                ready, _ = wait([f for f, _ in pending], return_when=FIRST_COMPLETED)
+                done = [entry for entry in pending if entry[0] in ready]
+                for entry in done:
+                    pending.remove(entry)
+            for future, slots in done:
+                results = future.result()
+                for slot in slots:
+                    arena.release(slot)
+                for result in results:
+                    if isinstance(result, Counters):
+                        merge_metrics(result)
+                    else:
+                        yield _record(result, decode)
+
+        for chunk in chunked(resolve_tasks(items), chunksize):
+            while len(pending) >= max_pending:
+                yield from finished()
+            tasks, slots = [], []
+            for task in chunk:
+                task, slot = _place(arena, task)
+                tasks.append(task)
+                if slot is not None:
+                    slots.append(slot)
+            pending.append((pool.submit(_extract_shared_chunk, tasks), slots))
+        while pending:
+            yield from finished()
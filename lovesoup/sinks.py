@@ -0,0 +1,189 @@
+"""
+File: sinks.py
+Desc: Streaming output of extracted records to JSON Lines files
+
+Records are written as they come out of the extractors, so memory stays flat
+however many pages a run goes through:
+
+    with JsonlSink("out.jsonl.gz") as sink:
+        for record in extract_records(items, workers=8):
+            sink.write_record(record)
+
+Every line holds the source, the site, the error (null on success) and the
+PropertyNormalized result (null on failure).
+"""
+
+import gzip
+import io
+import json
+import pathlib
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from lovesoup.batch import ExtractionRecord, extract_records
+from lovesoup.property_models import PropertyNormalized
+
+try:
+    import zstandard
+except ImportError:  # only needed for .zst output
+    zstandard = None
+
+COMPRESSIONS = (None, "gzip", "zstd")
+
+
+def _compression_from_suffix(path: pathlib.Path) -> Optional[str]:
+    if path.suffix == ".gz":
+        return "gzip"
+    if path.suffix in (".zst", ".zstd"):
+        return "zstd"
+    return None
+
+
+class JsonlSink:
+    def __init__(
+        self,
+        path,
+        compression: Optional[str] = "auto",
+        batch_size: int = 256,
+        flush_interval: float = 5.0,
+        append: bool = False,
+    ):
+        """
+        Args:
+            path: output file.
+            compression: None, "gzip", "zstd", or "auto" to go by the file suffix
+                (.gz, .zst).
+            batch_size: lines buffered before they are written out.
+            flush_interval: seconds after which buffered lines are written
+                out even if the batch is not full.
+            append: add to an existing file instead of replacing it.
+        """
+        self.path = pathlib.Path(path)
+        if compression == "auto":
+            compression = _compression_from_suffix(self.path)
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"Unknown compression {compression!r}, expected one of {COMPRESSIONS}")
+        self.compression = compression
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.written = 0
+        self.failed = 0
+        self._buffer: List[str] = []
+        self._last_flush = time.monotonic()
+        self._file = self._open(append)
+
+    def _open(self, append: bool):
+        mode = "ab" if append else "wb"
+        if self.compression == "gzip":
+            raw = gzip.open(self.path, mode)
+        elif self.compression == "zstd":
+            if zstandard is None:
+                raise ImportError("zstd output needs the zstandard package")
+            raw = zstandard.ZstdCompressor().stream_writer(open(self.path, mode))
+        else:
+            raw = open(self.path, mode)
+        return io.TextIOWrapper(raw, encoding="utf-8", newline="\n")
+
+    def write(
+        self,
+        result: Optional[PropertyNormalized] = None,
+        source: Optional[str] = None,
+        site: Optional[str] = None,
+        error: Optional[BaseException] = None,
+    ) -> None:
+        line = {
+            "source": source,
+            "site": site,
+            "error": None if error is None else error_dict(error),
+            "result": None if result is None else result.model_dump(),
+        }
+        self.write_line(line)
+
+    def write_line(self, line: Dict) -> None:
+        """
+        Write any JSON object as a line, counted as failed when its "error" is set
+        """
+        self._buffer.append(json.dumps(line, ensure_ascii=False))
+        self.written += 1
+        if line.get("error") is not None:
+            self.failed += 1
+        if (
+            len(self._buffer) >= self.batch_size
+            or time.monotonic() - self._last_flush >= self.flush_interval
+        ):
+            self.flush()
+
+    def write_record(self, record: ExtractionRecord) -> None:
+        self.write(record.result, record.source, record.site, record.error)
+
+    def flush(self) -> None:
+        if self._buffer:
+            self._file.write("\n".join(self._buffer) + "\n")
+            self._buffer.clear()
+        self._file.flush()
+        self._last_flush = time.monotonic()
+
+    def close(self) -> None:
+        if self._file is not None:
+            self.flush()
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+def error_dict(error: BaseException) -> dict:
+    """
+    The JSON form of a page failure, as written to sinks and sent by the services
+    """
+    data = {
+        "type": getattr(error, "error_type", type(error).__name__),
+        "message": getattr(error, "message", str(error)),
+    }
+    # Failures of isolated runs, see `lovesoup.isolation.PageFailure`
+    for name in ("stage", "input_hash", "attempts"):
+        if hasattr(error, name):
+            data[name] = getattr(error, name)
+    return data
+
+
+def write_jsonl(
+    items: Iterable[Tuple],
+    path,
+    workers: Optional[int] = None,
+    chunksize: int = 8,
+    **sink_kwargs,
+) -> Tuple[int, int]:
+    """
+    Extract (site, source) pairs (see `lovesoup.batch.extract_many`) straight
+    into a JSONL file. Returns the number of records written and failed.
+    """
+    with JsonlSink(path, **sink_kwargs) as sink:
+        for record in extract_records(items, workers, chunksize, ordered=False):
+            sink.write_record(record)
+    return sink.written, sink.failed
+
+
+def read_jsonl(path) -> Iterable[dict]:
+    """
+    Iterate the records of a file written by JsonlSink
+    """
+    path = pathlib.Path(path)
+    compression = _compression_from_suffix(path)
+    if compression == "gzip":
+        raw = gzip.open(path, "rb")
+    elif compression == "zstd":
+        if zstandard is None:
+            raise ImportError("zstd input needs the zstandard package")
+        raw = zstandard.ZstdDecompressor().stream_reader(open(path, "rb"))
+    else:
+        raw = open(path, "rb")
+    with io.TextIOWrapper(raw, encoding="utf-8") as file:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
@@ -0,0 +1,312 @@
+"""
+File: telemetry.py
+Desc: Selector hit rates per template, and a probe telling template drift from a page sample
+
+When a site changes its markup, the selectors of its template stop matching
+and the results quietly fill up with empty values. The rates of matched,
+empty and missing outcomes of every selector and child selector (counted by
+`Instrumentation`, see `lovesoup.instrumentation.selector_outcomes`) show it
+right away. A baseline of those rates is built once from known good pages:
+
+    rates = build_baseline("tests/test_data")
+    save_baseline(rates, "baseline.json")
+
+and a sample of the incoming pages is checked against it. Only the templates
+run over the sampled pages (no post_process nor validation), and every worker
+sends back one set of counters per chunk:
+
+    report = probe(((None, path) for path in new_pages), load_baseline("baseline.json"))
+    for drift in report.drifts:
+        if drift.outcome == FAILED:
+            print(f"drift:   {1 - drift.observed:.0%} of the pages failed")
+            continue
+        print(drift.template, drift.selector, drift.baseline, drift.observed)
+
+Pages are sampled by a hash of their source, so the same pages are picked
+again on a rerun. From the command line:
+
+    python -m lovesoup.telemetry --build-baseline tests/test_data --baseline baseline.json
+    python -m lovesoup.telemetry --baseline baseline.json --rate 0.01 pages/
+
+exits with 1 when a selector drifted, or when more than 10% of the sampled
+pages failed (`--max-failure-rate`): pages that no template recognises any
+more fail instead of filling up with empty values.
+"""
+
+import argparse
+import json
+import os
+import pathlib
+import sys
+import zlib
+from functools import partial
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from lovesoup.batch import (
+    extract_chunk,
+    is_html,
+    iter_records,
+    read_page,
+    resolve_cook,
+    resolve_tasks,
+)
+from lovesoup.instrumentation import EMPTY, MATCHED, MISSING, OUTCOMES, Instrumentation
+
+# template -> selector path -> rate of every outcome, and the number of times it was seen
+Rates = Dict[str, Dict[str, Dict[str, float]]]
+
+# Outcome of the drift of pages that failed altogether, see `failure_drift`
+FAILED = "failed"
+
+
+class Drift(NamedTuple):
+    """
+    A selector that matches far less often than in the baseline
+    """
+
+    template: str
+    selector: str
+    baseline: float
+    observed: float
+    count: int
+    # What it mostly gives now: "empty" or "missing", or FAILED for pages
+    # that failed (the rates are then those of pages extracted)
+    outcome: str
+
+
+class ProbeReport(NamedTuple):
+    pages: int
+    failed: int
+    metrics: Instrumentation
+    drifts: List[Drift]
+
+
+def selector_rates(metrics: Instrumentation) -> Rates:
+    """
+    Outcome rates of every selector counted by `metrics`
+    """
+    counts: Dict[Tuple[str, str], Dict[str, int]] = {}
+    for (template, path, outcome), count in metrics.selector_outcomes.items():
+        counts.setdefault((template, path), dict.fromkeys(OUTCOMES, 0))[outcome] += count
+    rates: Rates = {}
+    for (template, path), by_outcome in sorted(counts.items()):
+        total = sum(by_outcome.values())
+        entry = {outcome: count / total for outcome, count in by_outcome.items()}
+        entry["count"] = total
+        rates.setdefault(template, {})[path] = entry
+    return rates
+
+
+def find_drift(
+    baseline: Rates,
+    metrics: Instrumentation,
+    tolerance: float = 0.5,
+    min_count: int = 20,
+) -> List[Drift]:
+    """
+    Selectors whose matched rate fell more than `tolerance` below the
+    baseline's, among those seen at least `min_count` times
+    """
+    drifts = []
+    for template, selectors in selector_rates(metrics).items():
+        for path, expected in baseline.get(template, {}).items():
+            observed = selectors.get(path)
+            if observed is None or observed["count"] < min_count:
+                continue
+            if observed[MATCHED] < expected[MATCHED] - tolerance:
+                outcome = EMPTY if observed[EMPTY] > observed[MISSING] else MISSING
+                drifts.append(
+                    Drift(
+                        template,
+                        path,
+                        expected[MATCHED],
+                        observed[MATCHED],
+                        observed["count"],
+                        outcome,
+                    )
+                )
+    return drifts
+
+
+def failure_drift(
+    pages: int, failed: int, max_failure_rate: float = 0.1, min_count: int = 20
+) -> List[Drift]:
+    """
+    A drift of every template when more than `max_failure_rate` of the pages
+    failed (the site could not be told, the template raised), among at
+    least `min_count` pages. The pages of the baseline all extract.
+    """
+    if pages < min_count or failed <= max_failure_rate * pages:
+        return []
+    return [Drift("*", "page", 1.0, 1 - failed / pages, pages, FAILED)]
+
+
+def sampled(key: str, rate: float) -> bool:
+    """
+    Whether a page is in the sample, the same way every time
+    """
+    return zlib.crc32(key.encode("utf-8")) < rate * 2**32
+
+
+def _probe_one(
+    metrics: Instrumentation,
+    cook_cls: Optional[type],
+    template_name: Optional[str],
+    options: Tuple,
+    source,
+):
+    """
+    Run the template of a task over its page, counting into `metrics`
+    """
+    page = read_page(source)
+    template_name, cook = resolve_cook(cook_cls, template_name, options, page)
+    own_metrics, cook.instrumentation = cook.instrumentation, metrics
+    try:
+        cook.record_page(page)
+        cook.extract(page)
+    finally:
+        cook.instrumentation = own_metrics
+    return template_name, None
+
+
+def _probe_chunk(chunk: List[Tuple]) -> List[Tuple[Instrumentation, int, int]]:
+    """
+    Worker entry point: run the templates over the pages of a chunk and send
+    back their counters only, with the number of pages and of failures
+    """
+    metrics = Instrumentation()
+    records = extract_chunk(chunk, partial(_probe_one, metrics))
+    failed = sum(record.error is not None for record in records)
+    return [(metrics, len(chunk), failed)]
+
+
+def _run_probe(
+    tasks: Iterable[Tuple], workers: Optional[int], chunksize: int
+) -> Tuple[Instrumentation, int, int]:
+    if workers is None:
+        workers = os.cpu_count() or 1
+    metrics, pages, failed = Instrumentation(), 0, 0
+    for chunk_metrics, chunk_pages, chunk_failed in iter_records(
+        tasks, workers, chunksize, ordered=False, extract_chunk=_probe_chunk
+    ):
+        metrics.merge(chunk_metrics)
+        pages += chunk_pages
+        failed += chunk_failed
+    return metrics, pages, failed
+
+
+def _sample_key(task: Tuple) -> str:
+    _, _, _, source, label = task
+    if label is not None:
+        return label
+    return source if is_html(source) else os.fspath(source)
+
+
+def probe(
+    items: Iterable[Tuple],
+    baseline: Rates,
+    rate: float = 0.01,
+    max_pages: Optional[int] = None,
+    workers: Optional[int] = None,
+    chunksize: int = 8,
+    tolerance: float = 0.5,
+    min_count: int = 20,
+    max_failure_rate: float = 0.1,
+) -> ProbeReport:
+    """
+    Check a sample of pages against a baseline, see `find_drift` and `failure_drift`.
+
+    Args:
+        items: (site, source) pairs, as for `lovesoup.batch.extract_many`.
+        baseline: rates from `build_baseline` or `load_baseline`.
+        rate: share of the pages checked.
+        max_pages: stop after that many sampled pages.
+    """
+    tasks: Iterator[Tuple] = (
+        task for task in resolve_tasks(items) if sampled(_sample_key(task), rate)
+    )
+    if max_pages is not None:
+        tasks = islice(tasks, max_pages)
+    metrics, pages, failed = _run_probe(tasks, workers, chunksize)
+    drifts = failure_drift(pages, failed, max_failure_rate, min_count)
+    drifts += find_drift(baseline, metrics, tolerance, min_count)
+    return ProbeReport(pages, failed, metrics, drifts)
+
+
+def build_baseline(directory, workers: Optional[int] = 1) -> Rates:
+    """
+    Rates over known good pages laid out as `<directory>/<site>/*.html`, like tests/test_data
+    """
+    items = [(path.parent.name, path) for path in sorted(pathlib.Path(directory).glob("*/*.html"))]
+    metrics, _, _ = _run_probe(resolve_tasks(items), workers, chunksize=8)
+    return selector_rates(metrics)
+
+
+def save_baseline(rates: Rates, path) -> None:
+    pathlib.Path(path).write_text(json.dumps(rates, indent=1, ensure_ascii=False), encoding="utf-8")
+
+
+def load_baseline(path) -> Rates:
+    return json.loads(pathlib.Path(path).read_text(encoding="utf-8"))
+
+
+def _pages(paths: Iterable[str]) -> Iterator[pathlib.Path]:
+    for path in map(pathlib.Path, paths):
+        if path.is_dir():
+            yield from sorted(path.rglob("*.html"))
+        else:
+            yield path
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[2].split(": ", 1)[1])
+    parser.add_argument("pages", nargs="*", help="HTML files or folders of them, any site")
+    parser.add_argument("--baseline", type=pathlib.Path, required=True, help="baseline JSON file")
+    parser.add_argument(
+        "--build-baseline",
+        type=pathlib.Path,
+        metavar="DIR",
+        help="write the baseline of known good pages laid out as DIR/<site>/*.html",
+    )
+    parser.add_argument("--rate", type=float, default=0.01, help="share of the pages checked")
+    parser.add_argument("--max-pages", type=int)
+    parser.add_argument("--tolerance", type=float, default=0.5)
+    parser.add_argument("--min-count", type=int, default=20)
+    parser.add_argument(
+        "--max-failure-rate", type=float, default=0.1, help="share of failed pages tolerated"
+    )
+    parser.add_argument("--workers", type=int)
+    args = parser.parse_args(argv)
+
+    if args.build_baseline is not None:
+        rates = build_baseline(args.build_baseline, args.workers)
+        save_baseline(rates, args.baseline)
+        print(f"baseline: {sum(map(len, rates.values()))} selectors of {len(rates)} templates")
+        return 0
+
+    report = probe(
+        ((None, path) for path in _pages(args.pages)),
+        load_baseline(args.baseline),
+        rate=args.rate,
+        max_pages=args.max_pages,
+        workers=args.workers,
+        tolerance=args.tolerance,
+        min_count=args.min_count,
+        max_failure_rate=args.max_failure_rate,
+    )
+    print(f"pages:   {report.pages}")
+    print(f"failed:  {report.failed}")
+    for drift in report.drifts:
+        if drift.outcome == FAILED:
+            print(f"drift:   {1 - drift.observed:.0%} of the pages failed")
+            continue
+        print(
+            f"drift:   {drift.template} {drift.selector}: matched {drift.observed:.0%}"
+            f" (baseline {drift.baseline:.0%}) over {drift.count}, mostly {drift.outcome}"
+        )
+    return 1 if report.drifts else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
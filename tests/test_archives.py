@@ -0,0 +1,271 @@
+"""
+File: test_archives.py
+Desc: Make sure pages streamed out of WARC and tar archives extract like the files they came from
+"""
+
+import gzip
+import pathlib
+import tarfile
+import unicodedata
+
+import pytest
+
+from lovesoup.archives import (
+    archive_items,
+    archive_kind,
+    decode_html,
+    detect_charset,
+    extract_archives,
+    iter_archive,
+    iter_tar,
+    iter_warc,
+    read_page,
+)
+from lovesoup.cooks import get_cook
+
+TEST_DIR = pathlib.Path(__file__).parent / "test_data"
+
+DOMAINS = {
+    "mogi": "mogi.vn",
+    "batdongsan": "batdongsan.com.vn",
+    "cenhomes": "cenhomes.vn",
+    "bds123vn": "bds123.vn",
+    "muabannet": "muaban.net",
+    "nhatot": "nhatot.com",
+}
+
+SAMPLES = sorted(TEST_DIR.glob("*/*.html"))
+
+
+def _url(html_file: pathlib.Path) -> str:
+    return f"https://{DOMAINS[html_file.parent.name]}/{html_file.stem}"
+
+
+def _warc_record(warc_type: str, url: str, block: bytes, content_type: str) -> bytes:
+    headers = (
+        "WARC/1.0\r\n"
+        f"WARC-Type: {warc_type}\r\n"
+        f"WARC-Target-URI: {url}\r\n"
+        f"WARC-Record-ID: <urn:uuid:{abs(hash(url))}>\r\n"
+        f"Content-Type: {content_type}\r\n"
+        f"Content-Length: {len(block)}\r\n"
+        "\r\n"
+    )
+    return headers.encode() + block + b"\r\n\r\n"
+
+
+def _response(body: bytes, status: int = 200, headers: str = "") -> bytes:
+    head = f"HTTP/1.1 {status} OK\r\nContent-Type: text/html; charset=utf-8\r\n{headers}\r\n"
+    return head.encode() + body
+
+
+def _chunked(body: bytes, size: int = 1000) -> bytes:
+    out = b""
+    for i in range(0, len(body), size):
+        chunk = body[i : i + size]
+        out += f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n"
+    return out + b"0\r\n\r\n"
+
+
+def _write_warc(path: pathlib.Path, compress: bool) -> None:
+    records = [_warc_record("warcinfo", "", b"software: test\r\n", "application/warc-fields")]
+    for i, html_file in enumerate(SAMPLES):
+        body = html_file.read_bytes()
+        url = _url(html_file)
+        records.append(_warc_record("request", url, b"GET / HTTP/1.1\r\n\r\n", "application/http"))
+        if i % 2:
+            # Stored as sent: gzip content, chunked transfer
+            block = _response(
+                _chunked(gzip.compress(body)),
+                headers="Content-Encoding: gzip\r\nTransfer-Encoding: chunked\r\n",
+            )
+        else:
+            block = _response(body)
+        records.append(_warc_record("response", url, block, "application/http; msgtype=response"))
+    gone = _response(b"<html/>", 404)
+    records.append(_warc_record("response", "https://mogi.vn/gone", gone, "application/http"))
+    image = b"HTTP/1.1 200 OK\r\nContent-Type: image/png\r\n\r\n\x89PNG"
+    records.append(_warc_record("response", "https://mogi.vn/a.png", image, "application/http"))
+
+    if compress:
+        # One gzip member per record, as crawlers write them
+        path.write_bytes(b"".join(gzip.compress(record) for record in records))
+    else:
+        path.write_bytes(b"".join(records))
+
+
+@pytest.mark.parametrize("name", ["crawl.warc", "crawl.warc.gz"])
+def test_warc_pages_match_files(tmp_path, name):
+    path = tmp_path / name
+    _write_warc(path, compress=name.endswith(".gz"))
+
+    pages = list(iter_warc(path))
+
+    assert [page.url for page in pages] == [_url(f) for f in SAMPLES]
+    assert [page.html for page in pages] == [f.read_bytes().decode("utf-8") for f in SAMPLES]
+    assert {page.encoding for page in pages} == {"utf-8"}
+
+
+def test_extract_archives_matches_cooks(tmp_path):
+    warc = tmp_path / "crawl.warc.gz"
+    _write_warc(warc, compress=True)
+
+    records = list(extract_archives([warc], workers=1))
+
+    assert [record.source for record in records] == [_url(f) for f in SAMPLES]
+    for record, html_file in zip(records, SAMPLES):
+        cook = get_cook(html_file.parent.name)()
+        try:
+            expected = cook.run(str(html_file))
+        except Exception:
+            assert record.error is not None
+        else:
+            assert record.error is None
+            assert record.result == expected
+
+
+@pytest.mark.parametrize("name", ["pages.tar", "pages.tar.gz", "pages.tgz"])
+def test_tar_members(tmp_path, name):
+    path = tmp_path / name
+    mode = "w" if name.endswith(".tar") else "w:gz"
+    with tarfile.open(path, mode) as archive:
+        for html_file in SAMPLES:
+            archive.add(html_file, arcname=f"{html_file.parent.name}/{html_file.name}")
+        archive.add(TEST_DIR / "mogi" / "sample1.json", arcname="mogi/sample1.json")
+
+    pages = list(iter_tar(path))
+
+    assert [page.source for page in pages] == [
+        f"{path}:{f.parent.name}/{f.name}" for f in SAMPLES
+    ]
+    assert [page.html for page in pages] == [f.read_bytes().decode("utf-8") for f in SAMPLES]
+
+    records = list(extract_archives([path], site="mogi", workers=1))
+    assert records[0].source == f"{path}:batdongsan/sample1.html"
+    mogi = SAMPLES.index(TEST_DIR / "mogi" / "sample1.html")
+    assert records[mogi].result == get_cook("mogi")().run(str(SAMPLES[mogi]))
+
+
+def test_single_page_files(tmp_path):
+    html_file = TEST_DIR / "mogi" / "sample1.html"
+    compressed = tmp_path / "page.html.gz"
+    compressed.write_bytes(gzip.compress(html_file.read_bytes()))
+
+    assert read_page(html_file).html == html_file.read_bytes().decode("utf-8")
+    assert [page.html for page in iter_archive(compressed)] == [read_page(html_file).html]
+
+
+def test_text_before_the_first_tag_is_kept(tmp_path):
+    mogi = (TEST_DIR / "mogi" / "sample1.html").read_text(encoding="utf-8")
+    html = "Saved from mogi.vn\n" + mogi
+    page, blank = tmp_path / "page.html", tmp_path / "blank.html"
+    page.write_text(html, encoding="utf-8")
+    blank.write_text("nothing here", encoding="utf-8")
+
+    assert [item[1] for item in archive_items([page, blank], "mogi")] == [html, "nothing here"]
+    record, blank_record = extract_archives([page, blank], "mogi", workers=1)
+    assert record.result == get_cook("mogi")().run_html(html)
+    # Failed as a page, not looked for as a file
+    assert blank_record.error.error_type != "FileNotFoundError"
+
+
+@pytest.mark.parametrize(
+    "name, kind",
+    [
+        ("a.warc", "warc"),
+        ("a.warc.gz", "warc"),
+        ("a.warc.zst", "warc"),
+        ("a.tar", "tar"),
+        ("a.tar.zst", "tar"),
+        ("a.tgz", "tar"),
+        ("a.tar.xz", "tar"),
+        ("a.html", "page"),
+        ("a.html.gz", "page"),
+    ],
+)
+def test_archive_kind(name, kind):
+    assert archive_kind(name) == kind
+
+
+LEGACY = "<html><head>{meta}</head><body>Diện tích đất</body></html>"
+
+# Combining tone marks of windows-1258
+TONES = "\u0300\u0301\u0303\u0309\u0323"
+
+
+def _cp1258(text: str) -> bytes:
+    """
+    Vietnamese text the way windows-1258 pages store it: base letter, then tone mark
+    """
+    out = b""
+    for char in text:
+        try:
+            out += char.encode("cp1258")
+        except UnicodeEncodeError:
+            marks = unicodedata.normalize("NFD", char)
+            base = unicodedata.normalize("NFC", "".join(m for m in marks if m not in TONES))
+            out += (base + "".join(m for m in marks if m in TONES)).encode("cp1258")
+    return out
+
+
+@pytest.mark.parametrize(
+    "body, content_type, expected",
+    [
+        (LEGACY.format(meta="").encode("utf-8"), None, "utf-8"),
+        (LEGACY.format(meta="").encode("utf-8"), "text/html; charset=UTF-8", "utf-8"),
+        (b"\xef\xbb\xbf" + LEGACY.format(meta="").encode("utf-8"), None, "utf-8-sig"),
+        (_cp1258(LEGACY.format(meta='<meta charset="windows-1258">')), None, "cp1258"),
+        (
+            _cp1258(
+                LEGACY.format(
+                    meta='<meta http-equiv="Content-Type" content="text/html; charset=windows-1258">'
+                )
+            ),
+            None,
+            "cp1258",
+        ),
+        # The header wins over the page
+        (
+            _cp1258(LEGACY.format(meta='<meta charset="utf-8">')),
+            "text/html; charset=windows-1258",
+            "cp1258",
+        ),
+        # Not UTF-8 and nothing said: Vietnamese legacy encoding
+        (_cp1258(LEGACY.format(meta="")), None, "cp1258"),
+        # Unknown charsets are ignored
+        (LEGACY.format(meta="").encode("utf-8"), "text/html; charset=nonsense", "utf-8"),
+    ],
+)
+def test_detect_charset(body, content_type, expected):
+    assert detect_charset(body, content_type) == expected
+    assert "Diện tích đất" in decode_html(body, content_type)[0]
+
+
+def test_zstd_needs_zstandard(tmp_path, monkeypatch):
+    from lovesoup import archives
+
+    monkeypatch.setattr(archives, "zstandard", None)
+    path = tmp_path / "crawl.warc.zst"
+    path.write_bytes(b"")
+
+    with pytest.raises(ImportError):
+        list(iter_warc(path))
+
+
+def test_zstd_archives(tmp_path):
+    zstandard = pytest.importorskip("zstandard")
+    warc = tmp_path / "crawl.warc"
+    _write_warc(warc, compress=False)
+    compressed = tmp_path / "crawl.warc.zst"
+    with open(compressed, "wb") as out:
+        with zstandard.ZstdCompressor().stream_writer(out) as writer:
+            writer.write(warc.read_bytes())
+
+    assert list(iter_warc(compressed)) == list(iter_warc(warc))
+
+
+def test_empty_input(tmp_path):
+    path = tmp_path / "empty.warc"
+    path.write_bytes(b"")
+
+    assert list(iter_warc(path)) == []
@@ -0,0 +1,75 @@
+"""
+File: test_batch.py
+Desc: Make sure batch extraction gives the same results as one page at a time
+"""
+
+import pathlib
+import sqlite3
+
+import pytest
+
+from lovesoup.batch import ExtractionError, extract_many
+from lovesoup.cooks import BDS123Vn, Mogi, Muabannet, Nhatot
+from lovesoup.instrumentation import Instrumentation
+from lovesoup.result_cache import ResultCache
+
+TEST_DIR = pathlib.Path(__file__).parent / "test_data"
+
+
+def test_run_many_matches_run():
+    extractor = BDS123Vn()
+    paths = [str(TEST_DIR / "bds123vn" / f"sample{i}.html") for i in (1, 2, 3)] * 3
+
+    expected = [extractor.run(p).model_dump() for p in paths]
+    results = extractor.run_many(paths, workers=2, chunksize=2)
+
+    assert [r.model_dump() for r in results] == expected
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_run_many_keeps_the_cook_options(workers, tmp_path):
+    metrics = Instrumentation()
+    cache = ResultCache(path=str(tmp_path / "results.sqlite"))
+    mogi = Mogi(split_addresses=True, trusted=True, instrumentation=metrics, result_cache=cache)
+    nhatot = Nhatot(fast_json=False, strict=True, split_addresses=True)
+    mogi_page = str(TEST_DIR / "mogi" / "sample1.html")
+    nhatot_page = str(TEST_DIR / "nhatot" / "sample1.html")
+
+    results = list(mogi.run_many([mogi_page] * 4, workers=workers, chunksize=2))
+    nhatot_results = list(nhatot.run_many([nhatot_page] * 2, workers=workers))
+
+    expected = Mogi(split_addresses=True).run(mogi_page)
+    assert expected.address.district
+    assert [r.model_dump() for r in results] == [expected.model_dump()] * 4
+    assert nhatot_results == [Nhatot(split_addresses=True).run(nhatot_page)] * 2
+    # Counted by the workers and sent back; the second page of a chunk comes from the cache
+    assert metrics.pages["mogi"] == 4
+    assert metrics.stage_calls[("mogi", "post_process")] <= 2
+    with sqlite3.connect(tmp_path / "results.sqlite") as db:
+        assert db.execute("SELECT COUNT(*) FROM results").fetchone() == (1,)
+
+
+def test_extract_many_mixed_sites_unordered():
+    mogi_html = (TEST_DIR / "mogi" / "sample1.html").read_text(encoding="utf-8")
+    muabannet_path = TEST_DIR / "muabannet" / "sample1.html"
+    items = [("mogi", mogi_html), ("Muabannet", muabannet_path)] * 4
+
+    results = list(extract_many(items, workers=2, chunksize=1, ordered=False))
+
+    expected = [
+        Mogi().run_html(mogi_html).model_dump(),
+        Muabannet().run(str(muabannet_path)).model_dump(),
+    ]
+    assert len(results) == len(items)
+    assert all(r.model_dump() in expected for r in results)
+
+
+def test_extract_many_failures():
+    items = [("nhatot", TEST_DIR / "mogi" / "sample1.html")]
+
+    with pytest.raises(ExtractionError):
+        list(extract_many(items, workers=1))
+
+    (error,) = extract_many(items, workers=1, return_exceptions=True)
+    assert error.site == "nhatot"
+    assert error.error_type
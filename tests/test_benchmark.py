@@ -0,0 +1,34 @@
+"""
+File: test_benchmark.py
+Desc: Make sure the benchmark runs over the fixtures and reports comparable numbers
+"""
+
+from lovesoup.benchmark import compare, iter_fixtures, peak_rss_mb, run_benchmark, synthetic_pages
+
+
+def test_benchmark_report():
+    report = run_benchmark(scale=2, sites=["mogi", "bds123vn"])
+
+    assert set(report["sites"]) == {"mogi", "bds123vn"}
+    assert report["sites"]["bds123vn"]["pages"] == 6
+    assert report["sites"]["mogi"]["pages_per_sec"] > 0
+    assert compare(report, report) == []
+
+
+def test_peak_rss_is_per_site():
+    ballast = b"x" * (300 * 1024 * 1024)
+
+    report = run_benchmark(scale=1, sites=["mogi", "nhatot"])
+
+    # Every site runs in a fresh process, none of them sees this one's peak
+    for result in report["sites"].values():
+        assert 0 < result["peak_rss_mb"] < peak_rss_mb() - 200
+    del ballast
+
+
+def test_synthetic_pages_are_distinct():
+    pages = iter_fixtures(sites=["mogi"])["mogi"]
+
+    htmls = [html for _, html in synthetic_pages(pages, 3)]
+
+    assert len(set(htmls)) == 3
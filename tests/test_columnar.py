@@ -0,0 +1,95 @@
+"""
+File: test_columnar.py
+Desc: Make sure prices and areas are parsed to numbers and listings export to Parquet
+"""
+
+import math
+import pathlib
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from lovesoup.columnar import parse_area, parse_price, to_columns, write_parquet  # noqa: E402
+from lovesoup.cooks import BatDongSan, Mogi  # noqa: E402
+
+TEST_DIR = pathlib.Path(__file__).parent / "test_data"
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("6,3 tỷ", (6.3e9, "")),
+        ("2.33 tỷ", (2.33e9, "")),
+        ("1 tỷ 90 triệu", (1.09e9, "")),
+        ("~74,12 triệu/m²", (7.412e7, "m2")),
+        ("- 165,71 triệu/m²", (1.6571e8, "m2")),
+        ("15.000.000 đ/tháng", (1.5e7, "month")),
+        ("500 nghìn/m2", (5e5, "m2")),
+        ("3,125 tỷ", (3.125e9, "")),
+        ("2.125 tỷ", (2.125e9, "")),
+        ("12,5 triệu/tháng", (1.25e7, "month")),
+        ("15.000 đ", (1.5e4, "")),
+    ],
+)
+def test_parse_price(text, expected):
+    value, per = parse_price(text)
+    assert value == pytest.approx(expected[0])
+    assert per == expected[1]
+
+
+@pytest.mark.parametrize("text", ["Thỏa thuận", "", None])
+def test_parse_price_unknown(text):
+    value, per = parse_price(text)
+    assert math.isnan(value)
+    assert per == ""
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [("85 m²", 85), ("55 m 2", 55), ("18 m 2 (3,6x5)", 18), ("35m²", 35), ("1,5 ha", 15000)],
+)
+def test_parse_area(text, expected):
+    assert parse_area(text) == pytest.approx(expected)
+
+
+@pytest.mark.parametrize("text", ["5m", "12 m", "mặt tiền 4,5m"])
+def test_lengths_are_not_areas(text):
+    assert math.isnan(parse_area(text))
+
+
+def _results():
+    return [
+        Mogi().run(str(TEST_DIR / "mogi" / "sample1.html")),
+        BatDongSan().run(str(TEST_DIR / "batdongsan" / "sample1.html")),
+        Mogi().run(str(TEST_DIR / "mogi" / "sample1.html")),
+    ]
+
+
+def test_to_columns():
+    results = _results()
+    columns = to_columns(results)
+
+    assert len(columns["listing_price"]) == 3
+    assert list(columns["listing_price"]) == [r.listing_price or "" for r in results]
+    for i, result in enumerate(results):
+        expected = parse_price(result.listing_price)[0]
+        assert columns["listing_price_vnd"][i] == pytest.approx(expected, nan_ok=True)
+        assert columns["image_count"][i] == len(result.images)
+        assert columns["images"][i] == result.images
+    assert columns["area_m2"].dtype == np.float64
+    # Same page twice, same numbers
+    assert columns["area_m2"][0] == columns["area_m2"][2]
+
+
+def test_write_parquet(tmp_path):
+    parquet = pytest.importorskip("pyarrow.parquet")
+    results = _results()
+    out = tmp_path / "listings.parquet"
+
+    assert write_parquet(results, out, batch_size=2) == 3
+
+    table = parquet.read_table(out)
+    assert table.num_rows == 3
+    assert table.column("listing_price").to_pylist() == [r.listing_price or "" for r in results]
+    assert table.column("images").to_pylist() == [r.images for r in results]
@@ -0,0 +1,65 @@
+"""
+File: test_compact.py
+Desc: Make sure results round-trip through the compact bulk container
+"""
+
+import pathlib
+import pickle
+
+import pytest
+
+from lovesoup.compact import POOLED_FIELDS, SUBMODELS, TEXT_FIELDS, CompactBatch
+from lovesoup.cooks import Cenhomes, Mogi, Muabannet
+from lovesoup.property_models import Address, PropertyNormalized
+
+TEST_DIR = pathlib.Path(__file__).parent / "test_data"
+
+
+def _results():
+    return [
+        Mogi().run(str(TEST_DIR / "mogi" / "sample1.html")),
+        Cenhomes().run(str(TEST_DIR / "cenhomes" / "sample1.html")),
+        Muabannet().run(str(TEST_DIR / "muabannet" / "sample1.html")),
+        PropertyNormalized(),
+        PropertyNormalized(address=Address(province="Hà Nội"), images=[]),
+    ]
+
+
+def test_fields_cover_model():
+    fields = set(POOLED_FIELDS + TEXT_FIELDS)
+    for name, info in PropertyNormalized.model_fields.items():
+        if name in SUBMODELS:
+            assert {f"{name}.{sub}" for sub in SUBMODELS[name].model_fields} <= fields
+        elif name != "images":
+            assert name in fields
+
+
+def test_round_trip():
+    results = _results()
+    batch = CompactBatch.from_results(results)
+
+    assert len(batch) == len(results)
+    assert list(batch) == results
+    assert batch[-1] == results[-1]
+    assert batch[1:3] == results[1:3]
+    with pytest.raises(IndexError):
+        batch[len(results)]
+
+
+def test_column_and_interning():
+    results = _results() * 3
+    batch = CompactBatch.from_results(results)
+
+    assert batch.column("address.province") == [
+        r.address.province if r.address else None for r in results
+    ]
+    assert batch.column("images") == [r.images for r in results]
+    assert batch.value(0, "listing_price") == results[0].listing_price
+    # Repeated values are stored once
+    assert len(batch.pool) == len(CompactBatch.from_results(results[:5]).pool)
+    assert len(batch.prefixes) < len(batch.image_names)
+
+
+def test_pickle():
+    batch = CompactBatch.from_results(_results())
+    assert list(pickle.loads(pickle.dumps(batch))) == list(batch)
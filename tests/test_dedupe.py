@@ -0,0 +1,165 @@
+"""
+File: test_dedupe.py
+Desc: Make sure the near-duplicate index matches reposts across sites and survives a save and load
+"""
+
+import pathlib
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from lovesoup.cooks import SITE_ALIASES, Mogi  # noqa: E402
+from lovesoup.dedupe import DedupeIndex, image_stem, listing_features  # noqa: E402
+from lovesoup.dedupe_benchmark import bench_dedupe  # noqa: E402
+from lovesoup.property_models import Address  # noqa: E402
+
+TEST_DIR = pathlib.Path(__file__).parent / "test_data"
+
+SAMPLES = sorted(TEST_DIR.glob("*/*.html"))
+
+
+def _results():
+    return [SITE_ALIASES[p.parent.name]().run(str(p)) for p in SAMPLES]
+
+
+def _mogi():
+    return Mogi().run(str(TEST_DIR / "mogi" / "sample1.html"))
+
+
+@pytest.mark.parametrize(
+    "url, expected",
+    [
+        ("https://cdn.example.com/2024/05/abc123_600x400.jpg", "abc123"),
+        ("https://cdn.example.com/abc123-thumb.webp?w=300", "abc123"),
+        ("https://img.example.vn/crop/1200x800/ABC123.JPG", "abc123"),
+        ("abc123", "abc123"),
+    ],
+)
+def test_image_stem(url, expected):
+    assert image_stem(url) == expected
+
+
+def test_fixtures_match_their_copies():
+    results = _results()
+    index = DedupeIndex()
+
+    first = list(index.add_many(results))
+    again = list(index.add_many(results))
+
+    for result, copy in zip(first, again):
+        assert result.id in dict(copy.matches)
+        assert copy.group == result.group
+    # Two of the bds123vn pages are the same listing, nothing else matches
+    groups = {result.group for result in first}
+    assert len(groups) == len(SAMPLES) - 1
+    names = [f"{p.parent.name}/{p.name}" for p in SAMPLES]
+    same = names.index("bds123vn/sample2.html")
+    assert first[same].group == names.index("bds123vn/sample1.html")
+
+
+def test_repost_on_another_site():
+    listing = _mogi()
+    repost = listing.model_copy(
+        update={
+            # Another address style, a rounded price, other images
+            "address": Address(full_address="Le Van Luong, Xa Phuoc Kien, Nha Be, Ho Chi Minh"),
+            "listing_price": "1,1 tỷ",
+            "images": ["https://cdn.other.vn/ffff0001.jpg"],
+        }
+    )
+    index = DedupeIndex()
+    original = index.add(listing)
+
+    (match_id, similarity), = index.add(repost).matches
+
+    assert match_id == original.id
+    assert similarity >= 0.55
+
+
+def test_repost_with_the_same_images():
+    listing = _mogi()
+    repost = {
+        "address": {"full_address": "Quận 1, Hồ Chí Minh"},
+        "listing_price": "1 tỷ",
+        "images": [url.replace(".jpg", "_600x400.jpg") for url in listing.images],
+    }
+    index = DedupeIndex()
+    index.add(listing)
+
+    assert [match_id for match_id, _ in index.add(repost).matches] == [0]
+
+
+def test_other_property_on_the_same_street():
+    listing = _mogi()
+    other = listing.model_copy(update={"listing_price": "7,5 tỷ", "images": []})
+    other.area = other.area.model_copy(update={"area": "210 m²"})
+    index = DedupeIndex()
+    index.add(listing)
+
+    assert index.add(other).matches == []
+
+
+def test_listing_without_enough_to_compare():
+    content, images = listing_features({"address": {"full_address": "Hà Nội"}, "images": []})
+
+    assert (content, images) == ([], [])
+    index = DedupeIndex()
+    index.add({"address": {}})
+    assert index.add({"address": {}}).matches == []
+
+
+def test_jsonl_records_and_query():
+    listing = _mogi()
+    record = {"source": "mogi/sample1.html", "site": "mogi", "result": listing.model_dump()}
+    index = DedupeIndex()
+    index.add(record)
+
+    assert index.keys == ["mogi/sample1.html"]
+    assert [match_id for match_id, _ in index.query([listing])[0]] == [0]
+    assert len(index) == 1
+
+
+def test_flushed_segments_give_the_same_matches():
+    results = _results() * 3
+    buffered = DedupeIndex()
+    flushed = DedupeIndex(flush_size=2)
+
+    expected = list(buffered.add_many(results))
+
+    assert list(flushed.add_many(results, batch_size=5)) == expected
+    assert len(flushed._segments) > 1
+
+
+def test_keys_must_match_the_listings():
+    results = _results()[:2]
+
+    with pytest.raises(ValueError, match="as many keys"):
+        list(DedupeIndex().add_many(results, keys=[]))
+    with pytest.raises(ValueError, match="as many keys"):
+        list(DedupeIndex().add_many(results, keys=["a", "b", "c"]))
+
+
+def test_save_and_load(tmp_path):
+    results = _results()
+    index = DedupeIndex(flush_size=4)
+    added = list(index.add_many(results, keys=[str(p) for p in SAMPLES]))
+    index.save(tmp_path / "index")
+
+    loaded = DedupeIndex.load(tmp_path / "index")
+
+    assert len(loaded) == len(results)
+    assert loaded.keys == [str(p) for p in SAMPLES]
+    assert list(loaded.groups()) == [result.group for result in added]
+    assert loaded.query(results) == index.query(results)
+    # And keeps taking listings
+    again = list(loaded.add_many(results))
+    assert [result.group for result in again] == [result.group for result in added]
+
+
+def test_bench_dedupe():
+    report = bench_dedupe(3000, queries=50)
+
+    assert report["precision"] > 0.95
+    assert report["recall"] > 0.95
+    assert report["disk_mb"] > 0
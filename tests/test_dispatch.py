@@ -0,0 +1,61 @@
+"""
+File: test_dispatch.py
+Desc: Make sure every fixture is routed to its own cook
+"""
+
+import pathlib
+
+import pytest
+
+from lovesoup.batch import extract_many
+from lovesoup.cooks import SITE_ALIASES
+from lovesoup.dispatch import MARKER_SIZE, Dispatcher, UnknownSiteError, detect_site
+
+TEST_DIR = pathlib.Path(__file__).parent / "test_data"
+
+SAMPLES = sorted(TEST_DIR.glob("*/*.html"))
+
+
+@pytest.mark.parametrize("html_file", SAMPLES, ids=lambda p: f"{p.parent.name}/{p.name}")
+def test_detect_site_from_html(html_file):
+    html = html_file.read_text(encoding="utf-8")
+
+    assert detect_site(html) == SITE_ALIASES[html_file.parent.name]().template
+
+
+def test_detect_site_from_url_and_markers():
+    assert detect_site(url="https://www.nhatot.com/mua-ban/1.htm") == "nhatot"
+    assert detect_site(url="mogi.vn") == "mogi"
+    assert detect_site(url="https://example.com/") is None
+    assert detect_site('<div class="re__pr-short-info"></div>') == "batdongsancomvn"
+    assert detect_site("<p>nothing here</p>") is None
+
+
+def test_markers_are_looked_for_in_the_top_of_the_page():
+    filler = "<p>nothing here</p>" * (MARKER_SIZE // 10)
+
+    assert detect_site(f'<div class="re__pr-title"></div>{filler}') == "batdongsancomvn"
+    assert detect_site(f'{filler}<div class="re__pr-title"></div>') is None
+
+
+def test_dispatcher_runs_the_right_cook():
+    dispatcher = Dispatcher()
+    html_file = TEST_DIR / "mogi" / "sample1.html"
+
+    expected = SITE_ALIASES["mogi"]().run(str(html_file))
+    assert dispatcher.run(str(html_file)) == expected
+    assert dispatcher.run(str(html_file), url="https://mogi.vn/x") == expected
+    with pytest.raises(UnknownSiteError):
+        dispatcher.run_html("<p>nothing here</p>")
+
+
+def test_batch_auto_detection():
+    items = [
+        (None, TEST_DIR / "mogi" / "sample1.html"),
+        ("https://muaban.net/a", TEST_DIR / "muabannet" / "sample1.html"),
+    ]
+
+    results = list(extract_many(items, workers=1))
+
+    assert results[0] == SITE_ALIASES["mogi"]().run(str(items[0][1]))
+    assert results[1] == SITE_ALIASES["muabannet"]().run(str(items[1][1]))
@@ -0,0 +1,59 @@
+"""
+File: test_extraction_plan.py
+Desc: Make sure the compiled extraction plan gives exactly what selectorlib gives
+"""
+
+import pathlib
+
+import pytest
+
+from lovesoup.cooks import SITE_ALIASES
+from lovesoup.extraction_plan import ExtractionPlan, split_descendant_chain
+
+TEST_DIR = pathlib.Path(__file__).parent / "test_data"
+
+SAMPLES = sorted(TEST_DIR.glob("*/*.html"))
+
+
+@pytest.mark.parametrize("html_file", SAMPLES, ids=lambda p: f"{p.parent.name}/{p.name}")
+def test_plan_matches_selectorlib(html_file):
+    cook = SITE_ALIASES[html_file.parent.name]()
+    html = html_file.read_text(encoding="utf-8")
+
+    assert cook.plan.extract(html) == cook.extractor.extract(html)
+
+
+def test_plan_subset_of_keys():
+    cook = SITE_ALIASES["mogi"]()
+    html = (TEST_DIR / "mogi" / "sample1.html").read_text(encoding="utf-8")
+
+    full = cook.plan.extract(html)
+    subset = cook.plan.extract(html, keys=["address", "images"])
+
+    assert subset == {"address": full["address"], "images": full["images"]}
+
+
+def test_plan_children_and_self_selector():
+    config = {
+        "rows": {
+            "css": "ul li",
+            "multiple": True,
+            "children": {
+                "whole": {"css": "", "type": "Text"},
+                "link": {"css": "a", "type": "Link"},
+            },
+        },
+        "missing": {"css": "table", "type": "Text"},
+    }
+    html = '<ul><li><a href="/a">A</a> one</li><li>two</li></ul>'
+
+    assert ExtractionPlan(config).extract(html) == {
+        "rows": [{"whole": "A one", "link": "/a"}, {"whole": "two", "link": None}],
+        "missing": None,
+    }
+
+
+def test_split_descendant_chain():
+    assert split_descendant_chain("div.main-info div.price") == ["div.main-info", "div.price"]
+    assert split_descendant_chain("div > span") is None
+    assert split_descendant_chain("h1") is None
@@ -0,0 +1,78 @@
+"""
+File: test_features.py
+Desc: Make sure feature lists are indexed by normalized title
+"""
+
+import unicodedata
+
+import pytest
+
+from lovesoup.cooks import ALL_COOKS
+from lovesoup.features import FeatureIndex, normalize_title, resolve_features
+from lovesoup.precook_models.bds123vn_models import BDS123VnFeatureItem
+from lovesoup.precook_models.mogi_models import MogiFeature, MogiPropertyInfo
+
+
+@pytest.mark.parametrize(
+    "title",
+    [
+        "Diện tích",
+        "Diện tích:",
+        "Diện tích :",
+        "Diện\xa0tích",
+        "  Diện tích\n",
+        unicodedata.normalize("NFD", "Diện tích:"),
+    ],
+)
+def test_normalize_title(title):
+    assert normalize_title(title) == "Diện tích"
+
+
+def test_feature_shapes():
+    features = [
+        MogiFeature(title="Ngày đăng", value="22/10/2024"),
+        BDS123VnFeatureItem(item=["Ngày bắt đầu:", "21/10/2024"]),
+        {"item": ["Diện tích sử dụng :", "85 m²"]},
+        {"title": "Mức giá", "value": "6,3 tỷ"},
+        ["Số tầng:", "3"],
+        {"item": []},
+    ]
+
+    index = FeatureIndex(features)
+
+    assert len(index) == 5
+    assert index.get("Ngày đăng:") == "22/10/2024"
+    assert index.get("Ngày bắt đầu") == "21/10/2024"
+    assert index.get("Diện tích sử dụng") == "85 m²"
+    assert index.get("Mức giá") == "6,3 tỷ"
+    assert "Số tầng" in index
+    assert index.get("Hướng nhà") == ""
+    assert FeatureIndex(None).get("Hướng nhà", None) is None
+
+
+def test_first_value_wins():
+    index = FeatureIndex([["Diện tích", "85 m²"], ["Diện tích:", "90 m²"]])
+    assert index.get("Diện tích") == "85 m²"
+
+
+def test_resolve_features():
+    precook = MogiPropertyInfo(
+        title="",
+        address="",
+        listing_price="",
+        images=[],
+        features=[MogiFeature(title="Diện tích đất:", value="85 m²")],
+    )
+
+    resolved = resolve_features(
+        {"area": ("features", "Diện tích đất"), "publish_date": ("features", "Ngày đăng")},
+        precook,
+    )
+
+    assert resolved == {"area": "85 m²", "publish_date": ""}
+
+
+@pytest.mark.parametrize("cook", ALL_COOKS)
+def test_feature_maps_use_normalized_titles(cook):
+    for attribute, title in cook.FEATURE_MAP.values():
+        assert title == normalize_title(title)
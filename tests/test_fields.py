@@ -0,0 +1,40 @@
+"""
+File: test_fields.py
+Desc: Make sure field-selective extraction gives the same values as a full run
+"""
+
+import pathlib
+
+import pytest
+
+from lovesoup.cooks import SITE_ALIASES
+from lovesoup.property_models import PropertyNormalized
+
+TEST_DIR = pathlib.Path(__file__).parent / "test_data"
+
+SAMPLES = sorted(TEST_DIR.glob("*/*.html"))
+
+
+@pytest.mark.parametrize("html_file", SAMPLES, ids=lambda p: f"{p.parent.name}/{p.name}")
+def test_each_field_alone_matches_full_run(html_file):
+    extractor = SITE_ALIASES[html_file.parent.name]()
+    html = html_file.read_text(encoding="utf-8")
+    full = extractor.run_html(html)
+
+    for field in PropertyNormalized.model_fields:
+        partial = extractor.run_html(html, fields=[field])
+        assert getattr(partial, field) == getattr(full, field), field
+
+
+def test_fields_only_evaluates_needed_keys():
+    extractor = SITE_ALIASES["batdongsan"]()
+    html_file = TEST_DIR / "batdongsan" / "sample1.html"
+
+    assert extractor.template_keys_for(["images", "publish_date"]) == ["images", "ad_info"]
+
+    result = extractor.run(str(html_file), fields=["images"])
+    assert result.images
+    assert result.address is None
+
+    with pytest.raises(ValueError):
+        extractor.template_keys_for(["not_a_field"])
@@ -0,0 +1,171 @@
+"""
+File: test_gazetteer.py
+Desc: Make sure free-text addresses are split into the right Address fields
+"""
+
+import pathlib
+import unicodedata
+
+import pytest
+
+from lovesoup.cooks import SITE_ALIASES
+from lovesoup.gazetteer import (
+    PROVINCE,
+    AddressParts,
+    Gazetteer,
+    default_gazetteer,
+    fill_address,
+    split_address,
+)
+from lovesoup.instrumentation import Instrumentation
+from lovesoup.property_models import Address
+
+TEST_DIR = pathlib.Path(__file__).parent / "test_data"
+
+HCM = "Thành phố Hồ Chí Minh"
+HANOI = "Thành phố Hà Nội"
+
+
+@pytest.mark.parametrize(
+    "address, expected",
+    [
+        (
+            "15, Đường Nhật Chiêu, Phường Nhật Tân, Quận Tây Hồ, Hà Nội",
+            ("15", None, "Đường Nhật Chiêu", "Phường Nhật Tân", "Quận Tây Hồ", HANOI),
+        ),
+        (
+            "Dự án Vinhomes Central Park, Đường Điện Biên Phủ, Phường 22, Bình Thạnh, Hồ Chí Minh",
+            (None, None, "Đường Điện Biên Phủ", "Phường 22", "Quận Bình Thạnh", HCM),
+        ),
+        (
+            "Địa chỉ: Khu đô thị Kim Văn - Kim Lũ (Golden Silk) - Đường Nghiêm Xuân Yêm, "
+            "Phường Đại Kim, Quận Hoàng Mai, Hà Nội",
+            (None, None, "Đường Nghiêm Xuân Yêm", "Phường Đại Kim", "Quận Hoàng Mai", HANOI),
+        ),
+        (
+            "Lê Văn Lương, Xã Phước Kiển, Huyện Nhà Bè, TPHCM",
+            (None, None, "Lê Văn Lương", "Xã Phước Kiển", "Huyện Nhà Bè", HCM),
+        ),
+        (
+            "Số 12 ngõ 34 Nguyễn Trãi, P. Thượng Đình, Q. Thanh Xuân, HN",
+            ("12", "ngõ 34", "Nguyễn Trãi", "Phường Thượng Đình", "Quận Thanh Xuân", HANOI),
+        ),
+        # Abbreviations, no commas
+        ("P12 Q10 tphcm", (None, None, None, "Phường 12", "Quận 10", HCM)),
+        # No accents
+        (
+            "123/4 Le Van Sy, P.13, Q.3, TP.HCM",
+            ("123/4", None, "Le Van Sy", "Phường 13", "Quận 3", HCM),
+        ),
+        (
+            "ngo 5 ngach 12 Lang Ha, Dong Da, Ha Noi",
+            (None, "ngo 5 ngach 12", "Lang Ha", None, "Quận Đống Đa", HANOI),
+        ),
+        # A street named after a surname, not an alley ("Ngõ") nor a street prefix
+        (
+            "Ngô Quyền, Phường Vĩnh Ninh, Thành phố Huế, Thừa Thiên Huế",
+            (None, None, "Ngô Quyền", "Phường Vĩnh Ninh", "Thành phố Huế", "Tỉnh Thừa Thiên Huế"),
+        ),
+        # The province tells which Hoàng Mai
+        ("Thị xã Hoàng Mai, Nghệ An", (None, None, None, None, "Thị xã Hoàng Mai", "Tỉnh Nghệ An")),
+        ("Hoàng Mai, Hà Nội", (None, None, None, None, "Quận Hoàng Mai", HANOI)),
+        # A province name inside a street name is not the province
+        (
+            "Đường Hà Nội, Thủ Đức, Hồ Chí Minh",
+            (None, None, "Đường Hà Nội", None, "Thành phố Thủ Đức", HCM),
+        ),
+        # A provincial road, not a province
+        ("Tỉnh lộ 10, Bình Tân", (None, None, "Tỉnh lộ 10", None, "Quận Bình Tân", HCM)),
+        ("Nha Trang, Khánh Hòa", (None, None, None, None, "Thành phố Nha Trang", "Tỉnh Khánh Hòa")),
+        # Bare names in one part: the district runs up to its province...
+        ("Tây Hồ Hà Nội", (None, None, None, None, "Quận Tây Hồ", HANOI)),
+        # ...unless something comes before it
+        ("123 Cầu Giấy Hà Nội", ("123", None, "Cầu Giấy", None, None, HANOI)),
+        ("", (None,) * 6),
+    ],
+)
+def test_split_address(address, expected):
+    assert split_address(address) == AddressParts(*expected)
+
+
+def test_decomposed_accents():
+    address = "Phường Đại Kim, Quận Hoàng Mai, Hà Nội"
+
+    assert split_address(unicodedata.normalize("NFD", address)) == split_address(address)
+
+
+@pytest.mark.parametrize(
+    "html_file",
+    sorted(TEST_DIR.glob("*/*.html")),
+    ids=lambda p: f"{p.parent.name}/{p.name}",
+)
+def test_cooks_fill_addresses(html_file):
+    cook_cls = SITE_ALIASES[html_file.parent.name]
+    plain = cook_cls().run(str(html_file))
+    result = cook_cls(split_addresses=True).run(str(html_file))
+
+    assert result.address.province in (HANOI, HCM)
+    assert result.address.district
+    # Fields the site gives are kept
+    for field, value in plain.address.model_dump().items():
+        if value:
+            assert getattr(result.address, field) == value
+    assert result.model_dump(exclude={"address"}) == plain.model_dump(exclude={"address"})
+
+
+def test_fill_keeps_given_fields():
+    address = Address(full_address="Phường Bạch Mai, Quận Hai Bà Trưng", district="Hai Bà Trưng")
+
+    filled = fill_address(address)
+
+    assert filled.district == "Hai Bà Trưng"
+    assert (filled.ward, filled.province) == ("Phường Bạch Mai", HANOI)
+    assert address.ward is None
+    # Without a full address, from the other fields
+    assert fill_address(Address(district="Quận Hai Bà Trưng")).province == HANOI
+
+
+def test_address_stage():
+    metrics = Instrumentation()
+    cook = SITE_ALIASES["mogi"](split_addresses=True, instrumentation=metrics)
+    cook.run(str(TEST_DIR / "mogi" / "sample1.html"))
+
+    assert "address" in metrics.to_dict()["mogi"]["stages"]
+
+
+def test_memoized():
+    gazetteer = Gazetteer([(HANOI, "Quận Hoàng Mai", "")])
+    address = "Phường Đại Kim, Quận Hoàng Mai, Hà Nội"
+
+    assert gazetteer.split(address) is gazetteer.split(address)
+    assert gazetteer.split.cache_info().hits == 1
+
+
+def test_wards_from_csv(tmp_path):
+    path = tmp_path / "units.csv"
+    path.write_text(
+        "province,district,ward\n"
+        "Thành phố Hà Nội,Quận Hoàng Mai,Phường Đại Kim\n"
+        "Tỉnh Nghệ An,Thị xã Hoàng Mai,Phường Quỳnh Thiện\n",
+        encoding="utf-8",
+    )
+    gazetteer = Gazetteer.from_csv(path)
+
+    assert gazetteer.split("Dai Kim, Hoang Mai") == AddressParts(
+        ward="Phường Đại Kim", district="Quận Hoàng Mai", province=HANOI
+    )
+    # The ward tells which Hoàng Mai
+    assert gazetteer.split("Quỳnh Thiện, Hoàng Mai") == AddressParts(
+        ward="Phường Quỳnh Thiện", district="Thị xã Hoàng Mai", province="Tỉnh Nghệ An"
+    )
+    # And so does the prefix
+    assert gazetteer.split("TX Hoàng Mai").province == "Tỉnh Nghệ An"
+    assert gazetteer.split("Dai Kim Hoang Mai Ha Noi") == AddressParts(
+        ward="Phường Đại Kim", district="Quận Hoàng Mai", province=HANOI
+    )
+
+
+def test_bundled_dataset():
+    units = default_gazetteer().units
+
+    assert sum(unit.level == PROVINCE for unit in units) == 63
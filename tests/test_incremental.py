@@ -0,0 +1,182 @@
+"""
+File: test_incremental.py
+Desc: Make sure a template edit is applied by evaluating only the selectors that changed
+"""
+
+import pathlib
+
+import pytest
+import yaml
+
+from lovesoup.batch import extract_records
+from lovesoup.cooks import SITE_ALIASES, Mogi
+from lovesoup.general_extractor import read_yaml_file
+from lovesoup.incremental import (
+    RawSink,
+    diff_template,
+    extract_raw,
+    load_plan,
+    main,
+    reextract,
+    write_raw,
+)
+from lovesoup.sinks import read_jsonl
+
+TEST_DIR = pathlib.Path(__file__).parent / "test_data"
+
+SAMPLES = sorted(TEST_DIR.glob("*/*.html"))
+
+MOGI_PAGE = TEST_DIR / "mogi" / "sample1.html"
+
+MOGI_YAML = read_yaml_file("mogi.yaml")
+
+# The version of mogi.yaml before a fix: a broken price selector, no phone
+# yet, and a key since dropped
+OLD_MOGI_YAML = (
+    MOGI_YAML.replace("div.main-info div.price", "div.main-info div.cost")
+    .split("\nphone:")[0]
+    + "\nagent:\n    css: 'div.agent-name'\n    type: Text\n"
+    + "\nimages:"
+    + MOGI_YAML.split("\nimages:")[1]
+)
+
+
+def _stored(yaml=OLD_MOGI_YAML, page=MOGI_PAGE, site="mogi"):
+    """
+    A raw record as a run with that version of the template stored it
+    """
+    cook = SITE_ALIASES[site]()
+    cook.plan, template_hash = load_plan(cook.template, yaml)
+    raw = cook.extract(page.read_text(encoding="utf-8"))
+    return {"source": str(page), "site": site, "template_hash": template_hash, "raw": raw}
+
+
+def _no_page(record):
+    raise AssertionError(f"{record['source']} should not be read")
+
+
+def test_diff_template():
+    diff = diff_template("mogi", OLD_MOGI_YAML)
+
+    assert diff.changed == ("listing_price", "phone")
+    assert diff.removed == ("agent",)
+    assert diff.fields == ("listing_price",)
+    assert diff.old_hash != diff.new_hash
+
+
+def test_unchanged_template():
+    diff = diff_template(Mogi(), MOGI_YAML)
+
+    assert (diff.changed, diff.removed, diff.fields) == ((), (), ())
+
+
+def test_bundled_plan_is_the_default_old_version():
+    # The bundled plans are up to date: nothing to do
+    assert diff_template("nhatot") == diff_template("nhatot", read_yaml_file("nhatot.yaml"))
+    assert diff_template("nhatot").changed == ()
+
+
+def test_reextract_changed_keys_only():
+    stored = _stored()
+    assert stored["raw"]["listing_price"] is None
+    # Only the changed keys are evaluated again, the others come from the stored output
+    stored["raw"]["title"] = "Stored title"
+
+    (record,) = reextract([stored], [diff_template("mogi", OLD_MOGI_YAML)], workers=1)
+
+    expected = Mogi().extract(MOGI_PAGE.read_text(encoding="utf-8"))
+    assert record.error is None
+    assert record.raw == {**expected, "title": "Stored title"}
+    assert record.result == Mogi().run(str(MOGI_PAGE))
+    assert record.template_hash == Mogi().compiled_template.content_hash
+
+
+def test_reextract_without_reading_pages():
+    with_agent = MOGI_YAML + "\nagent:\n    css: 'div.agent-name'\n    type: Text\n"
+    current, removed_only = _stored(MOGI_YAML), _stored(with_agent)
+    diff = diff_template("mogi", with_agent)
+
+    records = list(reextract([current, removed_only], [diff], workers=1, page=_no_page))
+
+    assert diff.changed == () and diff.removed == ("agent",)
+    assert [r.result for r in records] == [Mogi().run(str(MOGI_PAGE))] * 2
+    assert "agent" not in records[1].raw
+
+
+def test_unknown_version_is_extracted_again():
+    stored = _stored()
+    stored["template_hash"] = "some older version"
+    failed = {"source": str(MOGI_PAGE), "site": "mogi", "template_hash": None, "raw": None}
+
+    records = list(reextract([stored, failed], [diff_template("mogi", OLD_MOGI_YAML)], workers=1))
+
+    assert [r.raw for r in records] == [Mogi().extract(str(MOGI_PAGE.read_text()))] * 2
+
+
+def test_extract_raw_matches_extract_records():
+    items = [(html_file.parent.name, html_file) for html_file in SAMPLES]
+    items += [("nhatot", MOGI_PAGE), (None, "<p>?</p>")]
+
+    records = list(extract_raw(items, workers=2))
+
+    expected = list(extract_records(items, workers=1))
+    assert [r.extraction_record()[:3] for r in records] == [(r.source, r.site, r.result) for r in expected]
+    wrong_site, unknown = records[-2:]
+    # The template ran, its output is kept for a later fix
+    assert wrong_site.error is not None and wrong_site.raw is not None
+    assert unknown.raw is None and unknown.template_hash is None
+
+
+def test_write_raw_round_trip(tmp_path):
+    items = [(html_file.parent.name, html_file) for html_file in SAMPLES]
+    raw_path, results_path = tmp_path / "raw.jsonl.gz", tmp_path / "out.jsonl"
+
+    assert write_raw(items, raw_path, workers=1, results_path=results_path) == (len(SAMPLES), 0)
+
+    stored = list(read_jsonl(raw_path))
+    results = {line["source"]: line["result"] for line in read_jsonl(results_path)}
+    # Up to date: post_process only
+    for record in reextract(stored, workers=1, page=_no_page):
+        assert record.result.model_dump() == results[record.source]
+    with RawSink(tmp_path / "again.jsonl") as sink:
+        for record in reextract(stored, workers=2):
+            sink.write_record(record)
+    assert list(read_jsonl(tmp_path / "again.jsonl")) == stored
+
+
+@pytest.mark.parametrize(
+    "site, key",
+    [
+        (site, key)
+        for site in sorted({p.parent.name for p in SAMPLES})
+        for key in SITE_ALIASES[site]().plan.keys
+    ],
+)
+def test_every_key_of_every_cook(site, key):
+    cook = SITE_ALIASES[site]()
+    config = yaml.safe_load(read_yaml_file(f"{cook.template}.yaml"))
+    pages = sorted((TEST_DIR / site).glob("*.html"))
+    # Older version: that selector found nothing
+    config[key] = {**config[key], "xpath": "//nothing"}
+    old = yaml.safe_dump(config, allow_unicode=True, sort_keys=False)
+    stored = [_stored(old, page, site) for page in pages]
+
+    records = list(reextract(stored, [diff_template(site, old)], workers=1))
+
+    assert diff_template(site, old).changed == (key,)
+    assert [r.raw for r in records] == [cook.extract(page.read_text()) for page in pages]
+    assert [r.result for r in records] == [cook.run(str(page)) for page in pages]
+
+
+def test_cli(tmp_path, capsys):
+    old = tmp_path / "mogi.yaml"
+    old.write_text(OLD_MOGI_YAML, encoding="utf-8")
+    raw = tmp_path / "raw.jsonl"
+    with RawSink(raw) as sink:
+        for record in reextract([_stored()], workers=1):
+            sink.write_record(record)
+
+    assert main(["mogi", "--old", str(old)]) == 0
+    assert "changed: listing_price, phone" in capsys.readouterr().out
+    assert main(["mogi", "--old", str(old), "--raw", str(raw), "--output", str(tmp_path / "o.jsonl")]) == 0
+    assert "failed:  0" in capsys.readouterr().out
@@ -0,0 +1,124 @@
+"""
+File: test_ingest.py
+Desc: Make sure the asyncio pipeline fetches pages from a local server and extracts them
+"""
+
+import asyncio
+import functools
+import gzip
+import http.server
+import pathlib
+import threading
+import time
+
+import pytest
+
+from lovesoup.cooks import Mogi, get_cook
+from lovesoup.ingest import Fetcher, HTTPStatusError, ingest
+
+TEST_DIR = pathlib.Path(__file__).parent / "test_data"
+
+
+class Handler(http.server.SimpleHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+    clients = set()
+
+    def do_GET(self):
+        self.clients.add(self.client_address)
+        if self.path == "/redirect":
+            self.send_response(302)
+            self.send_header("Location", "/mogi/sample1.html")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+        elif self.path == "/gzip":
+            body = gzip.compress((TEST_DIR / "mogi" / "sample1.html").read_bytes())
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Encoding", "gzip")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            super().do_GET()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    Handler.clients = set()
+    httpd = http.server.ThreadingHTTPServer(
+        ("127.0.0.1", 0), functools.partial(Handler, directory=str(TEST_DIR))
+    )
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def _collect(urls, **kwargs):
+    async def main():
+        return [record async for record in ingest(urls, **kwargs)]
+
+    return asyncio.run(main())
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_ingest_fixtures(server, workers):
+    pages = sorted(TEST_DIR.glob("*/*.html"))
+    urls = [f"{server}/{page.parent.name}/{page.name}" for page in pages] * 2
+
+    records = _collect(urls, workers=workers, fetcher=Fetcher(per_host=2))
+
+    assert sorted(r.source for r in records) == sorted(urls)
+    by_source = {r.source: r for r in records}
+    for page in pages:
+        record = by_source[f"{server}/{page.parent.name}/{page.name}"]
+        assert record.error is None, record.error
+        assert record.result == get_cook(page.parent.name)().run(str(page))
+    # Keep-alive: two connections served every request
+    assert len(Handler.clients) <= 2
+
+
+def test_ingest_errors(server):
+    records = _collect([f"{server}/missing.html", "http://127.0.0.1:9/closed"], workers=1)
+
+    errors = {r.source: r.error for r in records}
+    assert errors[f"{server}/missing.html"].error_type == "HTTPStatusError"
+    assert errors["http://127.0.0.1:9/closed"].error_type == "ConnectionRefusedError"
+    assert all(r.result is None for r in records)
+
+
+def test_fetcher_redirect_gzip_and_rate(server):
+    expected = Mogi().run(str(TEST_DIR / "mogi" / "sample1.html"))
+
+    async def main():
+        async with Fetcher(rate=20) as fetcher:
+            started = time.perf_counter()
+            redirected = await fetcher.fetch(f"{server}/redirect")
+            compressed = await fetcher.fetch(f"{server}/gzip")
+            await asyncio.gather(*(fetcher.fetch(f"{server}/gzip") for _ in range(3)))
+            elapsed = time.perf_counter() - started
+            with pytest.raises(HTTPStatusError):
+                await fetcher.fetch(f"{server}/missing.html")
+            return redirected, compressed, elapsed, fetcher
+
+    redirected, compressed, elapsed, fetcher = asyncio.run(main())
+
+    assert redirected.url.endswith("/mogi/sample1.html")
+    assert Mogi().run_html(redirected.text) == expected
+    assert Mogi().run_html(compressed.text) == expected
+    # 6 requests at 20 per second
+    assert elapsed >= 0.25
+    assert fetcher.connections_opened < fetcher.requests
+
+
+def test_ingest_stops_early(server):
+    async def main():
+        urls = (f"{server}/mogi/sample1.html" for _ in range(1000))
+        async for record in ingest(urls, workers=1):
+            return record
+
+    assert asyncio.run(main()).error is None
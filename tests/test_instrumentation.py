@@ -0,0 +1,50 @@
+"""
+File: test_instrumentation.py
+Desc: Make sure instrumented extractors report their stages and counters
+"""
+
+import json
+import pathlib
+
+import pytest
+from pydantic import ValidationError
+
+from lovesoup.cooks import Mogi
+from lovesoup.instrumentation import Instrumentation
+
+TEST_DIR = pathlib.Path(__file__).parent / "test_data" / "mogi"
+
+
+def test_stages_and_counters():
+    seen = []
+    metrics = Instrumentation(on_stage=lambda template, stage, seconds: seen.append(stage))
+    extractor = Mogi(instrumentation=metrics)
+
+    extractor.run(str(TEST_DIR / "sample1.html"))
+    extractor.run_html((TEST_DIR / "sample1.html").read_text(encoding="utf-8"))
+
+    report = metrics.to_dict()["mogi"]
+    assert report["pages"] == 2
+    assert report["bytes_in"] > (TEST_DIR / "sample1.html").stat().st_size
+    assert set(report["stages"]) == {"read", "parse", "select", "validate", "post_process"}
+    assert report["stages"]["parse"]["calls"] == 2
+    assert report["selectors"]["images"] == {"hits": 2, "misses": 0}
+    assert seen.count("read") == 1
+
+    assert 'lovesoup_pages_total{template="mogi"} 2' in metrics.to_prometheus()
+    assert json.loads(metrics.to_json())["mogi"]["pages"] == 2
+
+
+def test_validation_failures_and_merge():
+    metrics = Instrumentation()
+    extractor = Mogi(instrumentation=metrics)
+
+    with pytest.raises(ValidationError):
+        extractor.run_html("<html><body></body></html>")
+
+    report = metrics.to_dict()["mogi"]
+    assert report["validation_failures"] == 1
+    assert report["stages"]["post_process"]["errors"] == 1
+
+    merged = Instrumentation().merge(metrics).merge(metrics)
+    assert merged.to_dict()["mogi"]["validation_failures"] == 2
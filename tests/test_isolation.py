@@ -0,0 +1,162 @@
+"""
+File: test_isolation.py
+Desc: Make sure isolated batch runs survive pages that fail, hang, crash or run out of memory
+"""
+
+import hashlib
+import json
+import os
+import pathlib
+import signal
+import sqlite3
+import time
+
+from lovesoup.batch import extract_records
+from lovesoup.cooks import Mogi
+from lovesoup.instrumentation import Instrumentation
+from lovesoup.isolation import PageFailure, extract_isolated
+from lovesoup.result_cache import ResultCache
+from lovesoup.sinks import error_dict
+
+TEST_DIR = pathlib.Path(__file__).parent / "test_data"
+
+SAMPLES = sorted(TEST_DIR.glob("*/*.html"))
+
+MOGI_PAGE = TEST_DIR / "mogi" / "sample1.html"
+
+
+class SlowMogi(Mogi):
+    def post_process(self, primary_result):
+        time.sleep(30)
+
+
+class StuckMogi(Mogi):
+    def extract(self, html_content, keys=None):
+        # Like C code that never gets back to the interpreter
+        signal.signal(signal.SIGALRM, signal.SIG_IGN)
+        time.sleep(30)
+
+
+class CrashingMogi(Mogi):
+    def extract(self, html_content, keys=None):
+        os.kill(os.getpid(), signal.SIGKILL)
+
+
+class HungryMogi(Mogi):
+    def extract(self, html_content, keys=None):
+        return bytearray(1 << 33)
+
+
+def _items():
+    return [(html_file.parent.name, html_file) for html_file in SAMPLES]
+
+
+def _failure(record) -> PageFailure:
+    assert record.result is None
+    assert isinstance(record.error, PageFailure)
+    return record.error
+
+
+def test_same_records_as_extract_records():
+    items = _items() + [("nhatot", MOGI_PAGE), (None, "<html>nothing</html>")]
+
+    records = list(extract_isolated(items, workers=2))
+    expected = list(extract_records(items, workers=1))
+
+    assert [(r.source, r.site, r.result) for r in records] == [
+        (r.source, r.site, r.result) for r in expected
+    ]
+    assert [r.error is None for r in records] == [r.error is None for r in expected]
+
+
+def test_cook_options_are_kept(tmp_path):
+    metrics = Instrumentation()
+    cache = ResultCache(path=str(tmp_path / "results.sqlite"))
+    mogi = Mogi(split_addresses=True, instrumentation=metrics, result_cache=cache)
+
+    records = list(extract_isolated([(mogi, MOGI_PAGE)] * 3, workers=1))
+
+    expected = Mogi(split_addresses=True).run(str(MOGI_PAGE))
+    assert [record.result for record in records] == [expected] * 3
+    # Counted by the worker and sent back; the later pages come from the cache
+    assert metrics.pages["mogi"] == 3
+    assert metrics.stage_calls[("mogi", "post_process")] == 1
+    with sqlite3.connect(tmp_path / "results.sqlite") as db:
+        assert db.execute("SELECT COUNT(*) FROM results").fetchone() == (1,)
+
+
+def test_failure_records():
+    records = list(extract_isolated([("nhatot", MOGI_PAGE), (None, "<p>?</p>")], workers=1))
+
+    wrong_site, unknown = map(_failure, records)
+    assert wrong_site.site == "nhatot"
+    assert wrong_site.stage in ("extract", "post_process", "validate")
+    assert wrong_site.input_hash == hashlib.sha256(MOGI_PAGE.read_bytes()).hexdigest()
+    assert wrong_site.attempts == 1
+    assert (unknown.stage, unknown.error_type) == ("detect", "UnknownSiteError")
+    assert error_dict(unknown)["stage"] == "detect"
+
+
+def test_timeout_keeps_the_batch_going():
+    items = [("mogi", MOGI_PAGE), (SlowMogi(), MOGI_PAGE), ("mogi", MOGI_PAGE)]
+
+    first, slow, last = extract_isolated(items, workers=1, timeout=0.5, retries=0)
+
+    failure = _failure(slow)
+    assert (failure.stage, failure.error_type) == ("post_process", "PageTimeout")
+    assert first.result == last.result == Mogi().run(str(MOGI_PAGE))
+
+
+def test_stuck_worker_is_killed(monkeypatch):
+    from lovesoup import isolation
+
+    monkeypatch.setattr(isolation, "KILL_GRACE", 0.5)
+    items = [(StuckMogi(), MOGI_PAGE), ("mogi", MOGI_PAGE)]
+
+    stuck, after = extract_isolated(items, workers=1, timeout=0.2, retries=1)
+
+    failure = _failure(stuck)
+    assert (failure.stage, failure.error_type, failure.attempts) == ("extract", "PageTimeout", 2)
+    assert after.error is None
+
+
+def test_crash_is_retried_then_quarantined(tmp_path):
+    html = MOGI_PAGE.read_text(encoding="utf-8")
+    items = [(CrashingMogi(), html), ("mogi", html)]
+
+    crashed, after = extract_isolated(items, workers=2, retries=2, quarantine_dir=tmp_path)
+
+    failure = _failure(crashed)
+    assert failure.error_type == "WorkerCrashed"
+    assert "SIGKILL" in failure.message
+    assert (failure.stage, failure.attempts) == ("extract", 3)
+    assert after.error is None
+    saved = tmp_path / failure.input_hash
+    assert saved.with_suffix(".html").read_text(encoding="utf-8") == html
+    assert json.loads(saved.with_suffix(".json").read_text())["type"] == "WorkerCrashed"
+
+
+def test_memory_limit():
+    items = [(HungryMogi(), MOGI_PAGE), ("mogi", MOGI_PAGE)]
+
+    hungry, after = extract_isolated(items, workers=1, memory_limit_mb=4096, retries=0)
+
+    assert (_failure(hungry).stage, _failure(hungry).error_type) == ("extract", "MemoryError")
+    assert after.error is None
+
+
+def test_workers_are_recycled():
+    items = _items() * 2
+
+    records = list(extract_isolated(items, workers=2, max_pages_per_worker=1, max_rss_mb=1))
+
+    assert [r.result for r in records] == [r.result for r in extract_records(items, workers=1)]
+
+
+def test_unordered():
+    items = [(SlowMogi(), MOGI_PAGE)] + _items()
+
+    records = list(extract_isolated(items, workers=2, timeout=0.5, retries=0, ordered=False))
+
+    assert records[-1].error.error_type == "PageTimeout"
+    assert sorted(r.source for r in records) == sorted(str(p) for _, p in items)
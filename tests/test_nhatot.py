@@ -0,0 +1,56 @@
+"""
+File: test_nhatot.py
+Desc: Simple test to make sure the dev doesn't break anything
+"""
+
+import json
+import pathlib
+
+import pytest
+from pydantic import ValidationError
+
+from lovesoup.cooks import Nhatot
+from lovesoup.json_scan import find_json_path
+
+# Define the directory where the test data is located
+TEST_DIR = pathlib.Path(__file__).parent / "test_data" / "nhatot"
+
+
+@pytest.mark.parametrize("fast_json", [True, False])
+def test_nhatot(fast_json):
+    extractor = Nhatot(fast_json=fast_json)
+
+    with open(TEST_DIR / "sample1.json", "r") as h:
+        expected_output = json.load(h)
+
+    extracted_content = extractor.run(str(TEST_DIR / "sample1.html")).model_dump()
+
+    assert (
+        extracted_content == expected_output
+    ), "Extracted content does not match the expected output."
+
+
+def test_nhatot_fast_json_skips_page_state():
+    html = (TEST_DIR / "sample1.html").read_text(encoding="utf-8")
+
+    primary_result = Nhatot().extract(html)
+
+    assert "ad_details" not in primary_result
+    assert primary_result["ad"]["images"]
+
+
+@pytest.mark.parametrize("fast_json", [True, False])
+def test_nhatot_validates_the_ad_in_trusted_mode(fast_json):
+    html = (TEST_DIR / "sample1.html").read_text(encoding="utf-8")
+    html = html.replace('"ward_name":"Phường Bạch Mai"', '"ward_name":42')
+
+    with pytest.raises(ValidationError):
+        Nhatot(trusted=True, fast_json=fast_json).run_html(html)
+
+
+def test_find_json_path():
+    text = '{"a": {"skip": [1, {"b": "}"}], "b": {"c": [1, 2]}}, "d": null}'
+
+    assert find_json_path(text, ("a", "b")) == {"c": [1, 2]}
+    with pytest.raises(KeyError):
+        find_json_path(text, ("a", "missing"))
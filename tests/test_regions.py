@@ -0,0 +1,122 @@
+"""
+File: test_regions.py
+Desc: Make sure region hints give the same results as parsing the whole page, or fall back to it
+"""
+
+import pathlib
+
+import pytest
+
+from lovesoup.cooks import SITE_ALIASES, Mogi, Nhatot
+from lovesoup.instrumentation import Instrumentation
+from lovesoup.regions import RegionHint, is_empty
+
+TEST_DIR = pathlib.Path(__file__).parent / "test_data"
+
+HINTED = [
+    html_file
+    for html_file in sorted(TEST_DIR.glob("*/*.html"))
+    if SITE_ALIASES[html_file.parent.name].REGION_HINT is not None
+]
+
+MOGI_PAGE = (TEST_DIR / "mogi" / "sample1.html").read_text(encoding="utf-8")
+
+
+def _paths(cook):
+    return {path: count for path, count in cook.region_paths.items() if count}
+
+
+@pytest.mark.parametrize("html_file", HINTED, ids=lambda p: f"{p.parent.name}/{p.name}")
+def test_region_matches_full_page(html_file):
+    cook_cls = SITE_ALIASES[html_file.parent.name]
+    html = html_file.read_text(encoding="utf-8")
+    cook = cook_cls(region_hints=True)
+
+    assert cook.run_html(html) == cook_cls().run_html(html)
+    assert cook.run_html(html.encode("utf-8")) == cook_cls().run_html(html)
+    assert _paths(cook) == {"region": 2}
+
+
+def test_hinted_sites():
+    assert {p.parent.name for p in HINTED} == {"mogi", "bds123vn", "batdongsan", "nhatot"}
+
+
+def test_off_by_default():
+    cook = Mogi()
+    cook.run_html(MOGI_PAGE)
+
+    assert _paths(cook) == {}
+
+
+def test_no_marker_falls_back(monkeypatch):
+    monkeypatch.setattr(Mogi, "REGION_HINT", RegionHint(start='<div class="not-there"'))
+    cook = Mogi(region_hints=True)
+
+    assert cook.run_html(MOGI_PAGE) == Mogi().run_html(MOGI_PAGE)
+    assert _paths(cook) == {"no_marker": 1}
+
+
+def test_missing_required_falls_back(monkeypatch):
+    # Ends before the agent box: the phone is not in the region
+    hint = RegionHint(start='<div class="media-item"', end="agent-contact", required=("phone",))
+    monkeypatch.setattr(Mogi, "REGION_HINT", hint)
+    cook = Mogi(region_hints=True)
+
+    assert cook.run_html(MOGI_PAGE) == Mogi().run_html(MOGI_PAGE)
+    assert _paths(cook) == {"missing": 1}
+
+
+def test_keys_outside_the_region():
+    html = (TEST_DIR / "nhatot" / "sample1.html").read_text(encoding="utf-8")
+    # Without the fast JSON path, the page state script has to be selected too
+    cook = Nhatot(region_hints=True, fast_json=False)
+
+    assert cook.run_html(html) == Nhatot(fast_json=False).run_html(html)
+    assert _paths(cook) == {"not_covered": 1}
+
+
+def test_fields_within_the_region(monkeypatch):
+    monkeypatch.setattr(Mogi, "REGION_HINT", RegionHint(start="<h1", keys=("title",)))
+    cook = Mogi(region_hints=True)
+
+    cook.extract(MOGI_PAGE, keys=["title"])
+    cook.extract(MOGI_PAGE)
+
+    assert _paths(cook) == {"region": 1, "not_covered": 1}
+
+
+def test_instrumentation_counts_paths():
+    metrics = Instrumentation()
+    cook = Mogi(region_hints=True, instrumentation=metrics)
+    cook.run_html(MOGI_PAGE)
+
+    assert metrics.to_dict()["mogi"]["region_paths"] == {"region": 1}
+    assert 'lovesoup_region_paths_total{template="mogi",path="region"} 1' in metrics.to_prometheus()
+    merged = Instrumentation().merge(metrics).merge(metrics)
+    assert merged.region_paths[("mogi", "region")] == 2
+
+
+@pytest.mark.parametrize(
+    "page, expected",
+    [
+        ('<p>a</p><div class="x"><b>in</b></div><i class="y">out</i>', '<div class="x"><b>in</b></div>'),
+        ('<div class="x">no end', None),
+        ("<p>no start</p>", None),
+    ],
+)
+def test_slice(page, expected):
+    hint = RegionHint(start='class="x"', end='class="y"')
+
+    assert hint.slice(page) == expected
+    assert hint.slice(page.encode()) == (expected.encode() if expected else None)
+
+
+def test_slice_to_the_end():
+    assert RegionHint(start="<main").slice("<head></head><main>x</main>") == "<main>x</main>"
+
+
+def test_is_empty():
+    assert is_empty(None) and is_empty("") and is_empty([])
+    assert is_empty({"unit_price": None, "listing_price": ""})
+    assert not is_empty({"unit_price": None, "listing_price": "3 tỷ"})
+    assert not is_empty(["a"])
@@ -0,0 +1,98 @@
+"""
+File: test_result_cache.py
+Desc: Make sure cached results match fresh ones and template changes invalidate them
+"""
+
+import pathlib
+import sqlite3
+
+from lovesoup.cooks import Mogi, Muabannet
+from lovesoup.result_cache import ResultCache
+
+TEST_DIR = pathlib.Path(__file__).parent / "test_data" / "muabannet"
+
+
+def test_cache_hits_match_fresh_results(tmp_path):
+    html_file = TEST_DIR / "sample1.html"
+    cache = ResultCache(path=str(tmp_path / "cache.sqlite"))
+    extractor = Muabannet(result_cache=cache)
+
+    fresh = Muabannet().run(str(html_file))
+    first = extractor.run(str(html_file))
+    # Same content, different whitespace
+    second = extractor.run_html(html_file.read_text(encoding="utf-8") + "\n\n")
+
+    assert first == fresh and second == fresh
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    # A new process (new memory tier) still hits the disk tier
+    reopened = ResultCache(path=str(tmp_path / "cache.sqlite"))
+    assert Muabannet(result_cache=reopened).run(str(html_file)) == fresh
+    assert reopened.disk_hits == 1
+
+
+def test_template_change_invalidates(tmp_path):
+    cache = ResultCache(path=str(tmp_path / "cache.sqlite"))
+    key = cache.key("muabannet", "old-hash", "<html></html>")
+    cache.put(key, Muabannet().run(str(TEST_DIR / "sample1.html")))
+    assert cache.get(key) is not None
+
+    cache.key("muabannet", "new-hash", "<html></html>")
+
+    assert cache.get(key) is None
+    assert len(cache) == 0
+
+
+def test_memory_tier_eviction():
+    result = Muabannet().run(str(TEST_DIR / "sample1.html"))
+    size = len(result.model_dump_json().encode("utf-8"))
+    cache = ResultCache(max_bytes=2 * size)
+
+    keys = [cache.key("muabannet", "h", f"<p>{i}</p>") for i in range(3)]
+    for key in keys:
+        cache.put(key, result)
+
+    assert len(cache) == 2
+    assert cache.get(keys[0]) is None
+    assert cache.current_bytes <= cache.max_bytes
+
+
+def test_cooks_with_other_options_do_not_share_results():
+    html_file = str(TEST_DIR.parent / "mogi" / "sample1.html")
+    cache = ResultCache()
+
+    plain = Mogi(result_cache=cache).run(html_file)
+    split = Mogi(result_cache=cache, split_addresses=True).run(html_file)
+
+    assert plain.address.district is None
+    assert split == Mogi(split_addresses=True).run(html_file)
+    assert (cache.hits, cache.misses) == (0, 2)
+    assert Mogi(result_cache=cache, split_addresses=True).run(html_file) == split
+    assert cache.hits == 1
+
+
+def test_whitespace_inside_the_page_counts():
+    cache = ResultCache()
+
+    keys = {
+        cache.key("mogi", "h", html).html_hash
+        for html in ("<p>1\xa0000</p>", "<p>1 000</p>", "<pre>a  b</pre>", "<pre>a b</pre>")
+    }
+
+    assert len(keys) == 4
+    assert cache.key("mogi", "h", "\n<p>1</p>\n") == cache.key("mogi", "h", "<p>1</p>")
+
+
+def test_older_cache_files_are_replaced(tmp_path):
+    path = tmp_path / "cache.sqlite"
+    with sqlite3.connect(path) as db:
+        db.execute(
+            "CREATE TABLE results (template TEXT, template_hash TEXT, html_hash TEXT, payload BLOB)"
+        )
+        db.execute("INSERT INTO results VALUES ('muabannet', 'h', 'x', '{}')")
+    db.close()
+    extractor = Muabannet(result_cache=ResultCache(path=str(path)))
+
+    assert extractor.run(str(TEST_DIR / "sample1.html")) == Muabannet().run(
+        str(TEST_DIR / "sample1.html")
+    )
@@ -0,0 +1,166 @@
+"""
+File: test_server.py
+Desc: Make sure the extraction service answers single and batch requests, over TCP and Unix sockets
+"""
+
+import http.client
+import json
+import pathlib
+import socket
+import threading
+
+import pytest
+
+from lovesoup.cooks import Mogi, Muabannet
+from lovesoup.server import make_server
+
+TEST_DIR = pathlib.Path(__file__).parent / "test_data"
+MOGI = (TEST_DIR / "mogi" / "sample1.html").read_text(encoding="utf-8")
+MUABANNET = (TEST_DIR / "muabannet" / "sample1.html").read_text(encoding="utf-8")
+
+
+@pytest.fixture(params=[0, 2], ids=["inline", "pool"])
+def server(request):
+    server = make_server(port=0, workers=request.param)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    server.service.close()
+
+
+def _request(server, method, path, body=None, headers=None):
+    connection = http.client.HTTPConnection(*server.server_address)
+    if isinstance(body, (dict, list)):
+        body = json.dumps(body).encode("utf-8")
+        headers = {"Content-Type": "application/json"}
+    connection.request(method, path, body=body, headers=headers or {})
+    response = connection.getresponse()
+    data = response.read().decode("utf-8")
+    connection.close()
+    return response.status, data
+
+
+def _expected(cook, html):
+    return json.loads(cook().run_html(html).model_dump_json())
+
+
+def test_single_page(server):
+    status, body = _request(server, "POST", "/extract", {"html": MOGI, "site": "mogi", "id": "a"})
+
+    assert status == 200
+    answer = json.loads(body)
+    assert answer["id"] == "a"
+    assert answer["error"] is None
+    assert answer["result"] == _expected(Mogi, MOGI)
+
+
+def test_raw_html_with_query_hint(server):
+    status, body = _request(
+        server,
+        "POST",
+        "/extract?site=muabannet",
+        MUABANNET.encode("utf-8"),
+        {"Content-Type": "text/html; charset=utf-8"},
+    )
+
+    assert status == 200
+    assert json.loads(body)["result"] == _expected(Muabannet, MUABANNET)
+
+
+def test_batch(server):
+    pages = [
+        {"html": MOGI, "id": "hint"},
+        {"html": MUABANNET, "url": "https://muaban.net/bat-dong-san/123"},
+        {"html": "<p>unknown</p>", "id": "bad"},
+    ] * 3
+
+    status, body = _request(server, "POST", "/extract", {"pages": pages})
+
+    assert status == 200
+    results = json.loads(body)["results"]
+    assert [r["id"] for r in results] == ["hint", "https://muaban.net/bat-dong-san/123", "bad"] * 3
+    assert results[0]["result"] == _expected(Mogi, MOGI)
+    assert results[1]["site"] == "muabannet"
+    assert results[2]["error"]["type"] == "UnknownSiteError"
+
+    status, body = _request(server, "GET", "/metrics?format=json")
+    metrics = json.loads(body)
+    assert metrics["pages"] == 9
+    assert metrics["errors"] == 3
+    assert metrics["pending_pages"] == 0
+    assert metrics["latency_seconds"]["count"] == 1
+
+
+def test_bad_requests(server):
+    assert _request(server, "POST", "/extract", {"html": MOGI, "site": "nowhere"})[0] == 400
+    assert _request(server, "POST", "/extract", {"pages": "nope"})[0] == 400
+    assert _request(server, "POST", "/extract", "{", {"Content-Type": "application/json"})[0] == 400
+    assert _request(server, "GET", "/nowhere")[0] == 404
+    for length in ("-1", "many"):
+        assert _request(server, "POST", "/extract", headers={"Content-Length": length})[0] == 400
+
+
+def test_unexpected_errors(server, monkeypatch):
+    def extract(pages):
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(server.service, "extract", extract)
+    status, body = _request(server, "POST", "/extract", {"html": MOGI})
+
+    assert status == 500
+    assert json.loads(body) == {"error": "RuntimeError: boom"}
+
+
+@pytest.mark.parametrize("server", [2], indirect=True)
+def test_dead_worker(server):
+    for process in list(server.service.executor._processes.values()):
+        process.kill()
+        process.join()
+
+    status, body = _request(server, "POST", "/extract", {"html": MOGI, "site": "mogi"})
+    assert status == 503
+    assert "worker" in json.loads(body)["error"]
+
+    # A new pool serves the next requests
+    status, body = _request(server, "POST", "/extract", {"html": MOGI, "site": "mogi"})
+    assert status == 200
+    assert json.loads(body)["result"] == _expected(Mogi, MOGI)
+
+
+def test_prometheus_metrics(server):
+    _request(server, "POST", "/extract", {"html": MOGI})
+
+    status, body = _request(server, "GET", "/metrics")
+
+    assert status == 200
+    assert "lovesoup_server_pages_total 1" in body
+    assert 'lovesoup_server_request_latency_seconds_bucket{le="+Inf"} 1' in body
+    assert "lovesoup_server_queue_depth 0" in body
+
+
+def test_unix_socket(tmp_path):
+    path = str(tmp_path / "lovesoup.sock")
+    server = make_server(unix_socket=path, workers=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        body = json.dumps({"html": MOGI, "site": "mogi"}).encode("utf-8")
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.connect(path)
+            client.sendall(
+                b"POST /extract HTTP/1.1\r\nHost: lovesoup\r\nContent-Type: application/json\r\n"
+                + f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode()
+                + body
+            )
+            response = b""
+            while chunk := client.recv(65536):
+                response += chunk
+        head, _, payload = response.partition(b"\r\n\r\n")
+        assert head.startswith(b"HTTP/1.1 200")
+        assert json.loads(payload)["result"] == _expected(Mogi, MOGI)
+    finally:
+        server.shutdown()
+        server.server_close()
+        server.service.close()
@@ -0,0 +1,126 @@
+"""
+File: test_shm.py
+Desc: Make sure pages handed to workers through shared memory extract like pickled ones
+"""
+
+import os
+import pathlib
+
+import pytest
+
+from lovesoup import shm
+from lovesoup.batch import extract_records
+from lovesoup.benchmark import bench_handoff
+from lovesoup.cooks import get_cook
+from lovesoup.property_models import PropertyNormalized
+from lovesoup.shm import PageArena, extract_shared
+
+TEST_DIR = pathlib.Path(__file__).parent / "test_data"
+
+SAMPLES = sorted(TEST_DIR.glob("*/*.html"))
+
+
+def _items(site_given=True, as_html=False):
+    return [
+        (
+            html_file.parent.name if site_given else None,
+            html_file.read_text(encoding="utf-8") if as_html else html_file,
+        )
+        for html_file in SAMPLES
+    ]
+
+
+@pytest.mark.parametrize("site_given", [True, False], ids=["site", "detected"])
+@pytest.mark.parametrize("as_html", [False, True], ids=["path", "html"])
+def test_same_records_as_extract_records(site_given, as_html):
+    items = _items(site_given, as_html)
+
+    shared = list(extract_shared(items, workers=2, chunksize=2))
+
+    assert shared == list(extract_records(items, workers=1))
+    assert all(record.error is None for record in shared)
+
+
+@pytest.mark.parametrize("site_given", [True, False], ids=["site", "detected"])
+def test_missing_file(tmp_path, site_given):
+    items = _items(site_given)
+    items.insert(2, (items[2][0], tmp_path / "missing.html"))
+
+    shared = list(extract_shared(items, workers=2, chunksize=2))
+
+    # Errors compare by identity, their text is the same
+    assert [(*record[:3], str(record.error)) for record in shared] == [
+        (*record[:3], str(record.error)) for record in extract_records(items, workers=1)
+    ]
+    assert shared[2].error.error_type == "FileNotFoundError"
+    assert sum(record.error is not None for record in shared) == 1
+
+
+def test_pages_larger_than_a_slot_are_pickled():
+    items = _items()
+    small = min(html_file.stat().st_size for html_file in SAMPLES)
+
+    assert list(extract_shared(items, workers=1, slot_size=small)) == list(
+        extract_records(items, workers=1)
+    )
+
+
+def test_json_results():
+    records = list(extract_shared(_items(), workers=1, decode=False, ordered=False))
+
+    assert sorted(r.source for r in records) == sorted(map(str, SAMPLES))
+    for record in records:
+        assert isinstance(record.result, bytes)
+        expected = get_cook(pathlib.Path(record.source).parent.name)().run(record.source)
+        assert PropertyNormalized.model_validate_json(record.result) == expected
+
+
+def test_arena_is_removed(monkeypatch):
+    arenas = []
+
+    class Recording(PageArena):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            arenas.append(self.path)
+
+    monkeypatch.setattr(shm, "PageArena", Recording)
+    records = extract_shared(_items(), workers=1)
+    next(records)
+    records.close()  # stopped early
+
+    assert arenas and not os.path.exists(arenas[0])
+
+
+def test_arena_slots():
+    with PageArena(2, 16) as arena:
+        first, second = arena.acquire(), arena.acquire()
+        assert arena.write(second, b"<html/>") == 7
+        assert bytes(arena.slot(second)[:7]) == b"<html/>"
+        assert arena.read_file(first, SAMPLES[0]) == -1
+        arena.release(first)
+        assert arena.acquire() == first
+
+
+@pytest.mark.parametrize("html_file", SAMPLES, ids=lambda p: f"{p.parent.name}/{p.name}")
+def test_run_html_accepts_bytes(html_file):
+    cook = get_cook(html_file.parent.name)()
+    html = html_file.read_text(encoding="utf-8")
+
+    assert cook.run_html(html.encode("utf-8")) == cook.run_html(html)
+
+
+def test_bench_handoff():
+    report = bench_handoff("mogi", [TEST_DIR / "mogi" / "sample1.html"], repeat=1, rounds=1)
+
+    assert set(report) == {
+        "parse_us",
+        "parse_bytes_us",
+        "pickle_us",
+        "shared_us",
+        "copy_us",
+        "pickle_pct_of_parse",
+        "shared_pct_of_parse",
+        "copy_pct_of_parse",
+    }
+    assert report["parse_us"] > 0
+    assert 0 < report["copy_us"] < report["shared_us"]
@@ -0,0 +1,44 @@
+"""
+File: test_sinks.py
+Desc: Make sure extracted records stream to JSONL with their source, site and errors
+"""
+
+import json
+import pathlib
+
+from lovesoup.cooks import Mogi
+from lovesoup.sinks import JsonlSink, read_jsonl, write_jsonl
+
+TEST_DIR = pathlib.Path(__file__).parent / "test_data"
+
+
+def test_write_jsonl_gzip(tmp_path):
+    mogi_file = TEST_DIR / "mogi" / "sample1.html"
+    items = [("mogi", mogi_file), ("nhatot", mogi_file), (None, "<p>unknown</p>")]
+    out = tmp_path / "out.jsonl.gz"
+
+    written, failed = write_jsonl(items, out, workers=1, batch_size=2)
+
+    assert (written, failed) == (3, 2)
+    records = {r["site"] or r["source"]: r for r in read_jsonl(out)}
+    ok = records["mogi"]
+    assert ok["source"] == str(mogi_file)
+    assert ok["error"] is None
+    assert ok["result"] == json.loads(Mogi().run(str(mogi_file)).model_dump_json())
+    assert records["nhatot"]["result"] is None
+    assert records["nhatot"]["error"]["type"]
+    assert records["<html string, 14 chars>"]["error"]["type"] == "UnknownSiteError"
+
+
+def test_sink_batches_writes(tmp_path):
+    out = tmp_path / "out.jsonl"
+    result = Mogi().run(str(TEST_DIR / "mogi" / "sample1.html"))
+
+    with JsonlSink(out, batch_size=3, flush_interval=3600) as sink:
+        sink.write(result, source="a", site="mogi")
+        sink.write(result, source="b", site="mogi")
+        assert out.read_text() == ""
+        sink.write(result, source="c", site="mogi")
+        assert len(out.read_text().splitlines()) == 3
+
+    assert [r["source"] for r in read_jsonl(out)] == ["a", "b", "c"]
@@ -0,0 +1,93 @@
+"""
+File: test_startup.py
+Desc: Make sure importing and building one cook stays cheap
+"""
+
+import json
+import pathlib
+import subprocess
+import sys
+
+import pytest
+
+from lovesoup.cooks import SITE_ALIASES
+from lovesoup.general_extractor import (
+    DEFAULT_FORMATTERS,
+    CompiledTemplate,
+    read_yaml_file,
+    stale_precompiled_templates,
+)
+
+TEST_DIR = pathlib.Path(__file__).parent / "test_data"
+
+# Fixed budget for `from lovesoup.cooks import Mogi; Mogi()`, in seconds. It takes
+# about 0.25 s with lazy loading and precompiled plans, 0.45 s without.
+IMPORT_BUDGET = 1.0
+
+# Only needed by the "selectorlib" engine, to compile templates or to log errors
+HEAVY_MODULES = ("selectorlib", "parsel", "cssselect", "yaml", "loguru", "sqlite3")
+
+STARTUP_SCRIPT = """
+import json, sys, time
+started = time.perf_counter()
+from lovesoup.cooks import Mogi
+Mogi()
+elapsed = time.perf_counter() - started
+print(json.dumps({"seconds": elapsed, "modules": sorted(sys.modules)}))
+"""
+
+
+def _startup():
+    output = subprocess.run(
+        [sys.executable, "-c", STARTUP_SCRIPT],
+        cwd=pathlib.Path(__file__).parent.parent,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return json.loads(output)
+
+
+def test_one_cook_loads_nothing_else():
+    modules = _startup()["modules"]
+
+    assert "lovesoup.cooks.mogi" in modules
+    other_cooks = [m for m in modules if m.startswith("lovesoup.cooks.") and not m.endswith(".mogi")]
+    assert not other_cooks
+    assert not [m for m in modules if m.split(".")[0] in HEAVY_MODULES]
+
+
+def test_import_time_budget():
+    best = min(_startup()["seconds"] for _ in range(3))
+
+    assert best < IMPORT_BUDGET
+
+
+def test_precompiled_plans_are_up_to_date():
+    # Run `python -m lovesoup.precompile` after editing a template
+    assert stale_precompiled_templates() == []
+
+
+SITES = ["mogi", "batdongsan", "cenhomes", "bds123vn", "muabannet", "nhatot"]
+
+
+@pytest.mark.parametrize("site", SITES)
+def test_precompiled_plan_matches_template(site):
+    cook = SITE_ALIASES[site]()
+    content = read_yaml_file(f"{cook.template}.yaml")
+    compiled = CompiledTemplate(cook.template, content, DEFAULT_FORMATTERS)
+
+    assert cook.plan.to_dict() == compiled.plan.to_dict()
+    for html_file in sorted((TEST_DIR / site).glob("*.html")):
+        html = html_file.read_text(encoding="utf-8")
+        assert cook.plan.extract(html) == compiled.plan.extract(html)
+
+
+def test_lazy_attributes():
+    from lovesoup import cooks
+
+    assert {"ALL_COOKS", "SITE_ALIASES", "Mogi", "get_cook"} <= set(dir(cooks))
+    assert cooks.get_cook("BatDongSan") is cooks.BatDongSan
+    assert len(cooks.ALL_COOKS) == len(set(cooks.SITE_ALIASES.values())) == 6
+    with pytest.raises(AttributeError):
+        cooks.NotACook
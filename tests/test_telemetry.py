@@ -0,0 +1,156 @@
+"""
+File: test_telemetry.py
+Desc: Make sure selector outcomes are counted and a probe catches a template that stopped matching
+"""
+
+import pathlib
+
+import pytest
+
+from lovesoup.cooks import Mogi
+from lovesoup.instrumentation import Instrumentation, selector_outcomes
+from lovesoup.telemetry import (
+    FAILED,
+    build_baseline,
+    load_baseline,
+    main,
+    probe,
+    sampled,
+    save_baseline,
+)
+
+TEST_DIR = pathlib.Path(__file__).parent / "test_data"
+
+SAMPLES = sorted(TEST_DIR.glob("*/*.html"))
+
+NHATOT_PAGE = (TEST_DIR / "nhatot" / "sample1.html").read_text(encoding="utf-8")
+
+
+@pytest.fixture(scope="module")
+def baseline():
+    return build_baseline(TEST_DIR)
+
+
+def test_selector_outcomes():
+    primary_result = {
+        "title": "Nhà phố",
+        "phone": None,
+        "description": "",
+        "images": ["", None],
+        "pricing": {"unit_price": "", "listing_price": "2 tỷ"},
+        "short_info": [{"title": "Diện tích", "value": None}, {"title": "", "value": None}],
+    }
+
+    assert selector_outcomes(primary_result) == [
+        ("title", "matched"),
+        ("phone", "missing"),
+        ("description", "empty"),
+        ("images", "empty"),
+        ("pricing.unit_price", "empty"),
+        ("pricing.listing_price", "matched"),
+        ("pricing", "matched"),
+        ("short_info.title", "matched"),
+        ("short_info.value", "missing"),
+        ("short_info.title", "empty"),
+        ("short_info.value", "missing"),
+        ("short_info", "matched"),
+    ]
+
+
+def test_instrumentation_counts_outcomes():
+    metrics = Instrumentation()
+    Mogi(instrumentation=metrics).run(str(TEST_DIR / "mogi" / "sample1.html"))
+
+    outcomes = metrics.to_dict()["mogi"]["selector_outcomes"]
+    assert outcomes["title"] == {"matched": 1, "empty": 0, "missing": 0}
+    assert sum(outcomes["features.title"].values()) > 1
+    assert (
+        'lovesoup_selector_outcomes_total{template="mogi",selector="title",outcome="matched"} 1'
+        in metrics.to_prometheus()
+    )
+    merged = Instrumentation().merge(metrics).merge(metrics)
+    assert merged.to_dict()["mogi"]["selector_outcomes"]["title"]["matched"] == 2
+
+
+def test_baseline(baseline, tmp_path):
+    assert set(baseline) == {
+        "batdongsancomvn", "bds123vn", "cenhomes", "mogi", "muabannet", "nhatot"
+    }
+    assert baseline["nhatot"]["pricing.listing_price"] == {
+        "matched": 1.0, "empty": 0.0, "missing": 0.0, "count": 1
+    }
+    save_baseline(baseline, tmp_path / "baseline.json")
+    assert load_baseline(tmp_path / "baseline.json") == baseline
+
+
+def test_fixtures_do_not_drift(baseline):
+    items = [(None, path) for path in SAMPLES]
+
+    report = probe(items, baseline, rate=1, workers=2, min_count=1)
+
+    assert (report.pages, report.failed, report.drifts) == (len(SAMPLES), 0, [])
+    inline = probe(items, baseline, rate=1, workers=1, min_count=1)
+    assert report.metrics.selector_outcomes == inline.metrics.selector_outcomes
+
+
+@pytest.mark.parametrize(
+    "css_class, selector",
+    [
+        # The whole price block, or only the listing price in it
+        ("slhwvq6", "pricing"),
+        ("bwq0cbs", "pricing.listing_price"),
+    ],
+)
+def test_renamed_class_is_caught(baseline, css_class, selector):
+    drifted = NHATOT_PAGE.replace(css_class, "x9k2aa1")
+    items = [("nhatot", drifted, f"page{i}") for i in range(40)]
+
+    report = probe(items, baseline, rate=1, workers=1)
+
+    (drift,) = report.drifts
+    assert (drift.template, drift.selector, drift.outcome) == ("nhatot", selector, "missing")
+    assert (drift.baseline, drift.observed, drift.count) == (1.0, 0.0, 40)
+
+
+def test_unrecognisable_pages_are_caught(baseline):
+    items = [(None, f"<html><body><p>page {i}</p></body></html>") for i in range(100)]
+
+    report = probe(items, baseline, rate=1, workers=1)
+
+    assert (report.pages, report.failed) == (100, 100)
+    (drift,) = report.drifts
+    assert (drift.template, drift.outcome, drift.observed, drift.count) == ("*", FAILED, 0.0, 100)
+    # A few failures are not a drift
+    items = [(None, path) for path in SAMPLES] + items[:1]
+    assert probe(items, baseline, rate=1, workers=1, min_count=1).drifts == []
+
+
+def test_sampling(baseline):
+    labels = [f"https://www.nhatot.com/{i}.htm" for i in range(2000)]
+    assert [sampled(label, 0.1) for label in labels] == [sampled(label, 0.1) for label in labels]
+    assert 150 < sum(sampled(label, 0.1) for label in labels) < 250
+
+    items = [("nhatot", NHATOT_PAGE, label) for label in labels]
+    assert probe(items, baseline, rate=0.1, max_pages=30, workers=1).pages == 30
+    assert probe(items, baseline, rate=0, workers=1).pages == 0
+
+
+def test_cli(tmp_path, capsys):
+    baseline = tmp_path / "baseline.json"
+    assert main(["--build-baseline", str(TEST_DIR), "--baseline", str(baseline)]) == 0
+    assert "6 templates" in capsys.readouterr().out
+
+    args = ["--baseline", str(baseline), "--rate", "1", "--min-count", "1"]
+    assert main([*args, str(TEST_DIR)]) == 0
+    assert f"pages:   {len(SAMPLES)}" in capsys.readouterr().out
+
+    pages = tmp_path / "pages"
+    pages.mkdir()
+    (pages / "ad.html").write_text(NHATOT_PAGE.replace("slhwvq6", "x9k2aa1"), encoding="utf-8")
+    assert main([*args, str(pages)]) == 1
+    assert "drift:   nhatot pricing: matched 0% (baseline 100%) over 1" in capsys.readouterr().out
+
+    for i in range(3):
+        (pages / f"page{i}.html").write_text(f"<p>page {i}</p>", encoding="utf-8")
+    assert main([*args, "--max-failure-rate", "0.5", str(pages)]) == 1
+    assert "drift:   75% of the pages failed" in capsys.readouterr().out
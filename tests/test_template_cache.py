@@ -0,0 +1,45 @@
+"""
+File: test_template_cache.py
+Desc: Make sure templates are compiled once per process and shared between extractors
+"""
+
+from lovesoup.cooks import BatDongSan, Mogi
+from lovesoup.general_extractor import (
+    available_templates,
+    clear_template_cache,
+    get_compiled_template,
+    warm_templates,
+)
+
+
+def test_extractors_share_compiled_template():
+    clear_template_cache()
+    first = Mogi()
+    second = Mogi()
+
+    assert first.compiled_template is second.compiled_template
+    assert first.extractor is second.extractor
+    assert BatDongSan().compiled_template is not first.compiled_template
+
+
+def test_warm_templates_builds_every_bundled_template():
+    clear_template_cache()
+    warmed = warm_templates()
+
+    assert [t.name for t in warmed] == available_templates()
+    assert len(warmed) == 6
+    assert get_compiled_template("nhatot") in warmed
+
+
+def test_template_file_is_read_once(monkeypatch):
+    clear_template_cache()
+    Mogi()
+    reads = []
+    monkeypatch.setattr(
+        "lovesoup.general_extractor.read_yaml_file", lambda name: reads.append(name)
+    )
+
+    Mogi()
+    get_compiled_template("mogi")
+
+    assert reads == []
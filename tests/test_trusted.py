@@ -0,0 +1,65 @@
+"""
+File: test_trusted.py
+Desc: Make sure the trusted fast path and strict precook validation give the same results
+"""
+
+import pathlib
+
+import pytest
+from pydantic import ValidationError
+
+from lovesoup.benchmark import bench_post_process, iter_fixtures
+from lovesoup.cooks import EMPTY_LOCATION, Mogi, get_cook
+from lovesoup.general_extractor import construct_model
+from lovesoup.precook_models.mogi_models import MogiFeature
+from lovesoup.property_models import Address, PropertyNormalized
+
+TEST_DIR = pathlib.Path(__file__).parent / "test_data"
+
+FIXTURES = [(site, page) for site, pages in iter_fixtures().items() for page in pages]
+
+
+@pytest.mark.parametrize("site, page", FIXTURES, ids=[f"{s}-{p.stem}" for s, p in FIXTURES])
+def test_same_results(site, page):
+    html = page.read_text(encoding="utf-8")
+    expected = get_cook(site)().run_html(html)
+
+    trusted = get_cook(site)(trusted=True).run_html(html)
+    strict = get_cook(site)(strict=True).run_html(html)
+
+    assert trusted == expected
+    assert trusted.model_dump_json() == expected.model_dump_json()
+    assert strict == expected
+
+
+def test_trusted_shares_constant_submodels():
+    page = str(TEST_DIR / "mogi" / "sample1.html")
+
+    assert Mogi(trusted=True).run(page).location is EMPTY_LOCATION
+    assert Mogi().run(page).location is not EMPTY_LOCATION
+
+
+def test_construct_model():
+    address = construct_model(Address, full_address="x")
+
+    assert address == Address(full_address="x")
+    assert address.model_fields_set == {"full_address"}
+    nested = construct_model(PropertyNormalized, address=address, images=[])
+    assert nested == PropertyNormalized(address=Address(full_address="x"), images=[])
+
+
+def test_strict_precook():
+    raw = {"title": "Ngày đăng".encode("utf-8"), "value": "22/10/2024"}
+
+    assert Mogi().validate_precook(MogiFeature, raw).title == "Ngày đăng"
+    with pytest.raises(ValidationError):
+        Mogi(strict=True).validate_precook(MogiFeature, raw)
+
+
+def test_bench_post_process():
+    pages = iter_fixtures(sites=["mogi"])["mogi"]
+
+    report = bench_post_process("mogi", pages, repeat=2, rounds=1)
+
+    assert report["default_us"] > 0
+    assert report["trusted_us"] > 0